@@ -13,8 +13,10 @@ class FileTooBigError(ValueError):
 
 
 # temp_files_dir = os.path.join(os.path.split(__file__)[0], "temp_files")
-temp_files_dir = Path(__file__).parent / "temp_files"
-temp_files_dir.mkdir(parents=True, exist_ok=True)
+# Where output files and caches go. It's created when first written to,
+# not on import. Set LIBGOODS_TEMP_DIR to put it outside the package.
+temp_files_dir = Path(os.environ.get("LIBGOODS_TEMP_DIR",
+                                     Path(__file__).parent / "temp_files"))
 
 # currents_dir = os.path.join(os.path.split(__file__)[0], "current_sources")
 
@@ -4,33 +4,29 @@ Core API for accessing model results
 These are the functions that the WebGNOME client will call
 
 Functions return JSON-compatible dicts
+
+For asyncio versions of these, see async_api.py
 """
 
 from pathlib import Path
-from .current_sources import all_currents
-from .dummy_sources import all_dummy_sources
-from . import utilities
 from . import FileTooBigError
+from .cache import SingleFlight, make_key
+from .registry import ModelRegistry
 
 
-# all_models is a dict with
-#   key: name of model
-#   value: Model object
-all_models = {}
-all_models.update(all_currents)
-all_models.update(all_dummy_sources)
-# there will be many more in the future
-
-
+# all_models is a read-only dict-like registry with
+#   key: model identifier (case-insensitive)
+#   value: Model object -- created, and its code imported, on first access
+all_models = ModelRegistry()
 
 
 def list_models():
     """
     Return metadata for all available models
 
-    This is static data
+    This is static data -- none of the sources are loaded
     """
-    return [model.get_metadata() for model in all_models.values()]
+    return all_models.list_metadata()
 
 
 def get_model_info(model_name):
@@ -44,12 +40,12 @@ def get_model_info(model_name):
     # return {'available_times': (start_time, end_time),
     #        }
     try:
-        return all_models["model_name"].get_model_info()
+        return all_models[model_name].get_model_info()
     except KeyError:
         return {"error": f"Model: {model_name} does not exist"}
 
 
-# NOTE: subset information should be cached so that subsequent
+# NOTE: subset information is cached (see libgoods.cache) so that subsequent
 #       call to get_model_data with same params will reuse the
 #       computed grid subsetting info
 
@@ -60,6 +56,7 @@ def get_model_subset_info(
     time_interval,
     environmental_parameters,
     cross_dateline=False,
+    time_stride=1,
 ):
     """
     Return the primary information about a model subset:
@@ -67,19 +64,73 @@ def get_model_subset_info(
     {"grid_type":
      "num_grid_cells":
      "num_timesteps":
-     "estimated_file_size":
+     "num_levels":
+     "estimated_file_size":  -- in bytes
     }
     NOTE: this could be different depending on grid type
 
+    time_interval is (start, end), ISO 8601 strings. Only every
+    time_stride-th time step in it is included.
     """
-    return all_models[model_id].get_model_subset_info(
+    # a source of its own: the shared one may be working on another request
+    source = all_models.new_source(model_id)
+    return source.get_model_subset_info(
         bounds,
         time_interval,
         environmental_parameters,
-        cross_dateline=False,
+        cross_dateline=cross_dateline,
+        time_stride=time_stride,
     )
 
 
+def data_request_key(
+    model_id,
+    bounds,
+    time_interval,
+    environmental_parameters,
+    cross_dateline=False,
+    max_filesize=None,
+    target_dir=None,
+    downscale=False,
+    time_stride=1,
+):
+    """
+    A key identifying a get_model_data request
+
+    Requests that would produce the same file get the same key:
+    the bounds are reduced to their bounding box (rounded), the
+    times are normalized, and the parameters sorted.
+    """
+    # imported here, so importing the api doesn't import numpy
+    from . import utilities
+
+    try:
+        (west, south), (east, north) = utilities.polygon2bbox(bounds)
+        bounds = [round(float(v), 6) for v in (west, south, east, north)]
+    except ValueError:
+        pass  # the request will fail anyway
+    if time_interval is not None:
+        try:
+            time_interval = [utilities.parse_time(t).isoformat() for t in time_interval]
+        except ValueError:
+            pass
+    return make_key(
+        model_id,
+        bounds,
+        time_interval,
+        sorted(environmental_parameters),
+        bool(cross_dateline),
+        max_filesize,
+        None if target_dir is None else str(Path(target_dir).resolve()),
+        bool(downscale),
+        int(time_stride),
+    )
+
+
+# get_model_data calls in progress
+_data_requests = SingleFlight()
+
+
 def get_model_data(
     model_id,
     bounds,  # polygon list of (lon, lat) pairs
@@ -88,12 +139,68 @@ def get_model_data(
     cross_dateline=False,
     max_filesize=None,
     target_dir=None,
+    downscale=False,
+    time_stride=1,
 ):
+    """
+    Get the data for a subset, and write it to a file
 
+    If the file would be bigger than max_filesize, a FileTooBigError
+    is raised before any data is transferred -- unless downscale is True,
+    in which case the time steps are thinned until it fits.
+
+    Only the time steps in time_interval are fetched -- every
+    time_stride-th one, if time_stride is set.
+
+    Identical requests made while one is in progress (see data_request_key)
+    don't start a transfer of their own: they wait for that one, and get
+    the same file. Other requests for the same model run concurrently,
+    each with a source of its own.
+
+    :returns: pathlib.Path of the file written
+    """
+    key = data_request_key(
+        model_id,
+        bounds,
+        time_interval,
+        environmental_parameters,
+        cross_dateline,
+        max_filesize,
+        target_dir,
+        downscale,
+        time_stride,
+    )
+    return _data_requests.do(
+        key,
+        _get_model_data,
+        model_id,
+        bounds,
+        time_interval,
+        environmental_parameters,
+        cross_dateline,
+        max_filesize,
+        target_dir,
+        downscale,
+        time_stride,
+    )
+
+
+def _get_model_data(
+    model_id,
+    bounds,
+    time_interval,
+    environmental_parameters,
+    cross_dateline,
+    max_filesize,
+    target_dir,
+    downscale,
+    time_stride,
+):
     if target_dir is not None:
         target_dir = Path(target_dir)
 
-    source = all_models[model_id]
+    # a source of its own: the shared one may be working on another request
+    source = all_models.new_source(model_id)
 
     filepath = source.get_data(
         bounds,  # polygon list of (lon, lat) pairs
@@ -102,6 +209,8 @@ def get_model_data(
         cross_dateline,
         max_filesize,
         target_dir,
+        downscale=downscale,
+        time_stride=time_stride,
     )
 
     return Path(filepath)
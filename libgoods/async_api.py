@@ -0,0 +1,393 @@
+"""
+asyncio versions of the API functions
+
+These have the same arguments as the functions in api.py (and maps.get_map),
+plus a timeout, in seconds. e.g.:
+
+    filepath = await async_api.get_model_data(model_id, bounds, ...,
+                                              timeout=300)
+
+The blocking netCDF / OPeNDAP I/O is run in worker processes (the netCDF-C
+library is not thread-safe, so threads are not an option). Each call has a
+worker to itself, so when a call is cancelled -- or times out -- its worker
+is killed, which stops the transfer. Idle workers are kept for reuse.
+
+At most max_workers calls (DEFAULT_MAX_WORKERS by default) run at once,
+each with a worker process, and a thread waiting on it. Any number of
+other calls can be waiting their turn: they wait on an asyncio semaphore,
+so they don't tie up a thread or a process. So hundreds of requests can
+be in flight, but only max_workers of them transfer data at the same time
+-- raise it with set_executor(AsyncExecutor(max_workers=...)) if the
+servers and the machine can take more. The timeout of a call includes the
+time it waits for its turn.
+
+The workers share the subset plans through the plan cache file
+(see libgoods.cache), so a get_model_data call reuses the plan of
+a get_model_subset_info call that ran in another worker.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import signal
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from . import api, maps
+
+DEFAULT_MAX_WORKERS = 8
+
+
+def _serve(conn):
+    """
+    Run calls sent over conn, until None is sent -- in a worker process
+    """
+    if hasattr(os, "setpgrp"):
+        # so the fetch processes this starts can be killed with it
+        os.setpgrp()
+    while True:
+        try:
+            call = conn.recv()
+        except EOFError:
+            return
+        if call is None:
+            return
+        func, args, kwargs = call
+        try:
+            result = (True, func(*args, **kwargs))
+        except Exception as err:
+            result = (False, err)
+        try:
+            conn.send(result)
+        except Exception as err:
+            # the result or exception can't be pickled
+            conn.send((False, RuntimeError(f"{func.__name__}: {err!r}")))
+
+
+class _Worker:
+    """
+    A worker process, and the connection to it
+    """
+
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        # not a daemon: the FetchEngine starts processes of its own
+        self.process = context.Process(target=_serve, args=(child_conn,), daemon=False)
+        self.process.start()
+        child_conn.close()
+
+    def call(self, func, args, kwargs):
+        """
+        Run func in the worker, and wait for it -- blocking
+
+        :returns: (success, result or exception)
+        """
+        self.conn.send((func, args, kwargs))
+        return self.conn.recv()
+
+    def kill(self):
+        """
+        Kill the worker, and any processes it started
+
+        A thread waiting on the connection gets an EOFError.
+        """
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (AttributeError, OSError):
+            # no process groups, or the worker hasn't set up its group yet
+            self.process.kill()
+        self.process.join()
+
+    def close(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class AsyncExecutor:
+    """
+    Runs blocking functions in worker processes, for asyncio code
+
+    At most max_workers calls run at once -- the others wait their turn,
+    without using a thread.
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS):
+        self.max_workers = max_workers
+        self._context = multiprocessing.get_context("spawn")
+        # for the blocking calls on the workers: a call waiting on its
+        # worker, and the kill that stops it, need a thread each
+        self._threads = ThreadPoolExecutor(max_workers=2 * max_workers,
+                                           thread_name_prefix="libgoods-async")
+        self._idle = []
+        self._lock = threading.Lock()
+        # semaphores limiting the calls -- one per event loop
+        self._slots = weakref.WeakKeyDictionary()
+        self._closed = False
+
+    def _get_worker(self):
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.process.is_alive():
+                    return worker
+                worker.close()
+        return _Worker(self._context)
+
+    def _put_worker(self, worker):
+        with self._lock:
+            if not self._closed:
+                self._idle.append(worker)
+                return
+        worker.close()
+
+    def _keep_worker(self, get):
+        """
+        Done callback of a worker that was started for a cancelled call
+        """
+        if not get.cancelled() and get.exception() is None:
+            # closing it, if shut down, blocks -- so not in the loop
+            threading.Thread(target=self._put_worker, args=(get.result(),)).start()
+
+    async def run(self, func, *args, timeout=None, **kwargs):
+        """
+        Run func(*args, **kwargs) in a worker process
+
+        func and its arguments must be picklable.
+
+        :param timeout: in seconds -- asyncio.TimeoutError is raised if the
+                        call takes longer, counting the time waiting for
+                        its turn and for a worker. None for no timeout.
+        """
+        if self._closed:
+            raise RuntimeError("executor is shut down")
+        loop = asyncio.get_running_loop()
+        slots = self._slots.get(loop)
+        if slots is None:
+            slots = self._slots[loop] = asyncio.Semaphore(self.max_workers)
+        deadline = None if timeout is None else loop.time() + timeout
+
+        def remaining():
+            return None if deadline is None else max(deadline - loop.time(), 0)
+
+        await asyncio.wait_for(slots.acquire(), remaining())
+        try:
+            get = loop.run_in_executor(self._threads, self._get_worker)
+            try:
+                worker = await asyncio.wait_for(asyncio.shield(get), remaining())
+            except (asyncio.CancelledError, asyncio.TimeoutError):
+                # the worker is still on its way: keep it for another call
+                get.add_done_callback(self._keep_worker)
+                raise
+            call = loop.run_in_executor(self._threads, worker.call, func, args, kwargs)
+            try:
+                success, result = await asyncio.wait_for(call, remaining())
+            except (asyncio.CancelledError, asyncio.TimeoutError):
+                # stop the transfer -- joining the process blocks, so not in the loop
+                await asyncio.shield(loop.run_in_executor(self._threads, worker.kill))
+                raise
+            except (EOFError, OSError) as err:
+                await loop.run_in_executor(self._threads, worker.kill)
+                raise RuntimeError(
+                    f"worker process died running {func.__name__}"
+                ) from err
+            self._put_worker(worker)
+        finally:
+            slots.release()
+
+        if not success:
+            raise result
+        return result
+
+    def shutdown(self):
+        """
+        Stop the idle workers -- no more calls can be run
+        """
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.close()
+        self._threads.shutdown(wait=False)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    The executor used by the functions in this module
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = AsyncExecutor()
+        return _executor
+
+
+def set_executor(executor):
+    """
+    Replace the executor used by the functions in this module,
+    e.g. to change the number of workers. The old one is shut down.
+    """
+    global _executor
+    with _executor_lock:
+        old, _executor = _executor, executor
+    if old is not None:
+        old.shutdown()
+
+
+class _Request:
+    """
+    A call in progress, and the number of callers waiting for it
+    """
+
+    def __init__(self, task):
+        self.task = task
+        self.num_callers = 0
+
+
+# calls in progress -- one dict per event loop, keyed by request key
+_requests = weakref.WeakKeyDictionary()
+
+
+async def run_coalesced(key, func, *args, timeout=None, **kwargs):
+    """
+    Run func(*args, **kwargs) with the executor -- unless a call with
+    the same key is in progress, in which case wait for that one
+
+    The call is stopped only when all the callers waiting for it
+    have been cancelled or have timed out.
+    """
+    loop = asyncio.get_running_loop()
+    requests = _requests.setdefault(loop, {})
+    request = requests.get(key)
+    if request is None:
+        task = loop.create_task(get_executor().run(func, *args, **kwargs))
+        request = requests[key] = _Request(task)
+
+        def done(task):
+            if requests.get(key) is request:
+                del requests[key]
+        task.add_done_callback(done)
+
+    request.num_callers += 1
+    try:
+        return await asyncio.wait_for(asyncio.shield(request.task), timeout)
+    finally:
+        request.num_callers -= 1
+        if request.num_callers == 0 and not request.task.done():
+            # no one wants the result any more
+            if requests.get(key) is request:
+                del requests[key]
+            request.task.cancel()
+
+
+async def list_models(timeout=None):
+    """
+    async version of api.list_models
+
+    This is static data, so no worker is needed.
+    """
+    return api.list_models()
+
+
+async def get_model_info(model_name, timeout=None):
+    """
+    async version of api.get_model_info
+    """
+    return await get_executor().run(api.get_model_info, model_name, timeout=timeout)
+
+
+async def get_model_subset_info(model_id,
+                                bounds,
+                                time_interval,
+                                environmental_parameters,
+                                cross_dateline=False,
+                                time_stride=1,
+                                timeout=None,
+                                ):
+    """
+    async version of api.get_model_subset_info
+    """
+    return await get_executor().run(api.get_model_subset_info,
+                                    model_id,
+                                    bounds,
+                                    time_interval,
+                                    environmental_parameters,
+                                    cross_dateline=cross_dateline,
+                                    time_stride=time_stride,
+                                    timeout=timeout,
+                                    )
+
+
+async def get_model_data(model_id,
+                         bounds,
+                         time_interval,
+                         environmental_parameters,
+                         cross_dateline=False,
+                         max_filesize=None,
+                         target_dir=None,
+                         downscale=False,
+                         time_stride=1,
+                         timeout=None,
+                         ):
+    """
+    async version of api.get_model_data
+
+    Identical requests made while one is in progress share its transfer,
+    and get the same file (see api.data_request_key).
+
+    If the call is cancelled or times out, and no other request is
+    sharing it, the transfer is stopped -- the partly written file may
+    be left behind.
+    """
+    key = api.data_request_key(model_id,
+                               bounds,
+                               time_interval,
+                               environmental_parameters,
+                               cross_dateline,
+                               max_filesize,
+                               target_dir,
+                               downscale,
+                               time_stride,
+                               )
+    return await run_coalesced(key,
+                               api.get_model_data,
+                               model_id,
+                               bounds,
+                               time_interval,
+                               environmental_parameters,
+                               cross_dateline=cross_dateline,
+                               max_filesize=max_filesize,
+                               target_dir=target_dir,
+                               downscale=downscale,
+                               time_stride=time_stride,
+                               timeout=timeout,
+                               )
+
+
+async def get_map(bounds,
+                  resolution="appropriate",
+                  cross_dateline=False,
+                  max_filesize=None,
+                  timeout=None,
+                  ):
+    """
+    async version of maps.get_map
+    """
+    return await get_executor().run(maps.get_map,
+                                    bounds,
+                                    resolution=resolution,
+                                    cross_dateline=cross_dateline,
+                                    max_filesize=max_filesize,
+                                    timeout=timeout,
+                                    )
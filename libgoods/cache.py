@@ -0,0 +1,399 @@
+"""
+Caches for things that are expensive to (re)compute
+
+SubsetPlanCache holds the result of subsetting a model grid for a request:
+the x, y, z, t index ranges and the size estimate. This is what lets the
+"check the size, then download" workflow scan the grid only once, and
+repeated requests for the same area skip the scan entirely.
+
+ResultCache holds the output files, keyed by the request and the model
+cycle, so a repeated request returns the file already written, until the
+model has a new cycle.
+
+SingleFlight coalesces identical calls that are in progress at the same
+time: the first one does the work, and the others wait for its result.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from . import temp_files_dir
+
+
+def make_key(*parts):
+    """
+    Make a cache key (hex digest) out of JSON-compatible parts
+
+    numpy scalars and the like are converted with str()
+    """
+    text = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class SubsetPlanCache:
+    """
+    A Least Recently Used cache of subset plans, persisted to a JSON file
+
+    Plans are plain dicts of JSON-compatible values, keyed by the output
+    of `make_key`.
+    """
+
+    def __init__(self, filepath, max_entries=512):
+        self.filepath = Path(filepath)
+        self.max_entries = max_entries
+        self._plans = None  # loaded from disk on first use
+        self._mtime = None  # of the file, when last loaded
+        self._lock = threading.RLock()
+
+    def _load(self):
+        """
+        Load the plans from disk, if the file has changed since last time
+
+        Plans written by other processes are merged in, so processes
+        sharing a cache file (e.g. the async_api workers) share plans.
+        """
+        try:
+            mtime = os.stat(self.filepath).st_mtime_ns
+        except OSError:
+            mtime = None
+        if self._plans is not None and mtime == self._mtime:
+            return
+        if self._plans is None:
+            self._plans = OrderedDict()
+        self._mtime = mtime
+        try:
+            with open(self.filepath, encoding="utf-8") as infile:
+                plans = json.load(infile)
+        except (OSError, ValueError):
+            # no cache yet, or a corrupt one -- either way, start over
+            return
+        for key, plan in plans.items():
+            self._plans.setdefault(key, plan)
+
+    def save(self):
+        """
+        Write the cache to disk
+
+        The file is written to a temp file and moved into place,
+        so readers never see a partial file.
+        """
+        with self._lock:
+            self._load()
+            self.filepath.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.filepath.with_name(
+                f"{self.filepath.name}.{os.getpid()}.tmp"
+            )
+            with open(tmp_path, "w", encoding="utf-8") as outfile:
+                json.dump(self._plans, outfile)
+            os.replace(tmp_path, self.filepath)
+            self._mtime = os.stat(self.filepath).st_mtime_ns
+
+    def get(self, key):
+        """
+        Return the plan for key, or None if it's not cached
+        """
+        with self._lock:
+            self._load()
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+            return plan
+
+    def put(self, key, plan):
+        """
+        Add a plan to the cache, evicting the least recently used
+        plans if the cache is full
+        """
+        with self._lock:
+            self._load()
+            self._plans[key] = plan
+            self._plans.move_to_end(key)
+            while len(self._plans) > self.max_entries:
+                self._plans.popitem(last=False)
+            self.save()
+
+    def clear(self):
+        """
+        Remove all plans, both in memory and on disk
+        """
+        with self._lock:
+            self._plans = OrderedDict()
+            self._mtime = None
+            try:
+                self.filepath.unlink()
+            except FileNotFoundError:
+                pass
+
+    def __len__(self):
+        with self._lock:
+            self._load()
+            return len(self._plans)
+
+    def __contains__(self, key):
+        with self._lock:
+            self._load()
+            return key in self._plans
+
+
+def file_checksum(filepath, block_size=2**20):
+    """
+    sha256 hex digest of a file's contents
+    """
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as infile:
+        for block in iter(lambda: infile.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    A Least Recently Used cache of output files, limited in total size
+
+    Files are content-addressed: each is stored in the directory as
+    <key><suffix>, next to a <key>.json file with its size, modification
+    time, checksum and time of last use. So the cache can be shared by
+    processes, and survives restarts. Files that fail the integrity check
+    are removed: `get` checks the size and modification time, `verify`
+    the checksum as well.
+
+    A file returned by `get` can be removed by another process evicting it:
+    copy or link it elsewhere to keep it (see `nc.get_data`).
+    """
+
+    def __init__(self, directory, max_bytes=2 * 2**30, suffix=".nc",
+                 stale_temp_age=3600):
+        """
+        :param directory: where the files are kept
+        :param max_bytes: quota -- the least recently used files are removed
+                          when the total size is larger than this
+        :param suffix: of the file names
+        :param stale_temp_age: temp files not written to for this long, in
+                               seconds, are left from a killed process, and
+                               removed by evict and clear
+        """
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.stale_temp_age = stale_temp_age
+        self._lock = threading.RLock()
+
+    def path(self, key):
+        """
+        Where the file for key is (or would be) kept
+        """
+        return self.directory / f"{key}{self.suffix}"
+
+    def temp_path(self, key):
+        """
+        A path to write a file for key to, before it's put in the cache
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        return self.directory / f"{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+    def _info_path(self, key):
+        return self.directory / f"{key}.json"
+
+    def _read_info(self, key):
+        try:
+            with open(self._info_path(key), encoding="utf-8") as infile:
+                return json.load(infile)
+        except (OSError, ValueError):
+            return None
+
+    def _write_info(self, key, info):
+        info_path = self._info_path(key)
+        tmp_path = info_path.with_name(f"{info_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as outfile:
+            json.dump(info, outfile)
+        os.replace(tmp_path, info_path)
+
+    def _check(self, key, info, checksum=False):
+        """
+        Whether the file for key is the one described by info
+        """
+        try:
+            stat = self.path(key).stat()
+        except OSError:
+            return False
+        if stat.st_size != info["size"] or stat.st_mtime_ns != info.get("mtime"):
+            return False
+        return not checksum or file_checksum(self.path(key)) == info["checksum"]
+
+    def get(self, key):
+        """
+        Return the path of the file for key, or None if it's not cached
+
+        The size and modification time of the file are checked -- it isn't
+        read, see `verify` for that.
+        """
+        with self._lock:
+            info = self._read_info(key)
+            if info is None:
+                return None
+            if not self._check(key, info):
+                self.remove(key)
+                return None
+            info["last_used"] = time.time()
+            self._write_info(key, info)
+            return self.path(key)
+
+    def verify(self, key):
+        """
+        Check the checksum of the file for key -- it is removed if it fails
+
+        :returns: True if the file is cached and intact
+        """
+        with self._lock:
+            info = self._read_info(key)
+            if info is None:
+                return False
+            if not self._check(key, info, checksum=True):
+                self.remove(key)
+                return False
+            return True
+
+    def put(self, key, filepath):
+        """
+        Move a file into the cache, evicting the least recently used
+        files if over the quota
+
+        :returns: the path of the file in the cache
+        """
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self.path(key)
+            os.replace(filepath, path)
+            stat = path.stat()
+            self._write_info(key, {"size": stat.st_size,
+                                   "mtime": stat.st_mtime_ns,
+                                   "checksum": file_checksum(path),
+                                   "last_used": time.time(),
+                                   })
+            self.evict(keep=key)
+            return path
+
+    def remove(self, key):
+        with self._lock:
+            for path in (self._info_path(key), self.path(key)):
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+
+    def entries(self):
+        """
+        The cached entries: a list of (key, info dict)
+        """
+        with self._lock:
+            entries = []
+            for info_path in self.directory.glob("*.json"):
+                info = self._read_info(info_path.stem)
+                if info is not None:
+                    entries.append((info_path.stem, info))
+            return entries
+
+    def total_size(self):
+        return sum(info["size"] for _, info in self.entries())
+
+    def remove_stale_temp_files(self):
+        """
+        Remove the temp files that haven't been written to for
+        stale_temp_age seconds -- left by processes that were killed
+        """
+        cutoff = time.time() - self.stale_temp_age
+        for tmp_path in self.directory.glob("*.tmp"):
+            try:
+                if tmp_path.stat().st_mtime < cutoff:
+                    tmp_path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used files until the total size is
+        within the quota, and the stale temp files
+
+        :param keep: key of a file not to remove, even if it's over the
+                     quota by itself
+        """
+        with self._lock:
+            self.remove_stale_temp_files()
+            entries = sorted(self.entries(), key=lambda entry: entry[1]["last_used"])
+            total = sum(info["size"] for _, info in entries)
+            for key, info in entries:
+                if total <= self.max_bytes:
+                    break
+                if key == keep:
+                    continue
+                self.remove(key)
+                total -= info["size"]
+
+    def clear(self):
+        with self._lock:
+            for key, _ in self.entries():
+                self.remove(key)
+            self.remove_stale_temp_files()
+
+    def __contains__(self, key):
+        return self._info_path(key).is_file()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key (for threads)
+
+    While a call for a key is running, other calls with that key wait
+    for it and get the same result (or exception), rather than
+    running the function again. Nothing is kept once the call is done.
+    """
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Call func(*args, **kwargs), unless a call with key is already
+        running, in which case wait for that one.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = self._Call()
+
+        if is_leader:
+            try:
+                call.result = func(*args, **kwargs)
+            except BaseException as err:
+                call.error = err
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        else:
+            call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def __len__(self):
+        with self._lock:
+            return len(self._calls)
+
+
+subset_plans = SubsetPlanCache(temp_files_dir / "subset_plans.json")
+results = ResultCache(temp_files_dir / "results")
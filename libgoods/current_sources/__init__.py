@@ -2,9 +2,18 @@
 Currents package
 
 classes for all the sources of currents
+
+The sources are listed in the manifest (see libgoods/manifest.py),
+and imported only when needed.
 """
 
-from .hycom import HYCOM
-from .tbofs import TBOFS
+import importlib
+
+_sources = {"HYCOM": ".hycom", "TBOFS": ".tbofs"}
+
 
-all_currents = {source.metadata.identifier: source() for source in {HYCOM, TBOFS}}
+def __getattr__(name):
+    # so `from libgoods.current_sources import HYCOM` still works
+    if name in _sources:
+        return getattr(importlib.import_module(_sources[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
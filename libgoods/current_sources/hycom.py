@@ -2,22 +2,13 @@
 HYCOM global ocean model
 """
 import os
-from ..model import Model, Metadata
+from ..model import Model
+from .. import manifest
 from .. import temp_files_dir
 from ..file_processing import rect
 from ..utilities import polygon2bbox
 
 
-# NOTE: this may contain HTML
-INFO_TEXT = """The global HYbrid Coordinate Ocean Model (HYCOM)
-nowcast/forecast system is a demonstration product of the
-<a href = "http://www.hycom.org" target="_blank">HYCOM Consortium</a>
-run in real time at the Naval Oceanographic Office.
-For more details about the global model visit the
-<a href="http://www7320.nrlssc.navy.mil/GLBhycom1-12/prologue.html" target="_blank"> global HYCOM website</a>.",
-"""
-
-
 # using the "old libgoods" classes as a mixin to get
 # the existing functionality
 class HYCOM(Model, rect):
@@ -25,22 +16,7 @@ class HYCOM(Model, rect):
     global HYCOM
     """
 
-    metadata = Metadata(
-        identifier="HYCOM",
-        name="Global Ocean Forecasting System (GOFS) 3.1",
-        bounding_box=((-180, -78.6), (180, 90)),
-        bounding_poly=((-180.0, -78.6), (-180.0, 90.0), (180.0, 90.0), (180.0, -78.6)),
-        info_text=INFO_TEXT,
-        product_type='forecast',
-        forecast_start="6 days in the past",
-        forecast_end="7 days in the future",
-        environmental_parameters={
-            "surface currents",
-            "sea surface temperature",
-            "ice",
-            "3D currents",
-        },
-    )
+    metadata = manifest.HYCOM
 
     # needed for internal processing
     url = "https://tds.hycom.org/thredds/dodsC/GLBy0.08/expt_93.0/FMRC/GLBy0.08_930_FMRC_best.ncd"
@@ -69,6 +45,23 @@ class HYCOM(Model, rect):
         """
         return ("2022-01-17T22:00Z", "2022-01-20T22:00Z")
 
+    def get_model_subset_info(
+        self,
+        bounds,
+        time_interval,
+        environmental_parameters,
+        cross_dateline=False,
+        time_stride=1,
+    ):
+        """
+        opens the opendap connection and computes (or looks up)
+        the subset plan -- a following get_data call will reuse it
+        """
+        self.open_nc(FileName=self.url)
+
+        return rect.get_model_subset_info(self, bounds, time_interval, cross_dateline,
+                                          time_stride)
+
     def get_data(
         self,
         bounds,
@@ -77,6 +70,8 @@ class HYCOM(Model, rect):
         cross_dateline=False,
         max_filesize=None,
         target_dir=None,
+        downscale=False,
+        time_stride=1,
     ):
         """
         wrapping this so we can open the opendap connection
@@ -91,10 +86,19 @@ class HYCOM(Model, rect):
             cross_dateline,
             max_filesize,
             target_dir,
+            downscale,
+            time_stride,
         )
 
         self.open_nc(FileName=self.url)
 
-        filepath = rect.get_data(self, bounds, cross_dateline, max_filesize, target_dir)
+        filepath = rect.get_data(self,
+                                 bounds,
+                                 cross_dateline,
+                                 max_filesize,
+                                 target_dir,
+                                 time_interval=time_interval,
+                                 downscale=downscale,
+                                 time_stride=time_stride)
 
         return filepath
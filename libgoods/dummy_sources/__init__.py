@@ -7,7 +7,8 @@ only one here now, but it would be good to have others
 import shutil
 from pathlib import Path
 
-from ..model import Model, Metadata
+from ..model import Model
+from .. import manifest
 from .. import temp_files_dir
 
 class DummyCurrentsCAROMS(Model):
@@ -16,26 +17,7 @@ class DummyCurrentsCAROMS(Model):
     from the CAROMS model
     """
 
-    metadata = Metadata(
-        identifier="DUMMY_CUR",
-        name="Example currents for testing",
-        bounding_box=((-119.0, 33.0), (-117.5, 34.0)),
-        bounding_poly=(
-            (-119.0, 33.0),
-            (-119.0, 34.0),
-            (-118.0, 34.0),
-            (-117.5, 33.0),
-        ),
-        info_text=(
-            "Dummy model just for testing, etc.\n"
-            "Provides sample output from the CA ROMS model"
-        ),
-        product_type="hindcast",
-        hindcast_start="2021-01-01T19",
-        hindcast_end="2022-01-02T19",
-
-        environmental_parameters={"surface currents"},
-    )
+    metadata = manifest.DUMMY_CUR
 
     def get_available_times(self, cast_type):
         """
@@ -58,6 +40,8 @@ class DummyCurrentsCAROMS(Model):
         cross_dateline=False,
         max_filesize=None,
         target_dir=None,
+        downscale=False,
+        time_stride=1,
     ):
         super().get_data(
             bounds,  # polygon list of (lon, lat) pairs
@@ -66,20 +50,16 @@ class DummyCurrentsCAROMS(Model):
             cross_dateline,
             max_filesize,
             target_dir,
+            downscale,
+            time_stride,
         )
 
         dummy_file = Path(__file__).parent / "CAROMS_Example.nc"
 
         if target_dir is None:
             target_dir = temp_files_dir
+            target_dir.mkdir(parents=True, exist_ok=True)
         target_file = target_dir / "dummy_current.nc"
         shutil.copy(dummy_file, target_file)
 
         return target_file
-
-
-# set up sources dict.
-
-all_dummy_sources = {
-    source.metadata.identifier: source() for source in {DummyCurrentsCAROMS}
-}
@@ -1,10 +1,117 @@
 #!/usr/bin/env python
 from __future__ import print_function
+import threading
+from collections import OrderedDict
+
 import numpy as np
-from netCDF4 import Dataset, MFDataset, num2date
-from libgoods import temp_files_dir
-from ..utilities import polygon2bbox, flatten_bbox
+from netCDF4 import Dataset, MFDataset, date2num, num2date
+from libgoods import FileTooBigError, temp_files_dir
+from ..cache import make_key, results, subset_plans
+from .fetch import FetchEngine
+from ..utilities import polygon2bbox, flatten_bbox, parse_time
 import os
+import shutil
+
+# bump this when the contents of a subset plan change,
+# so plans cached by an older version aren't used.
+SUBSET_PLAN_VERSION = 4
+
+# cache of time axes: key is (filename, varname, length, first and last values)
+_time_axes = OrderedDict()
+_time_axes_lock = threading.Lock()
+MAX_CACHED_TIME_AXES = 16
+
+
+def time_ends(tvar):
+    """
+    The first and last values of a time variable -- in one small read
+    """
+    tlen = tvar.shape[0]
+    if tlen == 0:
+        return []
+    return tvar[0:tlen:max(tlen - 1, 1)].tolist()
+
+
+def _pad4(nbytes):
+    return (nbytes + 3) // 4 * 4
+
+
+def _name_size(name):
+    # length, then the name padded to 4 bytes
+    return 4 + _pad4(len(name.encode("utf-8")))
+
+
+def _attr_value_size(value):
+    """
+    size in bytes of an attribute value in a netcdf3 file (unpadded)
+    """
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    value = np.asarray(value)
+    if value.dtype.kind in "SU":
+        return len(str(value.item()).encode("utf-8"))
+    itemsize = value.dtype.itemsize
+    if value.dtype.kind in "iu" and itemsize == 8:
+        # no 64 bit ints in netcdf3 -- netCDF4 writes them as 32 bit
+        itemsize = 4
+    return itemsize * value.size
+
+
+def _attrs_size(attrs):
+    size = 8  # tag and count (or ABSENT)
+    for name, value in attrs.items():
+        size += _name_size(name) + 8 + _pad4(_attr_value_size(value))
+    return size
+
+
+def copied_attrs(var_in, skip=()):
+    """
+    The attributes write_nc copies from a variable, as a dict
+    """
+    return {attr: var_in.getncattr(attr)
+            for attr in var_in.ncattrs() if attr not in skip}
+
+
+def netcdf3_sizes(dimensions, variables, global_attrs=None):
+    """
+    Compute the size of a NETCDF3_CLASSIC file from its structure
+
+    :param dimensions: dict of dimension name: length -- None for the
+                       unlimited (record) dimension
+    :param variables: sequence of (name, dimension names, dtype, attributes dict)
+    :param global_attrs: dict of the global attributes
+
+    :returns: (fixed_size, record_size): the file size is
+              fixed_size + number_of_records * record_size
+    """
+    # magic number, number of records, dimensions, global attributes,
+    # and the tag and count of the variables
+    size = 8
+    size += 8 + sum(_name_size(name) + 4 for name in dimensions)
+    size += _attrs_size(global_attrs or {})
+    size += 8
+
+    record_sizes = []
+    for name, dims, dtype, attrs in variables:
+        # name, dimension ids, attributes, type, vsize and begin
+        size += _name_size(name) + 4 + 4 * len(dims) + _attrs_size(attrs) + 12
+
+        nbytes = np.dtype(dtype).itemsize
+        is_record = len(dims) > 0 and dimensions[dims[0]] is None
+        for dim in dims[1:] if is_record else dims:
+            nbytes *= dimensions[dim]
+        if is_record:
+            record_sizes.append(nbytes)
+        else:
+            size += _pad4(nbytes)
+
+    # records are padded, except when there's only one record variable
+    if len(record_sizes) == 1:
+        record_size = record_sizes[0]
+    else:
+        record_size = sum(_pad4(nbytes) for nbytes in record_sizes)
+
+    return size, record_size
 
 
 class nc:
@@ -13,6 +120,14 @@ class nc:
     # Individual model var_maps will map to these names
     data_vars = ["u", "v", "ice_u", "ice_v", "ice_thickness", "ice_fraction"]
 
+    # name of the grid type reported in the subset info
+    grid_type = ""
+
+    # settings for fetching the data -- see fetch.py
+    fetch_workers = 4  # number of concurrent connections
+    fetch_per_host = 4  # cap on requests in flight to one host
+    fetch_chunk_bytes = 16 * 2**20  # largest single request
+
     def open_nc(self, FileName=None, GridFileName=None):
         """
         Load from OpenDAP URL or local netCDF file
@@ -32,37 +147,319 @@ class nc:
         else:
             self.GridDataset = None
 
-    def get_data(self, bounds, cross_dateline, max_filesize, target_dir=None):
+    def grid_fingerprint(self, var_map):
+        """
+        A hash that identifies the grid and time axis of the open dataset(s)
 
+        Only the header and the two ends of the time axis are read, so this
+        is cheap compared to reading the grid coordinates.
         """
-        NOTE: This "does it all" -- i.e. it assumes you are already happy with the subset selection
-        box -- often we want to check the size of a subset before we do the download
+        parts = []
+        for ds, fname in ((self.Dataset, self.FileName),
+                          (self.GridDataset, getattr(self, "GridFileName", None))):
+            if ds is None:
+                continue
+            dims = {name: len(dim) for name, dim in ds.dimensions.items()}
+            parts.append((fname, dims))
+
+        parts.append(time_ends(self.Dataset.variables[var_map["time"]]))
+
+        return make_key(*parts)
+
+    def get_time(self, varname):
+        """
+        Get the values of the time axis
+
+        The axis is cached per file, and the cache is checked against the
+        length and the ends of the axis, so a file with new time steps
+        (e.g. a forecast aggregation) is read again, but otherwise only
+        those are read.
+        """
+        tvar = self.Dataset.variables[varname]
+        key = (str(self.FileName), varname, tvar.shape[0], tuple(time_ends(tvar)))
+        with _time_axes_lock:
+            time = _time_axes.get(key)
+            if time is not None:
+                _time_axes.move_to_end(key)
+                return time
+
+        time = tvar[:]
+
+        with _time_axes_lock:
+            _time_axes[key] = time
+            while len(_time_axes) > MAX_CACHED_TIME_AXES:
+                _time_axes.popitem(last=False)
+        return time
+
+    def time_indexes(self, time_interval=None, time_stride=1):
+        """
+        Find the time steps in a time interval, by bisection
+
+        get_dimensions must have been called first. The time axis is
+        assumed to be increasing.
+
+        :param time_interval: (start, end) -- ISO 8601 strings or datetimes.
+                              Both ends are included. None for all the time steps.
+        :param time_stride: only take every time_stride-th time step
+
+        :returns: [start, stop, stride] indexes
+        """
+        if int(time_stride) != time_stride or time_stride < 1:
+            raise ValueError(f"time_stride must be a positive integer. Got {time_stride}")
+        time = np.ma.getdata(self.time)
+
+        if time_interval is None:
+            start, stop = 0, len(time)
+        else:
+            start_time, end_time = (parse_time(t) for t in time_interval)
+            if end_time < start_time:
+                raise ValueError(f"time interval ends before it starts: {time_interval}")
+            calendar = getattr(self.Dataset.variables[self.time_varname],
+                               "calendar", "standard")
+            start_num, end_num = date2num([start_time, end_time], self.time_units, calendar)
+            start = int(np.searchsorted(time, start_num, side="left"))
+            stop = int(np.searchsorted(time, end_num, side="right"))
+
+        if start >= stop:
+            available = ((num2date(time[0], self.time_units), num2date(time[-1], self.time_units))
+                         if len(time) else ())
+            raise ValueError(f"No time steps in {time_interval}. "
+                             f"Available times: {available}")
+
+        return [start, stop, int(time_stride)]
+
+    def get_subset_plan(self, bounds, time_interval=None, cross_dateline=False,
+                        time_stride=1):
+        """
+        Compute (or look up) the subset of the grid for a request
+
+        The plan is cached by model, grid fingerprint, bounding box and
+        time interval, so a later call with the same request doesn't
+        need to read the grid again.
+
+        Sets self.x, self.y and the time attributes needed by write_nc
 
         :param: bounds Sequence of (lon,lat) pairs e.g., [(lon,lat),(lon,lat)...]
+
+        :param: time_interval (start, end) -- see time_indexes
+
+        :param: time_stride -- only take every time_stride-th time step
+
+        :returns: the plan -- a dict of JSON-compatible values:
+
+           {"key":              -- identifies the request and the model cycle
+            "grid_type":
+            "x": [start, stop, stride],
+            "y": [start, stop, stride],
+            "t": [start, stop, stride],
+            "num_grid_cells":
+            "num_timesteps":
+            "num_levels":
+            "fixed_size":       -- size of the output file with no time steps
+            "record_size":      -- size of each time step in the output file
+            "estimated_file_size":
+            }
         """
         try:
             bounding_box = flatten_bbox(polygon2bbox(bounds))
         except ValueError:
             raise NotImplementedError("Only rectangular bounds are supported")
 
-        # bounds = [south_lat,west_lon,north_lat,east_lon]
-        url = self.url
         var_map = self.var_map
+        if time_interval is not None:
+            # normalized, so equivalent times (e.g. a datetime and its
+            # ISO 8601 string) make the same key
+            time_interval = [parse_time(t).isoformat() for t in time_interval]
+
+        key = make_key(
+            SUBSET_PLAN_VERSION,
+            self.metadata.identifier,
+            self.grid_fingerprint(var_map),
+            [round(float(v), 6) for v in bounding_box],
+            time_interval,
+            bool(cross_dateline),
+            int(time_stride),
+        )
 
+        plan = subset_plans.get(key)
+        if plan is not None:
+            self.get_dimensions(var_map, get_xy=False)
+            self.x = list(plan["x"])
+            self.y = list(plan["y"])
+            return plan
+
+        # bounds = [south_lat,west_lon,north_lat,east_lon]
         self.get_dimensions(var_map)
+        t_index = self.time_indexes(time_interval, time_stride)
         self.subset(bounding_box)
 
-        # until I add time selection -- return last 10 time steps
         tlen = len(self.time)
 
-        fn = self.default_filename
+        plan = {
+            "key": key,
+            "grid_type": self.grid_type,
+            "x": [int(i) for i in self.x],
+            "y": [int(i) for i in self.y],
+            "t": [int(i) for i in t_index],
+            "num_grid_cells": len(range(*self.x)) * len(range(*self.y)),
+            "num_timesteps": len(range(*slice(*t_index).indices(tlen))),
+            # get_data writes the surface only
+            "num_levels": 1,
+        }
+        plan["fixed_size"], plan["record_size"] = netcdf3_sizes(*self.output_structure(plan))
+        plan["estimated_file_size"] = self.file_size(plan, plan["num_timesteps"])
+        subset_plans.put(key, plan)
+
+        return plan
+
+    def output_structure(self, plan):
+        """
+        The structure of the file write_nc writes for a plan
+
+        Only the header of the dataset is used -- no data is read.
+        This is a generic (time, y, x) structure: subclasses that
+        write something else override it.
+
+        :returns: (dimensions, variables) as needed by netcdf3_sizes
+        """
+        tvar = self.Dataset.variables[self.var_map["time"]]
+        tdim = tvar.dimensions[0]
+        dimensions = {tdim: None,
+                      "y": plan["y"][1] - plan["y"][0],
+                      "x": plan["x"][1] - plan["x"][0],
+                      }
+        variables = [(tvar.name, tvar.dimensions, "f4", {"units": tvar.units})]
+        for var in self.data_vars:
+            if var in self.var_map:
+                var_in = self.Dataset.variables[self.var_map[var]]
+                variables.append((var_in.name, (tdim, "y", "x"), var_in.dtype,
+                                  copied_attrs(var_in, skip=("_FillValue",))))
+        return dimensions, variables
+
+    @staticmethod
+    def file_size(plan, num_timesteps):
+        """
+        size of the output file for a plan with num_timesteps
+        """
+        return plan["fixed_size"] + num_timesteps * plan["record_size"]
+
+    def downscale(self, plan, max_filesize):
+        """
+        Thin the time steps of a plan so the output fits in max_filesize
+
+        :returns: a new plan, with a larger time stride
+
+        :raises FileTooBigError: if even a single time step is too big
+        """
+        steps = range(*slice(*plan["t"]).indices(len(self.time)))
+        for factor in range(1, len(steps) + 1):
+            num_timesteps = len(steps[::factor])
+            if self.file_size(plan, num_timesteps) <= max_filesize:
+                break
+        else:
+            raise FileTooBigError(
+                f"A single time step of this subset makes a file of "
+                f"{self.file_size(plan, 1)} bytes. Max size = {max_filesize}"
+            )
+
+        plan = dict(plan)
+        plan["t"] = [steps.start, steps.stop, steps.step * factor]
+        plan["num_timesteps"] = num_timesteps
+        plan["estimated_file_size"] = self.file_size(plan, num_timesteps)
+        return plan
+
+    def get_model_subset_info(self, bounds, time_interval=None, cross_dateline=False,
+                              time_stride=1):
+        """
+        Return the primary information about a subset -- see
+        Model.get_model_subset_info
+        """
+        plan = self.get_subset_plan(bounds, time_interval, cross_dateline, time_stride)
+        return {key: plan[key] for key in ("grid_type",
+                                           "num_grid_cells",
+                                           "num_timesteps",
+                                           "num_levels",
+                                           "estimated_file_size")}
+
+    def get_data(self, bounds, cross_dateline, max_filesize, target_dir=None,
+                 time_interval=None, downscale=False, time_stride=1):
+
+        """
+        NOTE: This "does it all" -- i.e. it assumes you are already happy with the subset selection
+        box -- often we want to check the size of a subset before we do the download.
+        That's what get_model_subset_info is for: the subset plan it computes
+        is cached, so it isn't recomputed here.
+
+        The file is kept in the result cache (see libgoods.cache): if the
+        same request was made before, and the model hasn't had a new
+        cycle since, that file is used. It is linked (or copied) to
+        target_dir -- temp_files_dir if None -- so it is still there if
+        the cache evicts it.
+
+        :param: bounds Sequence of (lon,lat) pairs e.g., [(lon,lat),(lon,lat)...]
+
+        :param: time_interval (start, end) -- only these time steps are fetched
+
+        :param: time_stride -- only fetch every time_stride-th time step
+
+        :param: max_filesize -- if the file would be bigger than this, a
+                FileTooBigError is raised before any data is transferred.
+                Or, if downscale is True, the time steps are thinned to fit.
+        """
+        var_map = self.var_map
+
+        plan = self.get_subset_plan(bounds, time_interval, cross_dateline, time_stride)
+
+        if max_filesize is not None and plan["estimated_file_size"] > max_filesize:
+            if not downscale:
+                raise FileTooBigError(
+                    f"File would be {plan['estimated_file_size']} bytes. "
+                    f"Max size = {max_filesize}"
+                )
+            plan = self.downscale(plan, max_filesize)
+
+        # the same request for the same model cycle makes the same file
+        result_key = make_key(plan["key"], plan["t"], type(self).__name__, var_map)
+        filepath = results.get(result_key)
+        if filepath is None:
+            tmp_path = results.temp_path(result_key)
+            try:
+                # stream the data in concurrent chunks, so a long time range
+                # doesn't need lots of memory or one huge request
+                self.write_nc(var_map, tmp_path, t_index=plan["t"], stream=True)
+                filepath = results.put(result_key, tmp_path)
+            finally:
+                if tmp_path.exists():
+                    tmp_path.unlink()
+
         if target_dir is None:
             target_dir = temp_files_dir
-        fp = os.path.join(target_dir, fn)
-        self.write_nc(var_map, fp, t_index=[tlen - 10, tlen, 1])
+        fp = os.path.join(target_dir, self.default_filename)
+        # linked under a temp name, then moved into place, so a file
+        # already there is replaced
+        tmp_fp = f"{fp}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.link(filepath, tmp_fp)
+        except OSError:
+            # e.g. another file system
+            shutil.copyfile(filepath, tmp_fp)
+        os.replace(tmp_fp, fp)
 
         return fp
 
+    def fetch_engine(self, workers=True):
+        """
+        A FetchEngine for the data, set up with this model's settings
+
+        :param workers: if False, the data is read in this process only
+        """
+        return FetchEngine(self.FileName,
+                           self.Dataset,
+                           max_workers=self.fetch_workers if workers else 0,
+                           max_per_host=self.fetch_per_host,
+                           max_chunk_bytes=self.fetch_chunk_bytes,
+                           )
+
     def update(self, FileName):
         """
         Change nc Dataset to point to a new nc file or url without reinitializing everything (retain grid info)
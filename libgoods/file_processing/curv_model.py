@@ -2,9 +2,12 @@
 import numpy as np
 from netCDF4 import Dataset, MFDataset
 from . import base
+from .grid_index import GridIndex, get_grid_index
 
 class curv(base.nc):
 
+    grid_type = 'curvilinear'
+
     def get_dimensions(self,var_map,get_time=True,get_xy=True,get_z=False):
         '''
         Get the model dimensions (time,x,y)
@@ -13,58 +16,85 @@ class curv(base.nc):
 
         if get_time:
             self.time_varname = var_map['time']
-            self.time = self.Dataset.variables[var_map['time']][:]
+            self.time = self.get_time(var_map['time'])
             self.time_units = self.Dataset[var_map['time']].units
             self.time_dimension = self.Dataset.variables[var_map['time']].dimensions
 
         if get_xy:
-            if self.GridDataset is not None:
-                self.lon = self.GridDataset.variables[var_map['lon']][:]
-                self.lat = self.GridDataset.variables[var_map['lat']][:]
-            else:
-                self.lon = self.Dataset.variables[var_map['lon']][:]
-                self.lat = self.Dataset.variables[var_map['lat']][:]
+            self.grid_index = self.get_grid_index(var_map['lon'],var_map['lat'])
+            self.lon = self.grid_index.lon
+            self.lat = self.grid_index.lat
 
             self.x = [0,self.lon.shape[1]]
             self.y = [0,self.lat.shape[0]]
-            self.lon = (self.lon > 180).choose(self.lon,self.lon-360)
 
         if get_z:
             self.depth = self.Dataset.variables[var_map['z']]
             self.z = [0,self.depth.shape[0]]
 
 
+    def get_grid_index(self,lon_varname,lat_varname,shift_lon=True):
+        '''
+        Get the spatial index of the grid -- it is built the first time
+        and cached per grid, so the grid coordinates are only read once.
+        '''
+        if self.GridDataset is not None:
+            ds = self.GridDataset
+            fname = self.GridFileName
+        else:
+            ds = self.Dataset
+            fname = self.FileName
+
+        def read_lonlat():
+            lon = ds.variables[lon_varname][:]
+            lat = ds.variables[lat_varname][:]
+            if shift_lon:
+                lon = (lon > 180).choose(lon,lon-360)
+            return lon, lat
+
+        key = (str(fname),lon_varname,lat_varname,shift_lon,ds.variables[lon_varname].shape)
+        return get_grid_index(key,read_lonlat)
+
     def subset(self,bbox,stride=1,dl=True):
         '''
         bbox = [slat,wlon,nlat,elon]
-
         '''
         glat = self.lat
         glon = self.lon
 
+        index = getattr(self,'grid_index',None)
+        if index is None or index.lon is not glon or index.lat is not glat:
+            index = GridIndex(glon,glat)
+
         sl = bbox[0]
         nl = bbox[2]
         wl = bbox[1]
         el = bbox[3]
 
-        if (abs(np.nanmax(glat)-nl) < 1e-3) and (abs(np.nanmin(glon)-wl) < 1e-3): #original values
+        if (abs(index.lat_max-nl) < 1e-3) and (abs(index.lon_min-wl) < 1e-3): #original values
             self.y = [0,np.size(glat,0),1]
             self.x = [0,np.size(glat,1),1]
         else: #do subset
 
             if not dl:
-                [yvec,xvec] = np.where(np.logical_and(np.logical_and(glat>=sl,glat<=nl),np.logical_and(glon>=wl,glon<=el)))
+                count, yw, xw = index.query_bbox(sl,wl,nl,el)
             else:
-                [yvec,xvec] = np.where(np.logical_and(np.logical_and(glat>=sl,glat<=nl),np.logical_or(glon>=wl,glon<=el)))
+                # lon >= wl or lon <= el: combine the two halves
+                count, yw, xw = index.query_bbox(sl,wl,nl,np.inf)
+                count2, yw2, xw2 = index.query_bbox(sl,-np.inf,nl,el)
+                if count == 0:
+                    yw, xw = yw2, xw2
+                elif count2 > 0:
+                    yw = [min(yw[0],yw2[0]),max(yw[1],yw2[1])]
+                    xw = [min(xw[0],xw2[0]),max(xw[1],xw2[1])]
+                count += count2
+                if wl <= el: # don't count the points in both halves twice
+                    count -= index.query_bbox(sl,wl,nl,el)[0]
                 #self.dlx = 1 #Could do this to make the writing not need the dl flag passed in explicity
 
-            if len(yvec) > 2 and len(xvec) > 2:
-                y1 = min(yvec)
-                y2 = max(yvec)+1
-                x1 = min(xvec)
-                x2 = max(xvec)+1
-                self.y = [y1,y2,stride]
-                self.x = [x1,x2,stride]
+            if count > 2:
+                self.y = [yw[0],yw[1],stride]
+                self.x = [xw[0],xw[1],stride]
             else:
                 self.y = [0,np.size(glat,0),1]
                 self.x = [0,np.size(glat,1),1]
@@ -0,0 +1,271 @@
+"""
+Chunked, concurrent fetching of data variables
+
+Copying a variable with one `var_out[:] = var_in[...]` statement holds the
+whole time x (z x) y x x hyperslab in memory, and over OPeNDAP it is one
+huge request, which can hit the server's response size limits and leaves
+bandwidth unused when the transfer is bound by latency.
+
+The FetchEngine splits the hyperslab into chunks -- along time, and along
+space if a single time step is too big -- fetches the chunks concurrently,
+and writes them into the output in order. The memory use is bounded by a
+ceiling on the bytes in flight, so it doesn't depend on the length of the
+time range.
+
+The chunks are fetched by worker processes, each with its own connection.
+(They can't be threads: the netCDF-C library is not thread-safe.) The
+number of chunks in flight to any one host is capped, across all the
+engines in this process.
+"""
+
+import itertools
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlparse
+
+import numpy as np
+from netCDF4 import Dataset, MFDataset
+
+# memory ceiling for a streaming copy, in bytes
+DEFAULT_MAX_BLOCK_BYTES = 64 * 2**20
+# largest single request, in bytes -- well under the usual THREDDS limits
+DEFAULT_MAX_CHUNK_BYTES = 16 * 2**20
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_MAX_PER_HOST = 4
+
+# datasets opened by a worker process -- key is the filename
+_open_datasets = {}
+
+# semaphores capping the requests in flight to each host
+_host_semaphores = {}
+_host_semaphores_lock = threading.Lock()
+
+
+def _read(filename, varname, key):
+    """
+    Read a hyperslab of a variable -- this is run in a worker process
+    """
+    ds_key = str(filename)
+    ds = _open_datasets.get(ds_key)
+    if ds is None:
+        if isinstance(filename, list):
+            ds = MFDataset(filename)
+        else:
+            ds = Dataset(filename)
+        ds.set_auto_maskandscale(False)
+        _open_datasets[ds_key] = ds
+    return ds.variables[varname][key]
+
+
+def host_semaphore(filename, max_per_host):
+    """
+    The semaphore for the host a filename or URL is on
+
+    Local files all share the host "".
+    """
+    if isinstance(filename, list):
+        filename = filename[0]
+    host = urlparse(str(filename)).netloc
+    with _host_semaphores_lock:
+        semaphore = _host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(max_per_host)
+            _host_semaphores[host] = semaphore
+    return semaphore
+
+
+def _split(indexes, max_length):
+    """
+    split a range of indexes into pieces of at most max_length
+
+    :returns: list of (output slice, input slice)
+    """
+    return [
+        (slice(start, start + len(piece)), slice(piece.start, piece.stop, piece.step))
+        for start in range(0, len(indexes), max_length)
+        for piece in (indexes[start:start + max_length],)
+    ]
+
+
+def split_chunks(shape, itemsize, t_index, index, max_chunk_bytes):
+    """
+    Split var[t_index, *index] into chunks of at most max_chunk_bytes
+
+    Time steps are grouped if they fit, otherwise each time step is split
+    along the first spatial dimension(s), down to single rows if need be.
+
+    :param shape: shape of the variable
+    :param t_index: [start, stop, stride] of the time steps
+    :param index: tuple of the indexes (ints or slices) for the dimensions
+                  after time
+
+    :returns: list of (output key, input key, nbytes) in output order
+    """
+    ranges = [range(*slice(*t_index).indices(shape[0]))]
+    for idx, size in zip(index, shape[1:]):
+        if isinstance(idx, slice):
+            ranges.append(range(*idx.indices(size)))
+        else:
+            ranges.append(None)  # a single index -- dropped from the output
+
+    lengths = [len(r) if r is not None else 1 for r in ranges]
+    # the bytes in one "row" of each dimension: the product of what follows
+    row_bytes = [itemsize * int(np.prod(lengths[dim + 1:])) for dim in range(len(lengths))]
+
+    # the first dimension a full row of which fits is split into groups of rows,
+    # the dimensions before it are split into single rows.
+    split_dim = next((dim for dim in range(len(lengths))
+                      if ranges[dim] is not None and row_bytes[dim] <= max_chunk_bytes),
+                     max(dim for dim in range(len(lengths)) if ranges[dim] is not None))
+    pieces = []
+    for dim, rng in enumerate(ranges):
+        if rng is None:
+            pieces.append([(None, index[dim - 1])])
+        elif dim < split_dim:
+            pieces.append(_split(rng, 1))
+        elif dim == split_dim:
+            max_length = max(int(max_chunk_bytes // row_bytes[dim]), 1)
+            pieces.append(_split(rng, max_length))
+        else:
+            pieces.append(_split(rng, len(rng) or 1))
+
+    chunks = []
+    for combo in itertools.product(*pieces):
+        out_key = tuple(out for out, _ in combo if out is not None)
+        in_key = tuple(inp for _, inp in combo)
+        nbytes = itemsize * int(np.prod([out.stop - out.start for out in out_key]))
+        chunks.append((out_key, in_key, nbytes))
+    return chunks
+
+
+class FetchEngine:
+    """
+    Fetches chunks of variables concurrently, in worker processes
+
+    Use as a context manager -- the worker processes are started when
+    first needed, and shut down on exit.
+    """
+
+    def __init__(self,
+                 filename,
+                 dataset,
+                 max_workers=DEFAULT_MAX_WORKERS,
+                 max_per_host=DEFAULT_MAX_PER_HOST,
+                 max_chunk_bytes=DEFAULT_MAX_CHUNK_BYTES,
+                 ):
+        """
+        :param filename: filename or URL (or list of them) of the dataset
+        :param dataset: the already open dataset, for reading in this process
+        :param max_workers: number of worker processes (connections). If 0,
+                            everything is read in this process.
+        :param max_per_host: cap on the requests in flight to a host,
+                             shared by all engines
+        :param max_chunk_bytes: largest single request
+        """
+        self.filename = filename
+        self.dataset = dataset
+        self.max_workers = max_workers
+        self.max_chunk_bytes = max_chunk_bytes
+        self.semaphore = host_semaphore(filename, max_per_host)
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _read_local(self, varname, key):
+        future = Future()
+        future.set_result(self.dataset.variables[varname][key])
+        return future
+
+    def _submit(self, varname, key, wait):
+        """
+        Start fetching var[key] in a worker
+
+        :param wait: whether to block until the host has a free slot
+        :returns: a Future, or None if the host has no free slot
+        """
+        if not self.semaphore.acquire(blocking=wait):
+            return None
+        try:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            future = self._executor.submit(_read, self.filename, varname, key)
+        except BrokenProcessPool:
+            self.semaphore.release()
+            self.max_workers = 0
+            return self._read_local(varname, key)
+        future.add_done_callback(lambda f: self.semaphore.release())
+        return future
+
+    def _result(self, future, varname, key):
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            # a worker died -- carry on in this process
+            self.max_workers = 0
+            return self.dataset.variables[varname][key]
+
+    def copy(self, var_in, var_out, t_index, index,
+             max_block_bytes=DEFAULT_MAX_BLOCK_BYTES):
+        """
+        Copy var_in[t_index, *index] into var_out, chunk by chunk
+
+        :param t_index: [start, stop, stride] of the time steps to copy
+        :param index: tuple of the indexes (ints or slices) for the dimensions
+                      after time
+        :param max_block_bytes: memory ceiling -- the most data in flight
+                                (fetched or being fetched, but not written)
+        """
+        varname = var_in.name
+        chunk_bytes = self.max_chunk_bytes
+        if self.max_workers > 0:
+            # leave room for all the workers to be busy
+            chunk_bytes = min(chunk_bytes, max_block_bytes // (self.max_workers + 1))
+        chunks = split_chunks(var_in.shape, np.dtype(var_in.dtype).itemsize,
+                              t_index, index, chunk_bytes)
+
+        # no point in worker processes for a single chunk
+        if self.max_workers == 0 or len(chunks) < 2:
+            for out_key, in_key, _ in chunks:
+                var_out[out_key] = var_in[in_key]
+            return
+
+        in_flight = deque()
+        bytes_in_flight = 0
+        to_fetch = deque(chunks)
+        while to_fetch or in_flight:
+            # start as many as the memory ceiling and the host allow
+            while (to_fetch
+                   and len(in_flight) < max(self.max_workers, 1)
+                   and (not in_flight
+                        or bytes_in_flight + to_fetch[0][2] <= max_block_bytes)):
+                out_key, in_key, nbytes = to_fetch[0]
+                if self.max_workers == 0:
+                    future = self._read_local(varname, in_key)
+                else:
+                    # only block for a slot if there's nothing to write meanwhile
+                    future = self._submit(varname, in_key, wait=not in_flight)
+                    if future is None:
+                        break
+                to_fetch.popleft()
+                in_flight.append((future, out_key, in_key, nbytes))
+                bytes_in_flight += nbytes
+
+            # write the next one in order
+            future, out_key, in_key, nbytes = in_flight.popleft()
+            var_out[out_key] = self._result(future, varname, in_key)
+            bytes_in_flight -= nbytes
@@ -0,0 +1,191 @@
+"""
+Spatial index for the points of a curvilinear grid
+
+The grid points are sorted into a regular set of lon/lat bins, and the
+envelope (lon/lat extent and i/j extent) of the points in each bin is
+stored. A query then only looks at the bins near the box:
+bins entirely inside the box contribute their i/j envelope directly, and
+only the points of bins on the edge of the box are checked one by one.
+
+Building the index is O(n log n), so it is done once per grid and cached
+(see `get_grid_index`).
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class GridIndex:
+    """
+    Cell-envelope bins over the lon/lat points of a 2-D grid
+    """
+
+    # target number of grid points in each bin
+    points_per_bin = 32
+
+    def __init__(self, lon, lat):
+        """
+        :param lon: 2-D array of longitudes (may be masked or have NaNs)
+        :param lat: 2-D array of latitudes, same shape as lon
+        """
+        self.lon = lon
+        self.lat = lat
+        self.shape = np.shape(lon)
+
+        lon = np.ma.filled(np.ma.asarray(lon, dtype=np.float64), np.nan).ravel()
+        lat = np.ma.filled(np.ma.asarray(lat, dtype=np.float64), np.nan).ravel()
+        valid = np.flatnonzero(np.isfinite(lon) & np.isfinite(lat))
+        lon = lon[valid]
+        lat = lat[valid]
+        self.num_points = len(valid)
+
+        if self.num_points == 0:
+            self.lon_min = self.lon_max = self.lat_min = self.lat_max = np.nan
+            self.nx = self.ny = 1
+            self._offsets = np.zeros(2, dtype=np.intp)
+            return
+
+        self.lon_min, self.lon_max = lon.min(), lon.max()
+        self.lat_min, self.lat_max = lat.min(), lat.max()
+
+        nbins = max(self.num_points // self.points_per_bin, 1)
+        self.nx = self.ny = max(int(np.sqrt(nbins)), 1)
+        self.dlon = (self.lon_max - self.lon_min) / self.nx or 1.0
+        self.dlat = (self.lat_max - self.lat_min) / self.ny or 1.0
+
+        bin_id = self._bin_y(lat) * self.nx + self._bin_x(lon)
+        order = np.argsort(bin_id, kind="stable")
+        bin_id = bin_id[order]
+
+        jj, ii = np.unravel_index(valid[order], self.shape)
+        self._lon = lon[order]
+        self._lat = lat[order]
+        self._j = jj.astype(np.intp)
+        self._i = ii.astype(np.intp)
+
+        # CSR style: the points in bin k are [offsets[k]:offsets[k + 1]]
+        self._offsets = np.searchsorted(bin_id, np.arange(self.nx * self.ny + 1))
+
+        # the envelopes of the non-empty bins
+        counts = np.diff(self._offsets)
+        starts = self._offsets[:-1][counts > 0]
+        self._count = counts
+        self._env = {}
+        for name, values in (("lon", self._lon),
+                             ("lat", self._lat),
+                             ("j", self._j),
+                             ("i", self._i)):
+            vmin = np.zeros(len(counts), dtype=values.dtype)
+            vmax = np.zeros(len(counts), dtype=values.dtype)
+            vmin[counts > 0] = np.minimum.reduceat(values, starts)
+            vmax[counts > 0] = np.maximum.reduceat(values, starts)
+            self._env[name] = (vmin, vmax)
+
+    def _bin_x(self, lon):
+        return np.clip(((lon - self.lon_min) / self.dlon).astype(np.intp), 0, self.nx - 1)
+
+    def _bin_y(self, lat):
+        return np.clip(((lat - self.lat_min) / self.dlat).astype(np.intp), 0, self.ny - 1)
+
+    def _candidate_bins(self, south, west, north, east):
+        """
+        The non-empty bins whose envelopes intersect the box
+        """
+        # one extra bin on each side in case of round-off in the binning
+        x0, x1 = self._bin_x(np.clip(np.array([west, east]), self.lon_min, self.lon_max))
+        y0, y1 = self._bin_y(np.clip(np.array([south, north]), self.lat_min, self.lat_max))
+        xs = np.arange(max(x0 - 1, 0), min(x1 + 2, self.nx))
+        ys = np.arange(max(y0 - 1, 0), min(y1 + 2, self.ny))
+        bins = (ys[:, None] * self.nx + xs[None, :]).ravel()
+        bins = bins[self._count[bins] > 0]
+
+        lon_min, lon_max = self._env["lon"]
+        lat_min, lat_max = self._env["lat"]
+        overlaps = ((lon_max[bins] >= west) & (lon_min[bins] <= east)
+                    & (lat_max[bins] >= south) & (lat_min[bins] <= north))
+        return bins[overlaps]
+
+    def _bin_points(self, bins):
+        """
+        Indexes (into the sorted points) of all the points in bins
+        """
+        starts = self._offsets[bins]
+        lens = self._offsets[bins + 1] - starts
+        shifts = np.repeat(starts - np.cumsum(lens) + lens, lens)
+        return shifts + np.arange(lens.sum())
+
+    @staticmethod
+    def _window(count, j, i):
+        if count == 0:
+            return 0, None, None
+        return count, [int(j[0]), int(j[1]) + 1], [int(i[0]), int(i[1]) + 1]
+
+    def query_bbox(self, south, west, north, east):
+        """
+        Find the i/j window of the grid points inside a box (inclusive)
+
+        Infinite bounds are allowed.
+
+        :returns: (count, [y1, y2], [x1, x2]) -- the number of points found and
+                  the (end exclusive) windows, which are None if count is 0.
+        """
+        if self.num_points == 0:
+            return self._window(0, None, None)
+        bins = self._candidate_bins(south, west, north, east)
+
+        lon_min, lon_max = self._env["lon"]
+        lat_min, lat_max = self._env["lat"]
+        inside = ((lon_min[bins] >= west) & (lon_max[bins] <= east)
+                  & (lat_min[bins] >= south) & (lat_max[bins] <= north))
+
+        # bins entirely in the box: use their envelopes
+        full = bins[inside]
+        count = int(self._count[full].sum())
+        j = [np.inf, -np.inf]
+        i = [np.inf, -np.inf]
+        if len(full):
+            j = [self._env["j"][0][full].min(), self._env["j"][1][full].max()]
+            i = [self._env["i"][0][full].min(), self._env["i"][1][full].max()]
+
+        # bins on the edge of the box: check their points
+        pts = self._bin_points(bins[~inside])
+        plon = self._lon[pts]
+        plat = self._lat[pts]
+        pts = pts[(plon >= west) & (plon <= east) & (plat >= south) & (plat <= north)]
+        if len(pts):
+            count += len(pts)
+            j = [min(j[0], self._j[pts].min()), max(j[1], self._j[pts].max())]
+            i = [min(i[0], self._i[pts].min()), max(i[1], self._i[pts].max())]
+
+        return self._window(count, j, i)
+
+
+# cache of GridIndex objects: key is whatever identifies the grid
+_grid_indexes = OrderedDict()
+_grid_indexes_lock = threading.Lock()
+MAX_CACHED_GRIDS = 8
+
+
+def get_grid_index(key, read_lonlat):
+    """
+    Return the cached GridIndex for a grid, building it if need be
+
+    :param key: hashable key identifying the grid
+    :param read_lonlat: callable returning (lon, lat) -- only called
+                        if the index is not already cached.
+    """
+    with _grid_indexes_lock:
+        index = _grid_indexes.get(key)
+        if index is not None:
+            _grid_indexes.move_to_end(key)
+            return index
+
+    index = GridIndex(*read_lonlat())
+
+    with _grid_indexes_lock:
+        _grid_indexes[key] = index
+        while len(_grid_indexes) > MAX_CACHED_GRIDS:
+            _grid_indexes.popitem(last=False)
+    return index
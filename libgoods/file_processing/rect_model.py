@@ -1,8 +1,88 @@
+import threading
+from collections import OrderedDict
+
 import numpy as np
 from .import base
+from .fetch import DEFAULT_MAX_BLOCK_BYTES, FetchEngine
 from netCDF4 import Dataset, MFDataset
 
 
+class SortedAxis:
+    """
+    A 1-D coordinate axis prepared for binary search
+
+    Works for axes made of a few monotonically increasing runs -- e.g.
+    a 0--360 longitude axis shifted to -180--180 has two -- and for
+    decreasing axes. Anything else (NaNs, masked values, many runs)
+    falls back to scanning the whole axis.
+    """
+
+    # more runs than this and a scan is just as good
+    max_runs = 8
+
+    def __init__(self, values):
+        self.values = values
+        self.runs = None  # list of (offset, increasing values, reversed)
+
+        data = np.ma.filled(np.ma.asarray(values, dtype=np.float64), np.nan)
+        if data.ndim != 1 or len(data) == 0 or not np.all(np.isfinite(data)):
+            return
+
+        diffs = np.diff(data)
+        if len(data) > 1 and np.all(diffs < 0):
+            self.runs = [(0, data[::-1], True)]
+            return
+
+        breaks = np.flatnonzero(diffs < 0) + 1
+        if len(breaks) < self.max_runs:
+            bounds = [0, *breaks.tolist(), len(data)]
+            self.runs = [(start, data[start:stop], False)
+                         for start, stop in zip(bounds[:-1], bounds[1:])]
+
+    def window(self, intervals):
+        """
+        Find the indexes of the values inside any of the intervals
+
+        :param intervals: sequence of (low, high) pairs -- inclusive,
+                          and may be infinite
+
+        :returns: (first, last + 1, count), or None if no values are inside
+        """
+        if self.runs is None:
+            mask = np.zeros(np.shape(self.values), dtype=bool)
+            for low, high in intervals:
+                mask |= np.logical_and(self.values >= low, self.values <= high)
+            found = np.nonzero(mask)[0]
+            if len(found) == 0:
+                return None
+            return found[0], found[-1] + 1, len(found)
+
+        first = last = None
+        count = 0
+        for offset, run, is_reversed in self.runs:
+            for low, high in intervals:
+                start = np.searchsorted(run, low, side="left")
+                stop = np.searchsorted(run, high, side="right")
+                if start >= stop:
+                    continue
+                count += stop - start
+                if is_reversed:
+                    start, stop = len(run) - stop, len(run) - start
+                start += offset
+                stop += offset
+                first = start if first is None else min(first, start)
+                last = stop if last is None else max(last, stop)
+
+        if first is None:
+            return None
+        return first, last, count
+
+
+_axes = OrderedDict()
+_axes_lock = threading.Lock()
+MAX_CACHED_AXES = 16
+
+
 class rect(base.nc):
     """
     A class for dealing with regular grid model output and converting to GNOME format
@@ -10,53 +90,123 @@ class rect(base.nc):
     variable names can be customized for different models or datasets
     """
 
+    grid_type = "rectangular"
+
     def get_dimensions(self, var_map, get_time=True, get_xy=True, get_z=False):
 
         if get_time:
             self.time_varname = var_map["time"]
-            self.time = self.Dataset.variables[var_map["time"]][:]
+            self.time = self.get_time(var_map["time"])
             self.time_units = self.Dataset[var_map["time"]].units
             self.time_dimension = self.Dataset.variables[var_map["time"]].dimensions
 
         if get_xy:
-            if self.GridDataset is not None:
-                self.lon = self.GridDataset.variables[var_map["lon"]][:]
-                self.lat = self.GridDataset.variables[var_map["lat"]][:]
-            else:
-                self.lon = self.Dataset.variables[var_map["lon"]][:]
-                self.lat = self.Dataset.variables[var_map["lat"]][:]
+            self.lon_axis = self.get_axis(var_map["lon"], shift_lon=True)
+            self.lat_axis = self.get_axis(var_map["lat"])
+            self.lon = self.lon_axis.values
+            self.lat = self.lat_axis.values
             self.x = [0, len(self.lon), 1]
             self.y = [0, len(self.lat), 1]
 
-            self.lon = (self.lon > 180).choose(self.lon, self.lon - 360)
-
         if get_z:
             self.depth = self.Dataset.variables[var_map["z"]]
             self.z = [0, self.depth.shape[0]]
 
+    def get_axis(self, varname, shift_lon=False):
+        """
+        Get a coordinate axis, ready for binary search
+
+        The axis (with longitudes shifted to -180--180 if shift_lon)
+        is cached per file, so it's only read and prepared once.
+        """
+        if self.GridDataset is not None:
+            ds = self.GridDataset
+            fname = self.GridFileName
+        else:
+            ds = self.Dataset
+            fname = self.FileName
+
+        key = (str(fname), varname, shift_lon, ds.variables[varname].shape)
+        with _axes_lock:
+            axis = _axes.get(key)
+            if axis is not None:
+                _axes.move_to_end(key)
+                return axis
+
+        values = ds.variables[varname][:]
+        if shift_lon:
+            values = (values > 180).choose(values, values - 360)
+        axis = SortedAxis(values)
+
+        with _axes_lock:
+            _axes[key] = axis
+            while len(_axes) > MAX_CACHED_AXES:
+                _axes.popitem(last=False)
+        return axis
+
+    def _sorted_axis(self, name):
+        # use the cached axis if it's still the one in use
+        axis = getattr(self, name + "_axis", None)
+        values = getattr(self, name)
+        if axis is None or axis.values is not values:
+            axis = SortedAxis(values)
+        return axis
+
     def subset(self, bbox, stride=1, dl=0):
         """
         bbox = [slat,wlon,nlat,elon]
 
         """
-        subset_lat = np.nonzero(
-            np.logical_and(self.lat >= bbox[0], self.lat <= bbox[2])
-        )[0]
+        subset_lat = self._sorted_axis("lat").window([(bbox[0], bbox[2])])
 
         if dl == 0:
-            subset_lon = np.nonzero(
-                np.logical_and(self.lon >= bbox[1], self.lon <= bbox[3])
-            )[0]
+            subset_lon = self._sorted_axis("lon").window([(bbox[1], bbox[3])])
         else:
-            subset_lon = np.nonzero(
-                np.logical_or(self.lon >= bbox[1], self.lon <= bbox[3])
-            )[0]
+            subset_lon = self._sorted_axis("lon").window(
+                [(bbox[1], np.inf), (-np.inf, bbox[3])]
+            )
 
-        if stride >= len(subset_lat):
+        if subset_lat is None or subset_lon is None:
+            raise ValueError(f"No grid points in the bounding box: {bbox}")
+
+        if stride >= subset_lat[2]:
             stride = 1
 
-        self.y = [subset_lat[0], subset_lat[-1] + 1, stride]
-        self.x = [subset_lon[0], subset_lon[-1] + 1, stride]
+        self.y = [subset_lat[0], subset_lat[1], stride]
+        self.x = [subset_lon[0], subset_lon[1], stride]
+
+    def output_structure(self, plan):
+        """
+        The structure of the file write_nc writes for a plan -- see nc.output_structure
+        """
+        var_map = self.var_map
+        nc_in = self.Dataset
+        nc_grid = self.GridDataset if self.GridDataset is not None else nc_in
+
+        tvar = nc_in.variables[var_map["time"]]
+        dimensions = {tvar.dimensions[0]: None,
+                      "lat": plan["y"][1] - plan["y"][0],
+                      "lon": plan["x"][1] - plan["x"][0],
+                      }
+        variables = [(tvar.name, tvar.dimensions, "f4", {"units": tvar.units})]
+
+        for name in ("lon", "lat"):
+            var_in = nc_grid.variables[var_map[name]]
+            variables.append((name, (name,), var_in.dtype, base.copied_attrs(var_in)))
+
+        if "mask" in var_map:
+            var_in = nc_in.variables[var_map["mask"]]
+            dims = (var_in.dimensions[-2], var_in.dimensions[-1])
+            variables.append(("mask", dims, var_in.dtype, base.copied_attrs(var_in)))
+
+        for var in self.data_vars:
+            if var in var_map:
+                var_in = nc_in.variables[var_map[var]]
+                dims = (tvar.dimensions[0], var_in.dimensions[-2], var_in.dimensions[-1])
+                variables.append((var_in.name, dims, var_in.dtype,
+                                  base.copied_attrs(var_in, skip=("_FillValue",))))
+
+        return dimensions, variables
 
     def write_nc(
         self,
@@ -67,10 +217,15 @@ class rect(base.nc):
         is3d=False,
         grid_only=False,
         dl=0,
+        stream=False,
+        max_block_bytes=DEFAULT_MAX_BLOCK_BYTES,
     ):
         """
         Write a rectangular grid model file
         Note: some of these input params aren't used at present; trying to have same params as other grid types
+
+        If stream is True, the data variables are fetched in chunks, concurrently,
+        with at most max_block_bytes in flight (see fetch.py)
         """
         nc_in = self.Dataset
         nc_in.set_auto_maskandscale(False)
@@ -134,36 +289,42 @@ class rect(base.nc):
                 if var in var_map:
                     data_vars.append(var_map[var])
 
-            for var in data_vars:
-                print(var)
-                # Create variable in new file:
-                var_in = nc_in.variables[var]
-                dims = (
-                    self.time_dimension[0],
-                    var_in.dimensions[-2],
-                    var_in.dimensions[-1],
-                )
-                var_out = nc_out.createVariable(var, var_in.dtype, dims)
-                # Copy data:
-                if len(var_in.shape) == 4:
-                    var_out[:] = var_in[
-                        t_index[0] : t_index[1] : t_index[2],
-                        d_index,
-                        self.y[0] : self.y[1],
-                        self.x[0] : self.x[1],
-                    ]
-                elif len(var_in.shape) == 3:
-                    var_out[:] = var_in[
-                        t_index[0] : t_index[1] : t_index[2],
-                        self.y[0] : self.y[1],
-                        self.x[0] : self.x[1],
-                    ]
-
-                # Copy NetCDF attributes:
-                if type(self.Dataset) is MFDataset:
-                    var_in = Dataset(self.FileName[0]).variables[var]
-                for attr in var_in.ncattrs():
-                    if attr != "_FillValue":
-                        var_out.setncattr(attr, var_in.getncattr(attr))
+            with self.fetch_engine(workers=stream) as engine:
+                for var in data_vars:
+                    print(var)
+                    # Create variable in new file:
+                    var_in = nc_in.variables[var]
+                    dims = (
+                        self.time_dimension[0],
+                        var_in.dimensions[-2],
+                        var_in.dimensions[-1],
+                    )
+                    var_out = nc_out.createVariable(var, var_in.dtype, dims)
+                    # Copy data:
+                    index = None
+                    if len(var_in.shape) == 4:
+                        index = (
+                            d_index,
+                            slice(self.y[0], self.y[1]),
+                            slice(self.x[0], self.x[1]),
+                        )
+                    elif len(var_in.shape) == 3:
+                        index = (
+                            slice(self.y[0], self.y[1]),
+                            slice(self.x[0], self.x[1]),
+                        )
+                    if index is not None:
+                        if stream:
+                            engine.copy(var_in, var_out, t_index, index,
+                                        max_block_bytes)
+                        else:
+                            var_out[:] = var_in[(slice(*t_index),) + index]
+
+                    # Copy NetCDF attributes:
+                    if type(self.Dataset) is MFDataset:
+                        var_in = Dataset(self.FileName[0]).variables[var]
+                    for attr in var_in.ncattrs():
+                        if attr != "_FillValue":
+                            var_out.setncattr(attr, var_in.getncattr(attr))
 
         nc_out.close()
@@ -1,7 +1,8 @@
 #!/usr/bin/env python
 import numpy as np
 from netCDF4 import Dataset, MFDataset
-from . import curv_model
+from . import base, curv_model
+from .fetch import DEFAULT_MAX_BLOCK_BYTES, FetchEngine
 
 
 class roms(curv_model.curv):
@@ -11,6 +12,23 @@ class roms(curv_model.curv):
     needed for GNOME
     """
 
+    # List of grid variables to copy (they have to be in the grid file...):
+    grid_vars = [
+        "lon_rho",
+        "lat_rho",
+        "mask_rho",
+        "lon_psi",
+        "lat_psi",
+        "mask_psi",
+        "lon_u",
+        "lat_u",
+        "mask_u",
+        "lon_v",
+        "lat_v",
+        "mask_v",
+        "angle",
+    ]
+
     def get_dimensions(self, var_map=None, get_time=True, get_xy=True):
 
         if var_map is None:
@@ -20,21 +38,81 @@ class roms(curv_model.curv):
 
         if get_time:
             self.time_varname = tvar
-            self.time = self.Dataset.variables[tvar][:]
+            self.time = self.get_time(tvar)
             self.time_units = self.Dataset[tvar].units
             self.time_dimension = self.Dataset.variables[tvar].dimensions
 
         if get_xy:
-            if self.GridDataset is not None:
-                self.lon = self.GridDataset.variables["lon_rho"][:]
-                self.lat = self.GridDataset.variables["lat_rho"][:]
-            else:
-                self.lon = self.Dataset.variables["lon_rho"][:]
-                self.lat = self.Dataset.variables["lat_rho"][:]
+            self.grid_index = self.get_grid_index("lon_rho", "lat_rho", shift_lon=False)
+            self.lon = self.grid_index.lon
+            self.lat = self.grid_index.lat
 
             self.x = [0, self.lon.shape[1]]
             self.y = [0, self.lat.shape[0]]
 
+    def output_structure(self, plan, is3d=False):
+        """
+        The structure of the file write_nc writes for a plan -- see nc.output_structure
+        """
+        var_map = getattr(self, "var_map", None)
+        tvarname = "ocean_time" if var_map is None else var_map["time"]
+        nc_in = self.Dataset
+        nc_grid = self.GridDataset if self.GridDataset is not None else nc_in
+
+        tvar = nc_in.variables[tvarname]
+        ny = plan["y"][1] - plan["y"][0]
+        nx = plan["x"][1] - plan["x"][0]
+        dimensions = {tvar.dimensions[0]: None,
+                      "eta_rho": ny,
+                      "xi_rho": nx,
+                      "eta_psi": ny - 1,
+                      "xi_psi": nx - 1,
+                      "eta_u": ny,
+                      "xi_u": nx - 1,
+                      "eta_v": ny - 1,
+                      "xi_v": nx,
+                      }
+        if is3d:
+            dimensions["s_rho"] = nc_grid.dimensions["s_rho"].size
+        variables = [(tvar.name, tvar.dimensions, "f4", {"units": tvar.units})]
+
+        grid_vars = list(self.grid_vars)
+        if is3d:
+            grid_vars.extend(["hc", "Cs_r", "s_rho", "h"])
+        for var in grid_vars:
+            if var not in nc_grid.variables:
+                continue
+            var_in = nc_grid.variables[var]
+            if not var_in.dimensions:
+                dims = ()
+            else:
+                dim1 = var_in.dimensions[0]
+                if dim1.find("s_rho") >= 0:
+                    dims = ("s_rho",)
+                else:
+                    for stagger in ("rho", "psi", "u", "v"):
+                        if dim1.find("_" + stagger) >= 0:
+                            dims = ("eta_" + stagger, "xi_" + stagger)
+                            break
+                    else:
+                        continue
+            variables.append((var, dims, var_in.dtype, base.copied_attrs(var_in)))
+
+        for var in ("u", "v"):
+            var_in = nc_in.variables[var]
+            coords = var_in.coordinates
+            if not (coords.find("lon_u") > -1
+                    or coords.find("lon_v") > -1
+                    or (is3d and coords.find("lon_rho") > -1)):
+                continue
+            dims = (tvar.dimensions[0],) + var_in.dimensions[1 if is3d else 2:]
+            attrs = base.copied_attrs(var_in, skip=("_FillValue",))
+            if "coordinates" in attrs:
+                attrs["coordinates"] = coords.replace("s_rho ", "")
+            variables.append((var, dims, var_in.dtype, attrs))
+
+        return dimensions, variables
+
     def write_nc(
         self,
         var_map=None,
@@ -44,11 +122,15 @@ class roms(curv_model.curv):
         is3d=False,
         grid_only=False,
         dl=0,
+        stream=False,
+        max_block_bytes=DEFAULT_MAX_BLOCK_BYTES,
     ):
         """
         Write a ROMS model file
         Note: some of these input params aren't used at present; trying to have same params as other grid types
 
+        If stream is True, the data variables are fetched in chunks, concurrently,
+        with at most max_block_bytes in flight (see fetch.py)
         """
         if var_map is not None:
             # allow some default variable name overriding
@@ -86,22 +168,7 @@ class roms(curv_model.curv):
         if is3d:
             nc_out.createDimension("s_rho", nc_grid.dimensions["s_rho"].size)
 
-        # List of variables to copy (they have to be in nc_in...):
-        grid_vars = [
-            "lon_rho",
-            "lat_rho",
-            "mask_rho",
-            "lon_psi",
-            "lat_psi",
-            "mask_psi",
-            "lon_u",
-            "lat_u",
-            "mask_u",
-            "lon_v",
-            "lat_v",
-            "mask_v",
-            "angle",
-        ]
+        grid_vars = list(self.grid_vars)
 
         if is3d:
             grid_vars.extend(["hc", "Cs_r", "s_rho", "h"])
@@ -111,7 +178,8 @@ class roms(curv_model.curv):
             try:
                 var_in = nc_grid.variables[var]
             except KeyError:
-                print(var_in, " not found")
+                print(var, " not found")
+                continue
             try:
                 dim1 = var_in.dimensions[0]
             except IndexError:
@@ -165,77 +233,48 @@ class roms(curv_model.curv):
             # data_vars = ['u','v','temp','salt']
             data_vars = ["u", "v"]
 
-            for var in data_vars:
-                # Create variable in new file:
-                print(var)
-                var_in = nc_in.variables[var]
-                coords = var_in.coordinates
-
-                if is3d:
-                    dims = (
-                        self.time_dimension[0],
-                        var_in.dimensions[1],
-                        var_in.dimensions[2],
-                        var_in.dimensions[3],
-                    )
-                    if coords.find("lon_u") > -1:
-                        var_out = nc_out.createVariable(var, var_in.dtype, dims)
-                        # Copy data:
-                        var_out[:] = var_in[
-                            t_index[0] : t_index[1] : t_index[2],
-                            :,
-                            self.y[0] : self.y[1],
-                            self.x[0] : self.x[1] - 1,
-                        ]
-                    elif coords.find("lon_v") > -1:
-                        var_out = nc_out.createVariable(var, var_in.dtype, dims)
-                        # Copy data:
-                        var_out[:] = var_in[
-                            t_index[0] : t_index[1] : t_index[2],
-                            :,
-                            self.y[0] : self.y[1] - 1,
-                            self.x[0] : self.x[1],
-                        ]
-                    elif coords.find("lon_rho") > -1:
-                        var_out = nc_out.createVariable(var, var_in.dtype, dims)
-                        # Copy data:
-                        var_out[:] = var_in[
-                            t_index[0] : t_index[1] : t_index[2],
-                            :,
-                            self.y[0] : self.y[1],
-                            self.x[0] : self.x[1],
-                        ]
+            with self.fetch_engine(workers=stream) as engine:
+                for var in data_vars:
+                    # Create variable in new file:
+                    print(var)
+                    var_in = nc_in.variables[var]
+                    coords = var_in.coordinates
+
+                    if is3d:
+                        dims = (
+                            self.time_dimension[0],
+                            var_in.dimensions[1],
+                            var_in.dimensions[2],
+                            var_in.dimensions[3],
+                        )
+                        # all the levels
+                        z_index = slice(None)
                     else:
-                        print(
-                            "Variable dimensions could not be determined - skipping",
-                            var,
+                        dims = (
+                            self.time_dimension[0],
+                            var_in.dimensions[2],
+                            var_in.dimensions[3],
                         )
-                        continue
+                        z_index = d_index
 
-                else:
-                    dims = (
-                        self.time_dimension[0],
-                        var_in.dimensions[2],
-                        var_in.dimensions[3],
-                    )
                     if coords.find("lon_u") > -1:
-                        var_out = nc_out.createVariable(var, var_in.dtype, dims)
-                        # Copy data:
-                        var_out[:] = var_in[
-                            t_index[0] : t_index[1] : t_index[2],
-                            d_index,
-                            self.y[0] : self.y[1],
-                            self.x[0] : self.x[1] - 1,
-                        ]
+                        index = (
+                            z_index,
+                            slice(self.y[0], self.y[1]),
+                            slice(self.x[0], self.x[1] - 1),
+                        )
                     elif coords.find("lon_v") > -1:
-                        var_out = nc_out.createVariable(var, var_in.dtype, dims)
-                        # Copy data:
-                        var_out[:] = var_in[
-                            t_index[0] : t_index[1] : t_index[2],
-                            d_index,
-                            self.y[0] : self.y[1] - 1,
-                            self.x[0] : self.x[1],
-                        ]
+                        index = (
+                            z_index,
+                            slice(self.y[0], self.y[1] - 1),
+                            slice(self.x[0], self.x[1]),
+                        )
+                    elif is3d and coords.find("lon_rho") > -1:
+                        index = (
+                            z_index,
+                            slice(self.y[0], self.y[1]),
+                            slice(self.x[0], self.x[1]),
+                        )
                     else:
                         print(
                             "Variable dimensions could not be determined - skipping",
@@ -243,12 +282,20 @@ class roms(curv_model.curv):
                         )
                         continue
 
-                # Copy NetCDF attributes:
-                for attr in var_in.ncattrs():
-                    if attr == "coordinates":
-                        var_out.setncattr(attr, coords.replace("s_rho ", ""))
+                    var_out = nc_out.createVariable(var, var_in.dtype, dims)
+                    # Copy data:
+                    if stream:
+                        engine.copy(var_in, var_out, t_index, index,
+                                    max_block_bytes)
                     else:
-                        if attr != "_FillValue":
-                            var_out.setncattr(attr, var_in.getncattr(attr))
+                        var_out[:] = var_in[(slice(*t_index),) + index]
+
+                    # Copy NetCDF attributes:
+                    for attr in var_in.ncattrs():
+                        if attr == "coordinates":
+                            var_out.setncattr(attr, coords.replace("s_rho ", ""))
+                        else:
+                            if attr != "_FillValue":
+                                var_out.setncattr(attr, var_in.getncattr(attr))
 
         nc_out.close()
@@ -0,0 +1,130 @@
+"""
+Manifest of the model sources that come with libgoods
+
+This has the metadata of each source, and where its class is, so the
+registry (see registry.py) can list the models without importing the
+sources -- and the file processing code, netCDF4, numpy, ... they need.
+
+Other packages can provide sources with a manifest like this one,
+registered as an entry point in the "libgoods.sources" group, e.g. in setup.cfg:
+
+    [options.entry_points]
+    libgoods.sources =
+        my_sources = my_package.manifest:SOURCES
+"""
+
+from .model import Metadata
+
+
+# NOTE: this may contain HTML
+HYCOM_INFO_TEXT = """The global HYbrid Coordinate Ocean Model (HYCOM)
+nowcast/forecast system is a demonstration product of the
+<a href = "http://www.hycom.org" target="_blank">HYCOM Consortium</a>
+run in real time at the Naval Oceanographic Office.
+For more details about the global model visit the
+<a href="http://www7320.nrlssc.navy.mil/GLBhycom1-12/prologue.html" target="_blank"> global HYCOM website</a>.",
+"""
+
+
+HYCOM = Metadata(
+    identifier="HYCOM",
+    name="Global Ocean Forecasting System (GOFS) 3.1",
+    bounding_box=((-180, -78.6), (180, 90)),
+    bounding_poly=((-180.0, -78.6), (-180.0, 90.0), (180.0, 90.0), (180.0, -78.6)),
+    info_text=HYCOM_INFO_TEXT,
+    product_type='forecast',
+    forecast_start="6 days in the past",
+    forecast_end="7 days in the future",
+    environmental_parameters={
+        "surface currents",
+        "sea surface temperature",
+        "ice",
+        "3D currents",
+    },
+)
+
+
+# fixme: we probably don't want actual HTML in there
+#        but if so -- some sanitation needs to be done.
+TBOFS_INFO_TEXT = ('NOAA NOS Operational Forecast Systems available from the '
+             'Center for Operational Oceanographic Products and Services '
+             '<a href="http://tidesandcurrents.noaa.gov/index.shtml" target="_blank">'
+             '(COOPS)</a>. Forecast files are 36 hours and updated every 6 hours. '
+             'The forecast aggregation is a "best-time series", which includes '
+             'output from the latest model runs (nowcasts + latest forecast). '
+             'Archived model output is available via the '
+             '<a href="http://opendap.co-ops.nos.noaa.gov/netcdf/" target="_blank">CO-OPS server</a>.'
+             )
+
+
+TBOFS = Metadata(
+    identifier="TBOFS",
+    name="Tampa Bay Operational Forecast Systems",
+    bounding_box=((-83.172, 27.077), (-82.354, 28.031)),
+    bounding_poly=((-82.8395, 27.983),
+                   (-82.8558, 27.9821),
+                   (-82.8705, 27.9808),
+                   (-82.8915, 27.9775),
+                   (-82.9116, 27.9727),
+                   (-82.9312, 27.9661),
+                   (-82.9503, 27.9582),
+                   (-82.9689, 27.9491),
+                   (-82.9868, 27.9389),
+                   (-83.0036, 27.9277),
+                   (-83.0202, 27.9153),
+                   (-83.0317, 27.9061),
+                   (-83.0435, 27.8958),
+                   (-83.0562, 27.8838),
+                   (-83.0687, 27.8709),
+                   (-83.0808, 27.857),
+                   (-83.0921, 27.8424),
+                   (-83.1023, 27.8277),
+                   (-83.1114, 27.8124),
+                   (-83.1197, 27.7972),
+                   (-83.1269, 27.7825),
+                   (-83.1335, 27.7683),
+                   (-83.1396, 27.7546),
+                   (-83.1451, 27.7413),
+                   (-83.1502, 27.7277),
+                   (-83.1548, 27.7135),
+                   (-83.1587, 27.6985)),
+    info_text=TBOFS_INFO_TEXT,
+    product_type='forecast',
+    forecast_start="7 days in the past",
+    forecast_end="3 days in the future",
+    environmental_parameters=[
+        "surface currents",
+        "3D currents",
+    ],
+)
+
+
+DUMMY_CUR = Metadata(
+    identifier="DUMMY_CUR",
+    name="Example currents for testing",
+    bounding_box=((-119.0, 33.0), (-117.5, 34.0)),
+    bounding_poly=(
+        (-119.0, 33.0),
+        (-119.0, 34.0),
+        (-118.0, 34.0),
+        (-117.5, 33.0),
+    ),
+    info_text=(
+        "Dummy model just for testing, etc.\n"
+        "Provides sample output from the CA ROMS model"
+    ),
+    product_type="hindcast",
+    hindcast_start="2021-01-01T19",
+    hindcast_end="2022-01-02T19",
+
+    environmental_parameters={"surface currents"},
+)
+
+
+# key: model identifier
+# value: ("module:class" of the source, the metadata)
+SOURCES = {
+    HYCOM.identifier: ("libgoods.current_sources.hycom:HYCOM", HYCOM),
+    TBOFS.identifier: ("libgoods.current_sources.tbofs:TBOFS", TBOFS),
+    DUMMY_CUR.identifier: ("libgoods.dummy_sources:DummyCurrentsCAROMS", DUMMY_CUR),
+}
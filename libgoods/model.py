@@ -113,6 +113,7 @@ class Model:
             "forecast:": self.get_available_times("forecast"),
             "hindcast:": self.get_available_times("hindcast"),
         }
+        return info
 
     def get_available_times(self, cast_type):
         """
@@ -123,23 +124,29 @@ class Model:
         raise NotImplementedError
 
     def get_model_subset_info(
+        self,
         bounds,
         time_interval,
         environmental_parameters,
         cross_dateline=False,
+        time_stride=1,
     ):
         """
         returns info about a subset
 
-        this should also probably cache computations
-        needed to determine a subset.
+        Only every time_stride-th time step in time_interval is included.
+
+        Sources backed by the file_processing classes cache the
+        computations needed to determine a subset (see libgoods.cache),
+        so a following get_data call with the same params reuses them.
 
         :returns: dict of (TBA), but maybe:
 
          {"grid_type":
           "num_grid_cells":
           "num_timesteps":
-          "estimated_file_size":
+          "num_levels":
+          "estimated_file_size":  -- the exact size of the file, in bytes
           }
         """
 
@@ -151,10 +158,18 @@ class Model:
         cross_dateline=False,
         max_filesize=None,
         target_dir=None,
+        downscale=False,
+        time_stride=1,
     ):
         """
         The call to actually get the data
 
+        If the file would be bigger than max_filesize, a FileTooBigError
+        is raised -- or, if downscale is True, the time steps are thinned
+        until it fits.
+
+        Only every time_stride-th time step in time_interval is fetched.
+
         :returns: filepath -- pathlib.Path object of file written
         """
         if not set(environmental_parameters).issubset(
@@ -0,0 +1,126 @@
+"""
+Registry of the model sources
+
+The registry is built from manifests (see manifest.py): the one that
+comes with libgoods, and any registered by other packages as entry points
+in the "libgoods.sources" group. So the models can be listed, with their
+metadata, without importing any of the sources -- a source class (and the
+file processing code, netCDF4, etc.) is imported only when the source
+itself is first needed.
+
+Model identifiers are case-insensitive.
+"""
+
+import dataclasses
+import importlib
+import threading
+from collections.abc import Mapping
+from importlib import metadata as importlib_metadata
+
+ENTRY_POINT_GROUP = "libgoods.sources"
+
+
+def entry_point_manifests(group=ENTRY_POINT_GROUP):
+    """
+    Load the manifests registered as entry points
+    """
+    try:
+        entry_points = importlib_metadata.entry_points(group=group)
+    except TypeError:  # Python < 3.10
+        entry_points = importlib_metadata.entry_points().get(group, [])
+    return [entry_point.load() for entry_point in entry_points]
+
+
+class ModelRegistry(Mapping):
+    """
+    A read-only mapping of model identifier to source instance
+
+    The source instances are created when first looked up, and shared by
+    everyone who looks them up. Use new_source for an instance of one's own.
+    """
+
+    def __init__(self, manifests=None):
+        """
+        :param manifests: sequence of manifests (dicts of
+                          identifier: ("module:class", Metadata)). If None,
+                          the libgoods manifest and the ones registered as
+                          entry points are used -- loaded when first needed.
+        """
+        self._manifests = manifests
+        self._entries = None  # key: upper case identifier
+        self._classes = {}
+        self._sources = {}
+        self._lock = threading.RLock()
+
+    def _load(self):
+        if self._entries is not None:
+            return self._entries
+        with self._lock:
+            if self._entries is None:
+                manifests = self._manifests
+                if manifests is None:
+                    from .manifest import SOURCES
+                    manifests = [SOURCES] + entry_point_manifests()
+                entries = {}
+                for manifest in manifests:
+                    for identifier, (location, metadata) in manifest.items():
+                        entries[identifier.upper()] = (identifier, location, metadata)
+                self._entries = entries
+        return self._entries
+
+    def _entry(self, identifier):
+        try:
+            return self._load()[str(identifier).upper()]
+        except KeyError:
+            raise KeyError(identifier) from None
+
+    def source_class(self, identifier):
+        """
+        The source class of a model -- its module is imported when first needed
+        """
+        identifier, location, _ = self._entry(identifier)
+        with self._lock:
+            source_class = self._classes.get(identifier)
+            if source_class is None:
+                module_name, class_name = location.split(":")
+                source_class = getattr(importlib.import_module(module_name), class_name)
+                self._classes[identifier] = source_class
+        return source_class
+
+    def new_source(self, identifier):
+        """
+        A new instance of a model's source, not shared with anyone else
+
+        A source keeps the state of the request it is working on (its open
+        Dataset, subset window, ...), so concurrent requests each need their own.
+        """
+        return self.source_class(identifier)()
+
+    def __getitem__(self, identifier):
+        identifier = self._entry(identifier)[0]
+        with self._lock:
+            source = self._sources.get(identifier)
+            if source is None:
+                source = self._sources[identifier] = self.new_source(identifier)
+        return source
+
+    def __contains__(self, identifier):
+        return str(identifier).upper() in self._load()
+
+    def __iter__(self):
+        return iter([identifier for identifier, _, _ in self._load().values()])
+
+    def __len__(self):
+        return len(self._load())
+
+    def get_metadata(self, identifier):
+        """
+        The metadata of a model, as a dict -- without loading the source
+        """
+        return dataclasses.asdict(self._entry(identifier)[2])
+
+    def list_metadata(self):
+        """
+        The metadata of all the models -- without loading the sources
+        """
+        return [dataclasses.asdict(metadata) for _, _, metadata in self._load().values()]
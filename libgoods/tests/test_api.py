@@ -2,9 +2,14 @@
 test the top level API
 """
 
+import threading
+import time
+
 import pytest
 
 from libgoods import api
+from libgoods.manifest import DUMMY_CUR
+from libgoods.registry import ModelRegistry
 
 def test_list_models_currents():
     model_info = api.list_models()
@@ -12,3 +17,53 @@ def test_list_models_currents():
     # probably should test more, but this is something
     assert len(model_info) == 3
 
+
+
+class SlowSource:
+    """
+    A source that records how many requests are being worked on at once,
+    and fails if one instance is given two at once
+    """
+    lock = threading.Lock()
+    active = 0
+    max_active = 0
+
+    def __init__(self):
+        self.busy = False
+
+    def get_data(self, bounds, time_interval, *args, **kwargs):
+        assert not self.busy
+        self.busy = True
+        with self.lock:
+            SlowSource.active += 1
+            SlowSource.max_active = max(SlowSource.max_active, SlowSource.active)
+        time.sleep(0.5)
+        with self.lock:
+            SlowSource.active -= 1
+        self.busy = False
+        return f"{time_interval[0]}.nc"
+
+
+def test_different_requests_same_model(monkeypatch):
+    registry = ModelRegistry([{"SLOW": ("unused:Unused", DUMMY_CUR)}])
+    monkeypatch.setattr(registry, "source_class", lambda identifier: SlowSource)
+    monkeypatch.setattr(api, "all_models", registry)
+    bounds = ((-88.0, 30.0), (-87.0, 31.0))
+
+    results = []
+
+    def request(start):
+        results.append(api.get_model_data("SLOW", bounds, (start, "2022-01-03T00:00"),
+                                          ["surface currents"]))
+
+    threads = [threading.Thread(target=request, args=(start,))
+               for start in ("2022-01-01T00:00", "2022-01-02T00:00")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # both were run at the same time, each with a source of its own
+    assert sorted(path.name for path in results) == ["2022-01-01T00:00.nc",
+                                                     "2022-01-02T00:00.nc"]
+    assert SlowSource.max_active == 2
@@ -0,0 +1,177 @@
+"""
+tests of the asyncio API
+"""
+
+import asyncio
+import gc
+import operator
+import time
+
+import pytest
+
+from libgoods import async_api
+
+
+def append_line(filename):
+    """
+    count the calls -- returns the number of calls so far
+    """
+    time.sleep(1)
+    with open(filename, "a") as outfile:
+        outfile.write("called\n")
+    with open(filename) as infile:
+        return len(infile.readlines())
+
+
+def sleep_and_return(seconds, value):
+    time.sleep(seconds)
+    return value
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    executor = async_api.AsyncExecutor(max_workers=2)
+    monkeypatch.setattr(async_api, "_executor", executor)
+    yield executor
+    executor.shutdown()
+
+
+def test_run(executor):
+    assert asyncio.run(executor.run(operator.add, 1, 2)) == 3
+
+
+def test_run_exception(executor):
+    with pytest.raises(ValueError):
+        asyncio.run(executor.run(int, "not a number"))
+    # the worker is still usable
+    assert asyncio.run(executor.run(int, "3")) == 3
+
+
+def test_timeout_kills_worker(executor):
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await executor.run(time.sleep, 60, timeout=2)
+
+    start = time.monotonic()
+    asyncio.run(run())
+    assert time.monotonic() - start < 30
+    # the killed worker is not reused
+    assert executor._idle == []
+
+
+def test_cancel(executor):
+    async def run():
+        task = asyncio.create_task(executor.run(time.sleep, 60))
+        await asyncio.sleep(2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return await executor.run(operator.mul, 2, 3)
+
+    assert asyncio.run(run()) == 6
+
+
+def test_list_models(executor):
+    models = asyncio.run(async_api.list_models())
+    assert models == async_api.api.list_models()
+
+
+def test_get_model_subset_info_bad_model(executor):
+    with pytest.raises(KeyError):
+        asyncio.run(async_api.get_model_subset_info(
+            "NOT_A_MODEL",
+            ((-88.0, 30.0), (-87.0, 31.0)),
+            ("2022-01-01T00:00", "2022-01-02T00:00"),
+            ["surface currents"],
+        ))
+
+
+def test_coalesced_calls_share_one_run(executor, tmp_path):
+    async def run():
+        calls = [async_api.run_coalesced("key", append_line, str(tmp_path / "calls"))
+                 for _ in range(5)]
+        return await asyncio.gather(*calls)
+
+    assert asyncio.run(run()) == [1] * 5
+    # the closed loop may only be in a reference cycle with the executor's
+    # thread pool callbacks
+    gc.collect()
+    assert async_api._requests == {}
+
+
+def test_coalesced_cancel_one_of_two(executor):
+    async def run():
+        task1 = asyncio.create_task(async_api.run_coalesced("key", sleep_and_return, 2, 7))
+        task2 = asyncio.create_task(async_api.run_coalesced("key", sleep_and_return, 2, 7))
+        await asyncio.sleep(0.5)
+        task1.cancel()
+        # the other one still gets the result
+        return await task2
+
+    assert asyncio.run(run()) == 7
+
+
+def test_coalesced_all_timed_out(executor):
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await async_api.run_coalesced("key", time.sleep, 60, timeout=1)
+        # give the cancelled run a moment to be cleaned up
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    assert executor._idle == []
+
+
+def test_data_request_key():
+    key = async_api.api.data_request_key
+    bounds = ((-88.0, 30.0), (-87.0, 31.0))
+    same_bounds = [(-87.0, 31.0), (-88.0, 30.0), (-87.0, 30.0)]
+    times = ("2022-01-01T00:00", "2022-01-02T00:00")
+
+    assert (key("HYCOM", bounds, times, ["surface currents"])
+            == key("HYCOM", same_bounds, ("2022-01-01T00:00Z", "2022-01-02"),
+                   {"surface currents"}))
+    assert (key("HYCOM", bounds, times, ["surface currents"])
+            != key("HYCOM", bounds, times, ["surface currents"], time_stride=2))
+
+
+def test_cancel_while_starting_worker(executor):
+    get_worker = executor._get_worker
+
+    def slow_get_worker():
+        time.sleep(1)
+        return get_worker()
+    executor._get_worker = slow_get_worker
+
+    async def run():
+        task = asyncio.create_task(executor.run(operator.add, 1, 2))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # the worker started for it is kept for reuse, not leaked
+        for _ in range(100):
+            if executor._idle:
+                break
+            await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    assert len(executor._idle) == 1
+
+
+
+def test_timeout_includes_waiting_for_a_turn(executor):
+    async def run():
+        # both workers busy
+        busy = [asyncio.create_task(executor.run(sleep_and_return, 3, i))
+                for i in range(2)]
+        await asyncio.sleep(0.1)
+        start = time.monotonic()
+        with pytest.raises(asyncio.TimeoutError):
+            await executor.run(operator.add, 1, 2, timeout=1)
+        waited = time.monotonic() - start
+        return waited, await asyncio.gather(*busy)
+
+    waited, results = asyncio.run(run())
+    assert waited < 2
+    assert results == [0, 1]
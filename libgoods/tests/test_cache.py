@@ -0,0 +1,259 @@
+"""
+tests for the caches in libgoods.cache
+"""
+
+import datetime
+import os
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from libgoods import cache
+from libgoods.file_processing import base, rect
+from libgoods.model import Model, Metadata
+
+EXAMPLE_FILE = (Path(__file__).parent.parent / "dummy_sources" / "CAROMS_Example.nc")
+
+
+class LocalRect(Model, rect):
+    """
+    A rect source that reads the example file in dummy_sources
+    """
+    metadata = Metadata(identifier="LOCAL_RECT",
+                        environmental_parameters={"surface currents"})
+    url = str(EXAMPLE_FILE)
+    var_map = {"time": "time",
+               "lon": "lon",
+               "lat": "lat",
+               "u": "water_u",
+               "v": "water_v",
+               }
+    default_filename = "local_rect.nc"
+
+
+@pytest.fixture
+def plan_cache(tmp_path, monkeypatch):
+    plan_cache = cache.SubsetPlanCache(tmp_path / "plans.json")
+    monkeypatch.setattr(base, "subset_plans", plan_cache)
+    return plan_cache
+
+
+@pytest.fixture
+def result_cache(tmp_path, monkeypatch):
+    result_cache = cache.ResultCache(tmp_path / "results")
+    monkeypatch.setattr(base, "results", result_cache)
+    return result_cache
+
+
+def test_make_key_stable():
+    assert cache.make_key("a", [1, 2], {"b": 1}) == cache.make_key("a", [1, 2], {"b": 1})
+    assert cache.make_key("a", [1, 2]) != cache.make_key("a", [2, 1])
+
+
+def test_plan_cache_lru(tmp_path):
+    plans = cache.SubsetPlanCache(tmp_path / "plans.json", max_entries=2)
+    plans.put("a", {"x": 1})
+    plans.put("b", {"x": 2})
+    # touch "a" so that "b" is the least recently used
+    assert plans.get("a") == {"x": 1}
+    plans.put("c", {"x": 3})
+
+    assert "a" in plans
+    assert "b" not in plans
+    assert "c" in plans
+
+
+def test_plan_cache_persists(tmp_path):
+    plans = cache.SubsetPlanCache(tmp_path / "plans.json")
+    plans.put("a", {"x": [1, 2, 1]})
+
+    plans2 = cache.SubsetPlanCache(tmp_path / "plans.json")
+    assert plans2.get("a") == {"x": [1, 2, 1]}
+
+    plans2.clear()
+    assert len(cache.SubsetPlanCache(tmp_path / "plans.json")) == 0
+
+
+def test_plan_cache_shared(tmp_path):
+    # e.g. two worker processes using the same file
+    plans1 = cache.SubsetPlanCache(tmp_path / "plans.json")
+    plans2 = cache.SubsetPlanCache(tmp_path / "plans.json")
+    plans1.put("a", {"x": 1})
+    assert len(plans2) == 1
+
+    plans2.put("b", {"x": 2})
+    assert plans1.get("b") == {"x": 2}
+    # neither overwrote the other
+    assert len(cache.SubsetPlanCache(tmp_path / "plans.json")) == 2
+
+
+def test_single_flight():
+    flight = cache.SingleFlight()
+    calls = []
+
+    def work():
+        calls.append(1)
+        time.sleep(0.5)
+        return len(calls)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("key", work)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [1] * 5
+    assert len(flight) == 0
+    # once done, the next call runs again
+    assert flight.do("key", work) == 2
+
+
+def test_single_flight_error():
+    flight = cache.SingleFlight()
+
+    def fail():
+        raise ValueError("failed")
+
+    with pytest.raises(ValueError):
+        flight.do("key", fail)
+    assert len(flight) == 0
+
+
+def test_subset_plan_reused(plan_cache, result_cache, tmp_path, monkeypatch):
+    source = LocalRect()
+    source.open_nc(FileName=source.url)
+    bounds = ((-118.6, 33.3), (-118.2, 33.6))
+
+    info = rect.get_model_subset_info(source, bounds, None)
+    assert info["grid_type"] == "rectangular"
+    assert info["num_grid_cells"] > 0
+    assert len(plan_cache) == 1
+
+    # the grid should not be subset again
+    def no_subset(*args, **kwargs):
+        raise AssertionError("subset should not be called")
+    monkeypatch.setattr(LocalRect, "subset", no_subset)
+
+    filepath = rect.get_data(source, bounds, False, None, tmp_path)
+    assert Path(filepath).is_file()
+
+
+def make_file(path, size):
+    with open(path, "wb") as outfile:
+        outfile.write(b"x" * size)
+    return path
+
+
+def test_result_cache(tmp_path):
+    results = cache.ResultCache(tmp_path / "results")
+    assert results.get("a") is None
+
+    path = results.put("a", make_file(tmp_path / "a.nc", 100))
+    assert path == results.path("a")
+    assert not (tmp_path / "a.nc").exists()
+    assert results.get("a") == path
+    assert results.total_size() == 100
+
+
+def test_result_cache_lru(tmp_path):
+    results = cache.ResultCache(tmp_path / "results", max_bytes=250)
+    results.put("a", make_file(tmp_path / "a.nc", 100))
+    time.sleep(0.01)
+    results.put("b", make_file(tmp_path / "b.nc", 100))
+    time.sleep(0.01)
+    # touch "a" so that "b" is the least recently used
+    assert results.get("a") is not None
+    time.sleep(0.01)
+    results.put("c", make_file(tmp_path / "c.nc", 100))
+
+    assert "a" in results
+    assert "b" not in results
+    assert "c" in results
+    assert not results.path("b").exists()
+
+
+def test_result_cache_integrity(tmp_path):
+    results = cache.ResultCache(tmp_path / "results")
+    path = results.put("a", make_file(tmp_path / "a.nc", 100))
+    # same size, different contents
+    make_file(path, 99)
+    with open(path, "ab") as outfile:
+        outfile.write(b"y")
+
+    assert results.get("a") is None
+    assert not path.exists()
+
+
+def test_result_cache_verify(tmp_path):
+    results = cache.ResultCache(tmp_path / "results")
+    path = results.put("a", make_file(tmp_path / "a.nc", 100))
+    assert results.verify("a")
+
+    # same size and modification time, different contents: get doesn't
+    # read the file, so only verify notices
+    mtime = path.stat().st_mtime_ns
+    make_file(path, 99)
+    with open(path, "ab") as outfile:
+        outfile.write(b"y")
+    os.utime(path, ns=(mtime, mtime))
+    assert results.get("a") == path
+
+    assert not results.verify("a")
+    assert not path.exists()
+    assert results.get("a") is None
+
+
+def test_result_cache_stale_temp_files(tmp_path):
+    results = cache.ResultCache(tmp_path / "results", stale_temp_age=60)
+    stale = make_file(results.temp_path("a"), 10)
+    os.utime(stale, (time.time() - 120, time.time() - 120))
+    fresh = make_file(results.temp_path("b"), 10)
+
+    results.evict()
+    assert not stale.exists()
+    # may still be being written
+    assert fresh.exists()
+
+
+def test_result_reused(plan_cache, result_cache, tmp_path, monkeypatch):
+    source = LocalRect()
+    source.open_nc(FileName=source.url)
+    bounds = ((-118.6, 33.3), (-118.2, 33.6))
+
+    monkeypatch.setattr(base, "temp_files_dir", tmp_path / "temp")
+    (tmp_path / "temp").mkdir()
+
+    filepath = rect.get_data(source, bounds, False, None)
+    assert Path(filepath).parent == tmp_path / "temp"
+    (cached,) = result_cache.directory.glob("*.nc")
+    assert Path(filepath).read_bytes() == cached.read_bytes()
+
+    # no data should be fetched again
+    def no_write(*args, **kwargs):
+        raise AssertionError("write_nc should not be called")
+    monkeypatch.setattr(LocalRect, "write_nc", no_write)
+
+    assert rect.get_data(source, bounds, False, None) == filepath
+    copy = rect.get_data(source, bounds, False, None, tmp_path)
+    assert Path(copy).read_bytes() == Path(filepath).read_bytes()
+
+    # the file returned doesn't go away with the cache
+    result_cache.clear()
+    assert Path(filepath).read_bytes() == Path(copy).read_bytes()
+
+
+def test_subset_plan_time_normalized(plan_cache):
+    source = LocalRect()
+    source.open_nc(FileName=source.url)
+    bounds = ((-118.6, 33.3), (-118.2, 33.6))
+
+    plan = source.get_subset_plan(bounds, ("2022-01-02T00:00Z", "2022-01-02T03:00"))
+    # the same times, given differently
+    same = source.get_subset_plan(bounds, (datetime.datetime(2022, 1, 2),
+                                           "2022-01-02T05:00:00.000+02:00"))
+    assert same["key"] == plan["key"]
+    assert len(plan_cache) == 1
@@ -0,0 +1,61 @@
+"""
+fixtures for the file_processing tests
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+from netCDF4 import Dataset
+
+EXAMPLE_RECT_FILE = (Path(__file__).parent.parent.parent
+                     / "dummy_sources" / "CAROMS_Example.nc")
+
+
+@pytest.fixture
+def rect_file():
+    """
+    small regular grid file (HYCOM variable names)
+    """
+    return str(EXAMPLE_RECT_FILE)
+
+
+@pytest.fixture
+def roms_file(tmp_path):
+    """
+    small, made up ROMS file
+    """
+    filename = str(tmp_path / "roms_example.nc")
+    ntime, ns, neta, nxi = 12, 3, 9, 11
+
+    ds = Dataset(filename, "w", format="NETCDF3_CLASSIC")
+    ds.createDimension("ocean_time", None)
+    ds.createDimension("s_rho", ns)
+    for grid, (eta, xi) in {"rho": (neta, nxi),
+                            "psi": (neta - 1, nxi - 1),
+                            "u": (neta, nxi - 1),
+                            "v": (neta - 1, nxi)}.items():
+        ds.createDimension(f"eta_{grid}", eta)
+        ds.createDimension(f"xi_{grid}", xi)
+        lat, lon = np.mgrid[0:eta, 0:xi]
+        dims = (f"eta_{grid}", f"xi_{grid}")
+        ds.createVariable(f"lon_{grid}", "f8", dims)[:] = -83 + 0.01 * lon + 0.001 * lat
+        ds.createVariable(f"lat_{grid}", "f8", dims)[:] = 27 + 0.01 * lat
+        ds.createVariable(f"mask_{grid}", "f8", dims)[:] = 1.0
+    ds.createVariable("angle", "f8", ("eta_rho", "xi_rho"))[:] = 0.0
+
+    time = ds.createVariable("ocean_time", "f8", ("ocean_time",))
+    time.units = "hours since 2022-01-01 00:00:00"
+    time[:] = np.arange(ntime)
+
+    rng = np.random.default_rng(0)
+    for var, grid in (("u", "u"), ("v", "v")):
+        dims = ("ocean_time", "s_rho", f"eta_{grid}", f"xi_{grid}")
+        data = ds.createVariable(var, "f4", dims)
+        data.coordinates = f"lon_{grid} lat_{grid} s_rho ocean_time"
+        data.units = "m/s"
+        data[:] = rng.normal(size=[len(ds.dimensions[dim]) if dim != "ocean_time"
+                                   else ntime for dim in dims])
+    ds.close()
+
+    return filename
@@ -0,0 +1,90 @@
+"""
+tests of the chunked, concurrent fetching of data
+"""
+
+import numpy as np
+import pytest
+from netCDF4 import Dataset
+
+from libgoods.file_processing import rect, roms
+from libgoods.file_processing.fetch import split_chunks
+
+RECT_VAR_MAP = {"time": "time",
+                "lon": "lon",
+                "lat": "lat",
+                "u": "water_u",
+                "v": "water_v",
+                }
+
+
+def assert_same_data(file1, file2, varnames):
+    with Dataset(file1) as ds1, Dataset(file2) as ds2:
+        for var in varnames:
+            assert np.array_equal(ds1[var][:], ds2[var][:])
+
+
+def test_split_chunks_time():
+    # 10 x 10 float32 = 400 bytes per time step: 2 steps per chunk
+    chunks = split_chunks((10, 10, 10), 4, [0, 5, 1], (slice(0, 10), slice(0, 10)), 800)
+
+    assert [out for out, _, _ in chunks] == [
+        (slice(0, 2), slice(0, 10), slice(0, 10)),
+        (slice(2, 4), slice(0, 10), slice(0, 10)),
+        (slice(4, 5), slice(0, 10), slice(0, 10)),
+    ]
+    assert chunks[2][1] == (slice(4, 5, 1), slice(0, 10, 1), slice(0, 10, 1))
+    assert [nbytes for _, _, nbytes in chunks] == [800, 800, 400]
+
+
+def test_split_chunks_space():
+    # a single time step is too big: split along y
+    chunks = split_chunks((10, 3, 10, 10), 4, [2, 8, 3], (1, slice(2, 8), slice(0, 10)), 100)
+
+    # 2 time steps x 3 row pairs
+    assert len(chunks) == 6
+    out, inp, nbytes = chunks[1]
+    assert out == (slice(0, 1), slice(2, 4), slice(0, 10))
+    assert inp == (slice(2, 5, 3), 1, slice(4, 6, 1), slice(0, 10, 1))
+    assert nbytes == 80
+
+
+def test_split_chunks_empty():
+    assert split_chunks((10, 10), 4, [5, 5, 1], (slice(0, 10),), 100) == []
+
+
+@pytest.mark.parametrize("max_block_bytes", [2000, 10000])
+def test_rect_streaming_same_as_single_copy(rect_file, tmp_path, max_block_bytes):
+    model = rect()
+    model.fetch_chunk_bytes = 1000
+    model.open_nc(FileName=rect_file)
+    model.get_dimensions(RECT_VAR_MAP)
+    model.subset([33.3, -118.6, 33.6, -118.2])
+
+    model.write_nc(RECT_VAR_MAP, tmp_path / "single.nc", t_index=[2, 20, 1])
+
+    model.get_dimensions(RECT_VAR_MAP, get_xy=False)
+    # small enough that it takes a few chunks
+    model.write_nc(RECT_VAR_MAP, tmp_path / "streamed.nc", t_index=[2, 20, 1],
+                   stream=True, max_block_bytes=max_block_bytes)
+
+    assert_same_data(tmp_path / "single.nc", tmp_path / "streamed.nc",
+                     ["time", "lon", "lat", "water_u", "water_v"])
+
+
+@pytest.mark.parametrize("is3d", [False, True])
+def test_roms_streaming_same_as_single_copy(roms_file, tmp_path, is3d):
+    model = roms()
+    # less than a time step, so it's split in space too
+    model.fetch_chunk_bytes = 100
+    model.open_nc(FileName=roms_file)
+    model.get_dimensions({"time": "ocean_time"})
+    model.subset([27.02, -82.98, 27.06, -82.93], dl=False)
+
+    model.write_nc(ofn=tmp_path / "single.nc", t_index=[0, 12, 2], is3d=is3d)
+
+    model.get_dimensions({"time": "ocean_time"}, get_xy=False)
+    model.write_nc(ofn=tmp_path / "streamed.nc", t_index=[0, 12, 2], is3d=is3d,
+                   stream=True, max_block_bytes=2000)
+
+    assert_same_data(tmp_path / "single.nc", tmp_path / "streamed.nc",
+                     ["ocean_time", "lon_rho", "u", "v"])
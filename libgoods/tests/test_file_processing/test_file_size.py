@@ -0,0 +1,127 @@
+"""
+tests of the output file size computed before writing
+"""
+
+import os
+
+import numpy as np
+import pytest
+from netCDF4 import Dataset
+
+from libgoods import FileTooBigError, cache
+from libgoods.file_processing import base, rect, roms
+from libgoods.file_processing.base import netcdf3_sizes
+
+RECT_VAR_MAP = {"time": "time",
+                "lon": "lon",
+                "lat": "lat",
+                "u": "water_u",
+                "v": "water_v",
+                }
+
+
+def file_size(model, plan, num_timesteps, **kwargs):
+    fixed_size, record_size = netcdf3_sizes(*model.output_structure(plan, **kwargs))
+    return fixed_size + num_timesteps * record_size
+
+
+@pytest.mark.parametrize("num_record_vars", [0, 1, 3])
+def test_netcdf3_sizes(tmp_path, num_record_vars):
+    filename = tmp_path / "test.nc"
+    dimensions = {"time": None, "x": 3, "name": 5}
+    variables = [("x", ("x",), "i2", {"units": "m", "valid_range": np.array([0, 10])}),
+                 ("label", ("name",), "S1", {}),
+                 ("scalar", (), "f8", {"long_name": "a scalar"})]
+    for i in range(num_record_vars):
+        variables.append((f"data{i}", ("time", "x"), "i2", {"scale_factor": 0.5}))
+    global_attrs = {"title": "a test", "version": np.int64(3)}
+
+    with Dataset(filename, "w", format="NETCDF3_CLASSIC") as ds:
+        ds.setncatts(global_attrs)
+        for name, size in dimensions.items():
+            ds.createDimension(name, size)
+        for name, dims, dtype, attrs in variables:
+            var = ds.createVariable(name, dtype, dims)
+            var.setncatts(attrs)
+            if dims and dims[0] == "time":
+                var[:7] = np.ones((7, 3))
+
+    fixed_size, record_size = netcdf3_sizes(dimensions, variables, global_attrs)
+    num_records = 7 if num_record_vars else 0
+    assert fixed_size + num_records * record_size == os.path.getsize(filename)
+
+
+def test_rect_file_size(rect_file, tmp_path):
+    model = rect()
+    model.var_map = RECT_VAR_MAP
+    model.open_nc(FileName=rect_file)
+    model.get_dimensions(RECT_VAR_MAP)
+    model.subset([33.3, -118.6, 33.6, -118.2])
+    plan = {"x": model.x, "y": model.y}
+
+    model.write_nc(RECT_VAR_MAP, tmp_path / "rect.nc", t_index=[3, 20, 2])
+
+    assert file_size(model, plan, 9) == os.path.getsize(tmp_path / "rect.nc")
+
+
+@pytest.mark.parametrize("is3d", [False, True])
+def test_roms_file_size(roms_file, tmp_path, is3d):
+    model = roms()
+    model.open_nc(FileName=roms_file)
+    model.get_dimensions({"time": "ocean_time"})
+    model.subset([27.02, -82.98, 27.06, -82.93], dl=False)
+    plan = {"x": model.x, "y": model.y}
+
+    model.write_nc(ofn=tmp_path / "roms.nc", t_index=[0, 12, 2], is3d=is3d)
+
+    assert (file_size(model, plan, 6, is3d=is3d)
+            == os.path.getsize(tmp_path / "roms.nc"))
+
+
+@pytest.fixture
+def caches(tmp_path, monkeypatch):
+    monkeypatch.setattr(base, "subset_plans", cache.SubsetPlanCache(tmp_path / "plans.json"))
+    monkeypatch.setattr(base, "results", cache.ResultCache(tmp_path / "results"))
+
+
+def make_rect(rect_file):
+    model = rect()
+    model.var_map = RECT_VAR_MAP
+    model.metadata = type("Metadata", (), {"identifier": "TEST_RECT"})
+    model.default_filename = "rect.nc"
+    model.open_nc(FileName=rect_file)
+    return model
+
+
+def test_get_data_refuses_big_file(caches, rect_file, tmp_path, monkeypatch):
+    model = make_rect(rect_file)
+    bounds = ((-118.6, 33.3), (-118.2, 33.6))
+    plan = model.get_subset_plan(bounds)
+
+    def no_write(*args, **kwargs):
+        raise AssertionError("no data should be transferred")
+    monkeypatch.setattr(model, "write_nc", no_write)
+
+    with pytest.raises(FileTooBigError):
+        model.get_data(bounds, False, plan["estimated_file_size"] - 1, tmp_path)
+
+
+def test_get_data_downscale(caches, rect_file, tmp_path):
+    model = make_rect(rect_file)
+    bounds = ((-118.6, 33.3), (-118.2, 33.6))
+    plan = model.get_subset_plan(bounds)
+    max_filesize = model.file_size(plan, plan["num_timesteps"] // 2)
+
+    filepath = model.get_data(bounds, False, max_filesize, tmp_path, downscale=True)
+
+    assert os.path.getsize(filepath) <= max_filesize
+    with Dataset(filepath) as ds:
+        assert 0 < len(ds.dimensions["time"]) < plan["num_timesteps"]
+
+
+def test_downscale_too_big(caches, rect_file):
+    model = make_rect(rect_file)
+    plan = model.get_subset_plan(((-118.6, 33.3), (-118.2, 33.6)))
+
+    with pytest.raises(FileTooBigError):
+        model.downscale(plan, plan["fixed_size"])
@@ -0,0 +1,57 @@
+"""
+tests of the spatial index for curvilinear grids
+"""
+
+import numpy as np
+import pytest
+
+from libgoods.file_processing import grid_index
+from libgoods.file_processing.grid_index import GridIndex
+
+
+def rotated_grid(ny=60, nx=80, angle=0.4):
+    """
+    a curvilinear-ish grid: rotated and warped, with a few NaNs
+    """
+    jj, ii = np.mgrid[0:ny, 0:nx]
+    x = ii * 0.01 + 0.0005 * jj ** 1.5
+    y = jj * 0.01
+    lon = -120 + x * np.cos(angle) - y * np.sin(angle)
+    lat = 33 + x * np.sin(angle) + y * np.cos(angle)
+    lon[5, 7] = np.nan
+    return lon, lat
+
+
+def brute_force(lon, lat, south, west, north, east):
+    with np.errstate(invalid="ignore"):
+        yvec, xvec = np.where((lat >= south) & (lat <= north)
+                              & (lon >= west) & (lon <= east))
+    if len(yvec) == 0:
+        return 0, None, None
+    return len(yvec), [yvec.min(), yvec.max() + 1], [xvec.min(), xvec.max() + 1]
+
+
+@pytest.mark.parametrize("box", [(33.1, -119.9, 33.3, -119.7),
+                                 (32.0, -121.0, 35.0, -118.0),
+                                 (33.2, -np.inf, 33.25, np.inf),
+                                 (33.0, -119.8, 33.01, -119.79),
+                                 (40.0, -119.8, 41.0, -119.7),
+                                 ])
+def test_query_bbox_matches_brute_force(box):
+    lon, lat = rotated_grid()
+    index = GridIndex(lon, lat)
+
+    assert index.query_bbox(*box) == brute_force(lon, lat, *box)
+
+
+def test_get_grid_index_cached():
+    lon, lat = rotated_grid()
+    calls = []
+
+    def read_lonlat():
+        calls.append(1)
+        return lon, lat
+
+    index = grid_index.get_grid_index(("test", "grid"), read_lonlat)
+    assert grid_index.get_grid_index(("test", "grid"), read_lonlat) is index
+    assert len(calls) == 1
@@ -0,0 +1,72 @@
+"""
+tests of the rectangular grid processing
+"""
+
+import numpy as np
+import pytest
+
+from libgoods.file_processing import rect
+from libgoods.file_processing.rect_model import SortedAxis
+
+
+def scan_subset(lat, lon, bbox, dl=0):
+    """
+    the original scanning version of rect.subset
+    """
+    subset_lat = np.nonzero(np.logical_and(lat >= bbox[0], lat <= bbox[2]))[0]
+    if dl == 0:
+        subset_lon = np.nonzero(np.logical_and(lon >= bbox[1], lon <= bbox[3]))[0]
+    else:
+        subset_lon = np.nonzero(np.logical_or(lon >= bbox[1], lon <= bbox[3]))[0]
+    return ([subset_lat[0], subset_lat[-1] + 1, 1],
+            [subset_lon[0], subset_lon[-1] + 1, 1])
+
+
+# HYCOM style 0--360 longitude, shifted to -180--180
+HYCOM_LON = np.arange(0, 360, 0.08)
+HYCOM_LON = (HYCOM_LON > 180).choose(HYCOM_LON, HYCOM_LON - 360)
+
+AXES = {"increasing": np.linspace(-130, -120, 101),
+        "hycom": HYCOM_LON,
+        "decreasing": np.linspace(-120, -130, 101),
+        "unordered": np.random.default_rng(1).uniform(-130, -120, 101),
+        }
+
+
+@pytest.mark.parametrize("axis", AXES)
+@pytest.mark.parametrize("dl", [0, 1])
+def test_subset_matches_scan(axis, dl):
+    lon = AXES[axis]
+    lat = np.linspace(40, 50, 51)
+    model = rect()
+
+    rng = np.random.default_rng(42)
+    for _ in range(100):
+        south, north = np.sort(rng.uniform(40, 50, 2))
+        west, east = np.sort(rng.uniform(-130, -120, 2))
+        bbox = [south, west, north, east]
+        try:
+            expected = scan_subset(lat, lon, bbox, dl)
+        except IndexError:
+            continue
+        model.lat = lat
+        model.lon = lon
+        model.subset(bbox, dl=dl)
+
+        assert (model.y, model.x) == expected
+
+
+def test_sorted_axis_runs():
+    assert len(SortedAxis(AXES["increasing"]).runs) == 1
+    assert len(SortedAxis(AXES["hycom"]).runs) == 2
+    assert SortedAxis(AXES["decreasing"]).runs[0][2]  # reversed
+    assert SortedAxis(AXES["unordered"]).runs is None
+
+
+def test_subset_outside_grid():
+    model = rect()
+    model.lat = np.linspace(40, 50, 51)
+    model.lon = np.linspace(-130, -120, 101)
+
+    with pytest.raises(ValueError):
+        model.subset([10, -130, 20, -120])
@@ -0,0 +1,65 @@
+"""
+tests of selecting time steps by time interval
+"""
+
+import datetime
+
+import pytest
+
+from libgoods.file_processing import base, rect
+
+RECT_VAR_MAP = {"time": "time",
+                "lon": "lon",
+                "lat": "lat",
+                "u": "water_u",
+                "v": "water_v",
+                }
+
+
+@pytest.fixture
+def model(rect_file):
+    # hourly, from 2022-01-01T19:00 to 2022-01-02T19:00
+    model = rect()
+    model.open_nc(FileName=rect_file)
+    model.get_dimensions(RECT_VAR_MAP, get_xy=False)
+    return model
+
+
+@pytest.mark.parametrize("time_interval, stride, expected", [
+    (None, 1, [0, 25, 1]),
+    (("2022-01-01T19:00", "2022-01-02T19:00"), 1, [0, 25, 1]),
+    (("2022-01-02T00:00Z", "2022-01-02T03:00Z"), 1, [5, 9, 1]),
+    # in between time steps
+    (("2022-01-02T00:30", "2022-01-02T03:30"), 1, [6, 9, 1]),
+    # partly outside of the available times
+    (("2021-12-31T00:00", "2022-01-01T21:00"), 3, [0, 3, 3]),
+    ((datetime.datetime(2022, 1, 2, 12), "2022-01-10T00:00"), 2, [17, 25, 2]),
+])
+def test_time_indexes(model, time_interval, stride, expected):
+    assert model.time_indexes(time_interval, stride) == expected
+
+
+@pytest.mark.parametrize("time_interval", [
+    ("2022-02-01T00:00", "2022-02-02T00:00"),
+    ("2022-01-02T00:10", "2022-01-02T00:50"),
+    ("2022-01-02T03:00", "2022-01-02T00:00"),
+])
+def test_time_indexes_no_timesteps(model, time_interval):
+    with pytest.raises(ValueError):
+        model.time_indexes(time_interval)
+
+
+@pytest.mark.parametrize("stride", [0, -1, 1.5])
+def test_time_indexes_bad_stride(model, stride):
+    with pytest.raises(ValueError):
+        model.time_indexes(None, stride)
+
+
+def test_time_axis_cached(model, monkeypatch):
+    time = model.time
+    model.get_dimensions(RECT_VAR_MAP, get_xy=False)
+    assert model.time is time
+
+    monkeypatch.setattr(base, "_time_axes", {})
+    model.get_dimensions(RECT_VAR_MAP, get_xy=False)
+    assert model.time is not time
@@ -0,0 +1,56 @@
+"""
+tests of the model registry
+"""
+
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import libgoods
+from libgoods.manifest import DUMMY_CUR, SOURCES
+from libgoods.registry import ModelRegistry
+
+
+@pytest.fixture
+def registry():
+    return ModelRegistry([{
+        DUMMY_CUR.identifier: SOURCES[DUMMY_CUR.identifier],
+    }])
+
+
+def test_lookup_case_insensitive(registry):
+    assert "DUMMY_CUR" in registry
+    assert "dummy_cur" in registry
+    assert registry["dummy_cur"] is registry["DUMMY_CUR"]
+    assert list(registry) == ["DUMMY_CUR"]
+
+
+def test_new_source_not_shared(registry):
+    source = registry.new_source("dummy_cur")
+    assert type(source) is type(registry["DUMMY_CUR"])
+    assert source is not registry["DUMMY_CUR"]
+    assert source is not registry.new_source("DUMMY_CUR")
+
+
+def test_unknown_model(registry):
+    assert "NOT_A_MODEL" not in registry
+    with pytest.raises(KeyError):
+        registry["NOT_A_MODEL"]
+
+
+def test_metadata_same_as_source(registry):
+    assert registry.get_metadata("dummy_cur") == registry["dummy_cur"].get_metadata()
+    assert registry.list_metadata() == [registry["DUMMY_CUR"].get_metadata()]
+
+
+def test_list_models_imports_no_sources():
+    # run in a fresh interpreter, as other tests have imported everything
+    code = ("import sys; from libgoods import api; api.list_models(); "
+            "print([mod for mod in ('numpy', 'netCDF4', 'libgoods.current_sources.hycom')"
+            " if mod in sys.modules])")
+    output = subprocess.run([sys.executable, "-c", code],
+                            cwd=Path(libgoods.__file__).parent.parent,
+                            capture_output=True, text=True, check=True).stdout
+    assert output.strip() == "[]"
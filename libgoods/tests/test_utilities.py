@@ -2,6 +2,8 @@
 Tests  for the libgoods.utilities package
 """
 
+import datetime
+
 from libgoods import utilities
 
 import pytest
@@ -78,3 +80,16 @@ def test_flatten_bbox():
     fbbox = utilities.flatten_bbox(bbox)
 
     assert fbbox == (23, -88, 24, -87)
+
+
+@pytest.mark.parametrize("time", ["2022-01-17T22:00",
+                                  "2022-01-17T22:00Z",
+                                  "2022-01-17T23:00+01:00",
+                                  datetime.datetime(2022, 1, 17, 22)])
+def test_parse_time(time):
+    assert utilities.parse_time(time) == datetime.datetime(2022, 1, 17, 22)
+
+
+def test_parse_time_invalid():
+    with pytest.raises(ValueError):
+        utilities.parse_time("yesterday")
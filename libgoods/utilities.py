@@ -1,6 +1,8 @@
 """
 assorted utilities useful for libgoods
 """
+import datetime
+
 import numpy as np
 
 def check_valid_latitude(lat):
@@ -106,3 +108,24 @@ def flatten_bbox(bbox):
     max_lon = bbox[1][0]
     max_lat = bbox[1][1]
     return (min_lat, min_lon, max_lat, max_lon)
+
+
+def parse_time(time):
+    """
+    Converts an ISO 8601 string (e.g. "2022-01-17T22:00Z") to a datetime
+
+    Times without a timezone are assumed to be UTC. The returned
+    datetime is naive, in UTC. datetimes are accepted as well.
+    """
+    if not isinstance(time, datetime.datetime):
+        text = str(time).strip()
+        if text.endswith(("Z", "z")):
+            text = text[:-1]
+        try:
+            time = datetime.datetime.fromisoformat(text)
+        except ValueError as err:
+            raise ValueError(f"Invalid time: {text!r}. Should be ISO 8601, "
+                             "e.g. 2022-01-17T22:00") from err
+    if time.tzinfo is not None:
+        time = time.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return time
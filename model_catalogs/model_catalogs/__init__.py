@@ -1,59 +1,182 @@
 """
 Set up for using package.
+
+Importing the package is cheap: the functions are imported from their
+modules (and with them intake, xarray, siphon, etc.) when first used, and
+the catalog files are only copied into the catalog directory when a
+function that needs them is called.
 """
 
+import hashlib
+import os
 import shutil
 
+from importlib import import_module
 from pathlib import Path
 
-from pkg_resources import DistributionNotFound, get_distribution
-
-from .model_catalogs import (  # noqa
-    add_url_path,
-    complete_source_catalog,
-    find_availability,
-    make_catalog,
-    setup_source_catalog,
-)
-from .utils import (  # noqa
-    agg_for_date,
-    find_bbox,
-    find_catrefs,
-    find_filelocs,
-    get_dates_from_ofs,
-)
-
-
-try:
-    __version__ = get_distribution("model_catalogs").version
-except DistributionNotFound:
-    # package is not installed
-    __version__ = "unknown"
-
-
-# set up known locations for catalogs. Can be overwritten HOW
-# By default, put catalog directory in home directory
-CATALOG_PATH = Path.home() / "catalogs"
+
+# where the public functions live, imported on first access
+_LAZY_ATTRS = {
+    "add_url_path": "model_catalogs",
+    "complete_source_catalog": "model_catalogs",
+    "find_availability": "model_catalogs",
+    "get_catalog": "model_catalogs",
+    "make_catalog": "model_catalogs",
+    "setup_source_catalog": "model_catalogs",
+    "AvailabilityStore": "availability",
+    "refresh_all": "availability",
+    "CatalogCrawler": "crawler",
+    "DAPProbe": "dap",
+    "probe_time_range": "dap",
+    "CatalogCache": "thredds_cache",
+    "agg_for_date": "utils",
+    "agg_for_dates": "utils",
+    "find_archive_gaps": "utils",
+    "find_bbox": "utils",
+    "find_catrefs": "utils",
+    "find_filelocs": "utils",
+    "find_gaps": "utils",
+    "find_runs": "utils",
+    "get_dates_from_ofs": "utils",
+    "OFSFileIndex": "utils",
+}
+
+__all__ = sorted(_LAZY_ATTRS) + ["set_catalog_path", "sync_catalogs"]
+
+
+def __getattr__(name):
+    """Import the public functions, and look up the version, on first access."""
+    if name in _LAZY_ATTRS:
+        value = getattr(import_module(f".{_LAZY_ATTRS[name]}", __name__), name)
+    elif name == "__version__":
+        value = _get_version()
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    """Include the lazily imported names."""
+    return sorted(set(globals()) | set(_LAZY_ATTRS) | {"__version__"})
+
+
+def _get_version():
+    try:
+        from importlib.metadata import PackageNotFoundError, version
+    except ImportError:  # Python < 3.8
+        from pkg_resources import DistributionNotFound as PackageNotFoundError
+        from pkg_resources import get_distribution
+
+        def version(name):
+            """Version of the installed distribution name."""
+            return get_distribution(name).version
+
+    try:
+        return version("model_catalogs")
+    except PackageNotFoundError:
+        # package is not installed
+        return "unknown"
+
+
+# catalog files that come with the package
+PKG_CATALOG_PATH_DIR_ORIG = Path(__file__).parent / "catalogs" / "orig"
+SOURCE_TRANSFORM_REPO = Path(__file__).parent / "catalogs" / "transform.yaml"
+
 SOURCE_CATALOG_NAME = "source_catalog.yaml"
-CATALOG_PATH_DIR_ORIG = CATALOG_PATH / "orig"
-CATALOG_PATH_DIR = CATALOG_PATH / "complete"
-CATALOG_PATH_UPDATED = CATALOG_PATH / "updated"
-CATALOG_PATH_TMP = CATALOG_PATH / "tmp"
-SOURCE_TRANSFORM = CATALOG_PATH / "transform.yaml"
-
-# make directories
-# CATALOG_PATH.mkdir(parents=True, exist_ok=True)
-CATALOG_PATH_DIR_ORIG.mkdir(parents=True, exist_ok=True)
-CATALOG_PATH_UPDATED.mkdir(parents=True, exist_ok=True)
-CATALOG_PATH_TMP.mkdir(parents=True, exist_ok=True)
-
-# Move "orig" catalog files to catalog dir
-PKG_CATALOG_PATH_DIR_ORIG = Path(__path__[0]) / "catalogs" / "orig"
-[
-    shutil.copy(fname, CATALOG_PATH_DIR_ORIG)
-    for fname in PKG_CATALOG_PATH_DIR_ORIG.glob("*.yaml")
-]
-
-# Move "transform.yaml" to catalog dir
-SOURCE_TRANSFORM_REPO = Path(__path__[0]) / "catalogs" / "transform.yaml"
-shutil.copy(SOURCE_TRANSFORM_REPO, SOURCE_TRANSFORM)
+
+
+def set_catalog_path(path):
+    """Set the directory the catalogs are kept in.
+
+    All of the catalog locations (`CATALOG_PATH`, `CATALOG_PATH_DIR_ORIG`,
+    `CATALOG_PATH_DIR`, `CATALOG_PATH_UPDATED`, `CATALOG_PATH_TMP`,
+    `SOURCE_TRANSFORM`) are set relative to it. Nothing is created until the
+    catalogs are used.
+
+    Parameters
+    ----------
+    path: str or Path
+        Catalog directory. By default this is the `MODEL_CATALOGS_DIR`
+        environment variable if it is set, otherwise "catalogs" in the home
+        directory.
+    """
+
+    global CATALOG_PATH, CATALOG_PATH_DIR_ORIG, CATALOG_PATH_DIR
+    global CATALOG_PATH_UPDATED, CATALOG_PATH_TMP, SOURCE_TRANSFORM
+
+    CATALOG_PATH = Path(path).expanduser()
+    CATALOG_PATH_DIR_ORIG = CATALOG_PATH / "orig"
+    CATALOG_PATH_DIR = CATALOG_PATH / "complete"
+    CATALOG_PATH_UPDATED = CATALOG_PATH / "updated"
+    CATALOG_PATH_TMP = CATALOG_PATH / "tmp"
+    SOURCE_TRANSFORM = CATALOG_PATH / "transform.yaml"
+
+
+set_catalog_path(os.environ.get("MODEL_CATALOGS_DIR", Path.home() / "catalogs"))
+
+
+def _file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _sync_file(src, dest):
+    """Copy src to dest unless dest already has the same contents."""
+    if (
+        dest.exists()
+        and dest.stat().st_size == src.stat().st_size
+        and _file_hash(dest) == _file_hash(src)
+    ):
+        return False
+    # copy then rename, so another process never reads a partly written file
+    tmp = dest.with_name(f".{dest.name}.{os.getpid()}.tmp")
+    shutil.copyfile(src, tmp)
+    os.replace(tmp, dest)
+    return True
+
+
+# catalog locations that have been synced in this process
+_synced = set()
+
+
+def sync_catalogs(force=False):
+    """Set up the catalog directories and copy the package catalog files in.
+
+    Files are only copied if they are missing or their contents have changed.
+    This is run by the functions that use the catalogs, once per process for
+    each catalog location.
+
+    Parameters
+    ----------
+    force: bool, optional
+        Check the files again even if they were already synced in this process.
+
+    Returns
+    -------
+    List of the files that were copied.
+    """
+
+    locations = (
+        CATALOG_PATH_DIR_ORIG,
+        CATALOG_PATH_UPDATED,
+        CATALOG_PATH_TMP,
+        SOURCE_TRANSFORM,
+    )
+    if locations in _synced and not force:
+        return []
+
+    CATALOG_PATH_DIR_ORIG.mkdir(parents=True, exist_ok=True)
+    CATALOG_PATH_UPDATED.mkdir(parents=True, exist_ok=True)
+    CATALOG_PATH_TMP.mkdir(parents=True, exist_ok=True)
+    SOURCE_TRANSFORM.parent.mkdir(parents=True, exist_ok=True)
+
+    copies = [
+        (fname, CATALOG_PATH_DIR_ORIG / fname.name)
+        for fname in PKG_CATALOG_PATH_DIR_ORIG.glob("*.yaml")
+    ]
+    copies.append((SOURCE_TRANSFORM_REPO, SOURCE_TRANSFORM))
+    copied = [dest for src, dest in copies if _sync_file(src, dest)]
+
+    _synced.add(locations)
+    return copied
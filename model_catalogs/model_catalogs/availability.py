@@ -0,0 +1,298 @@
+"""
+Shared store of the availability of the models.
+
+The start and end of the model output for each model and timing are kept in
+an SQLite database, with the time they were checked, so any number of
+processes can read them at once -- e.g. to show the availability of all of
+the models -- and only check again with the servers once they are older than
+the time to live of their timing. `refresh_all` checks all of the models
+that need it concurrently, in one process at a time.
+"""
+
+import json
+import os
+import sqlite3
+import warnings
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+
+import pandas as pd
+
+import model_catalogs as mc
+
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+# how long availability is used before it is checked again, by timing
+DEFAULT_TTLS = {"forecast": "4 hours", "hindcast": "1 day"}
+# for timings not in the ttls
+DEFAULT_TTL = "1 minute"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS availability (
+    model TEXT NOT NULL,
+    timing TEXT NOT NULL,
+    start_datetime TEXT,
+    end_datetime TEXT,
+    time_last_checked TEXT NOT NULL,
+    start_catref TEXT,
+    end_catref TEXT,
+    PRIMARY KEY (model, timing)
+)
+"""
+
+
+@contextmanager
+def _file_lock(path):
+    """Hold an exclusive lock on the file at path, waiting for it if needed."""
+    with open(path, "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class AvailabilityStore:
+    """Availability of the models, in an SQLite database.
+
+    Parameters
+    ----------
+    path: str or Path, optional
+        Location of the database. Defaults to "availability.sqlite" in
+        `mc.CATALOG_PATH`.
+    ttls: dict, optional
+        Time to live of the availability of each timing, e.g. {"forecast":
+        "4 hours"}, as anything `pd.Timedelta` takes. Defaults to
+        `DEFAULT_TTLS`.
+    """
+
+    def __init__(self, path=None, ttls=None):
+        if path is None:
+            path = mc.CATALOG_PATH / "availability.sqlite"
+        self.path = str(path)
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._connect() as conn:
+            # readers don't wait for a writer
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=60)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def ttl(self, timing):
+        """Time to live of the availability of timing, as a pd.Timedelta."""
+        return pd.Timedelta(self.ttls.get(timing, DEFAULT_TTL))
+
+    def is_fresh(self, timing, time_last_checked):
+        """Whether availability of timing checked at time_last_checked is still good."""
+        age = pd.Timestamp.now() - pd.Timestamp(time_last_checked)
+        return age <= self.ttl(timing)
+
+    def put(
+        self,
+        model,
+        timing,
+        start_datetime,
+        end_datetime,
+        time_last_checked=None,
+        start_catref=None,
+        end_catref=None,
+    ):
+        """Save the availability of a model and timing.
+
+        Parameters
+        ----------
+        model, timing: str
+        start_datetime, end_datetime: str of datetime or pd.Timestamp
+            First and last times of the model output.
+        time_last_checked: str of datetime or pd.Timestamp, optional
+            When the availability was found. Defaults to now.
+        start_catref, end_catref: list, optional
+            The oldest and newest catalog directories with model output.
+        """
+
+        if time_last_checked is None:
+            time_last_checked = pd.Timestamp.now()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO availability VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    model.upper(),
+                    timing,
+                    str(start_datetime),
+                    str(end_datetime),
+                    str(time_last_checked),
+                    None if start_catref is None else json.dumps(list(start_catref)),
+                    None if end_catref is None else json.dumps(list(end_catref)),
+                ),
+            )
+
+    def put_catalog(self, model, cat):
+        """Save the availability in the metadata of each timing of a catalog.
+
+        Parameters
+        ----------
+        model: str
+        cat: Intake catalog
+            Catalog of the model, e.g. from `find_availability`.
+        """
+        for timing in cat:
+            metadata = cat[timing].metadata
+            if "start_datetime" not in metadata:
+                continue
+            self.put(
+                model,
+                timing,
+                metadata["start_datetime"],
+                metadata["end_datetime"],
+                metadata.get("time_last_checked"),
+                metadata.get("start_catref"),
+                metadata.get("end_catref"),
+            )
+
+    def get(self, models=None):
+        """Return the saved availability.
+
+        Parameters
+        ----------
+        models: list, optional
+            Names of models. Defaults to all of those in the store.
+
+        Returns
+        -------
+        Dict of the availability of each timing, by model. The availability is
+        a dict of "start_datetime", "end_datetime", "time_last_checked",
+        "start_catref", "end_catref", and "fresh", whether it is still within
+        its time to live.
+        """
+
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT model, timing, start_datetime, end_datetime, "
+                "time_last_checked, start_catref, end_catref FROM availability"
+            ).fetchall()
+
+        if models is not None:
+            models = {model.upper() for model in models}
+
+        def catref(value):
+            """Decode a catalog reference saved as JSON."""
+            return None if value is None else json.loads(value)
+
+        availability = {}
+        for model, timing, start, end, checked, start_catref, end_catref in rows:
+            if models is not None and model not in models:
+                continue
+            availability.setdefault(model, {})[timing] = {
+                "start_datetime": start,
+                "end_datetime": end,
+                "time_last_checked": checked,
+                "start_catref": catref(start_catref),
+                "end_catref": catref(end_catref),
+                "fresh": self.is_fresh(timing, checked),
+            }
+        return availability
+
+    @contextmanager
+    def lock(self):
+        """Hold the refresh lock of the store, so only one process refreshes at once."""
+        with _file_lock(f"{self.path}.lock"):
+            yield
+
+
+def refresh_all(models=None, max_workers=8, store=None, override_updated=False):
+    """Find the availability of many models at once.
+
+    The models with no availability in the store, or with a timing whose
+    availability is older than its time to live, are checked concurrently
+    with `find_availability`. Only one process refreshes a store at a time;
+    the others wait, then find the availability already fresh.
+
+    A model that can't be checked doesn't stop the others: a RuntimeWarning
+    lists the models that failed, and they are left out of the result, unless
+    the store has older availability for them.
+
+    Parameters
+    ----------
+    models: list, optional
+        Names of models. Defaults to all of those in the source catalog.
+    max_workers: int, optional
+        Number of models checked at the same time.
+    store: AvailabilityStore, optional
+        Defaults to the store in `mc.CATALOG_PATH`.
+    override_updated: bool, optional
+        Check all of the models again, whether fresh or not, crawling their
+        catalogs from the start -- see `find_availability`.
+
+    Returns
+    -------
+    Dict of the availability of each timing, by model, as `AvailabilityStore.get`.
+
+    Examples
+    --------
+    >>> availability = mc.refresh_all()
+    >>> availability["CBOFS"]["forecast"]["end_datetime"]
+    """
+
+    if store is None:
+        store = mc.AvailabilityStore()
+    if models is None:
+        models = list(mc.setup_source_catalog())
+    models = [model.upper() for model in models]
+
+    with store.lock():
+        # after waiting for the lock, since another process may have just refreshed
+        current = store.get(models)
+        stale = [
+            model
+            for model in models
+            if override_updated
+            or model not in current
+            or not all(record["fresh"] for record in current[model].values())
+        ]
+
+        failed = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(
+                    mc.find_availability,
+                    model,
+                    override_updated=override_updated,
+                    store=store,
+                ): model
+                for model in stale
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    failed[futures[future]] = e
+
+    if failed:
+        warnings.warn(
+            "Could not find the availability of: "
+            + ", ".join(f"{model} ({error!r})" for model, error in failed.items()),
+            RuntimeWarning,
+        )
+    return store.get(models)
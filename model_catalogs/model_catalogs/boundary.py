@@ -0,0 +1,220 @@
+"""
+Model domain boundaries, derived from the grid.
+
+For structured grids the domain is the union of the wet cells of the mask,
+built from the runs of wet cells in each row. For unstructured (FVCOM)
+meshes it is made of the element edges that belong to only one element.
+Either way it takes a few array operations instead of an alpha shape of
+every grid point.
+
+Boundaries are cached by a hash of the grid, in memory and on disk, so they
+are only computed once per grid.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+import shapely
+import shapely.ops
+
+import model_catalogs as mc
+
+
+# change this if the boundaries computed for a grid change, to invalidate the cache
+BOUNDARY_VERSION = 1
+
+_boundaries = {}
+_boundaries_lock = threading.Lock()
+
+
+def grid_hash(*arrays):
+    """Return a hash of the contents, shapes and dtypes of arrays."""
+    sha = hashlib.sha256(f"boundary-v{BOUNDARY_VERSION}".encode())
+    for array in arrays:
+        if array is None:
+            sha.update(b"none")
+            continue
+        array = np.ascontiguousarray(array)
+        sha.update(f"{array.dtype.str}{array.shape}".encode())
+        sha.update(array.data)
+    return sha.hexdigest()
+
+
+def _interp(values, x, y):
+    """Bilinearly interpolate a 2D array at fractional indexes, clamped to the grid."""
+    ny, nx = values.shape
+    x = np.clip(x, 0, nx - 1)
+    y = np.clip(y, 0, ny - 1)
+    i0 = np.minimum(np.floor(x).astype(int), nx - 2)
+    j0 = np.minimum(np.floor(y).astype(int), ny - 2)
+    fx = x - i0
+    fy = y - j0
+    return (
+        values[j0, i0] * (1 - fx) * (1 - fy)
+        + values[j0, i0 + 1] * fx * (1 - fy)
+        + values[j0 + 1, i0] * (1 - fx) * fy
+        + values[j0 + 1, i0 + 1] * fx * fy
+    )
+
+
+def structured_boundary(lon, lat, mask):
+    """Find the boundary of the wet part of a structured grid.
+
+    Parameters
+    ----------
+    lon, lat: arrays
+        Grid point locations: 2D, or 1D for rectilinear grids.
+    mask: 2D array
+        1 for wet grid points.
+
+    Returns
+    -------
+    shapely Polygon or MultiPolygon, in lon/lat.
+    """
+
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    if lon.ndim == 1 and lat.ndim == 1:
+        lon, lat = np.meshgrid(lon, lat)
+    wet = np.nan_to_num(np.asarray(mask, dtype=float)) == 1
+    if wet.ndim != 2 or lon.shape != wet.shape or lat.shape != wet.shape:
+        raise ValueError("lon, lat and mask must be on the same 2D grid")
+    if min(wet.shape) < 2 or not wet.any():
+        raise ValueError("grid is too small or has no wet points")
+
+    # runs of wet points along each row, as boxes in index space: each grid
+    # point is the center of a unit cell
+    padded = np.zeros((wet.shape[0], wet.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = wet
+    steps = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(steps == 1)
+    _, stops = np.nonzero(steps == -1)
+    boxes = shapely.box(starts - 0.5, rows - 0.5, stops - 0.5, rows + 0.5)
+    # smooth the stair steps of the cell edges away
+    outline = shapely.union_all(boxes).simplify(0.5)
+
+    def to_lonlat(coords):
+        """Map coordinates in index space to lon/lat."""
+        x, y = coords[:, 0], coords[:, 1]
+        return np.column_stack((_interp(lon, x, y), _interp(lat, x, y)))
+
+    outline = shapely.transform(outline, to_lonlat)
+    if not np.isfinite(shapely.get_coordinates(outline)).all():
+        raise ValueError("lon/lat are not defined everywhere along the boundary")
+    return outline
+
+
+def unstructured_boundary(lon, lat, nv):
+    """Find the boundary of an unstructured triangular mesh.
+
+    Parameters
+    ----------
+    lon, lat: 1D arrays
+        Node locations.
+    nv: 2D array
+        Nodes of each element, (3, nele) or (nele, 3). 1-based, as in FVCOM
+        output, if there is no 0.
+
+    Returns
+    -------
+    shapely Polygon or MultiPolygon, in lon/lat.
+    """
+
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    nv = np.asarray(nv).astype(np.int64)
+    if nv.ndim != 2 or 3 not in nv.shape or lon.ndim != 1 or lon.shape != lat.shape:
+        raise ValueError("need 1D node lon/lat and a 2D nv")
+    if nv.shape[1] != 3:
+        nv = nv.T
+    if nv.min() >= 1:
+        nv = nv - 1
+    if nv.max() >= len(lon):
+        raise ValueError("nv refers to nodes that aren't in lon/lat")
+
+    # the edges that belong to only one element
+    edges = np.concatenate((nv[:, [0, 1]], nv[:, [1, 2]], nv[:, [2, 0]]))
+    edges = np.sort(edges, axis=1)
+    codes, counts = np.unique(edges[:, 0] * len(lon) + edges[:, 1], return_counts=True)
+    codes = codes[counts == 1]
+    edges = np.column_stack((codes // len(lon), codes % len(lon)))
+
+    coords = np.stack((lon[edges], lat[edges]), axis=-1)
+    if not np.isfinite(coords).all():
+        raise ValueError("lon/lat are not defined everywhere along the boundary")
+    faces = list(shapely.ops.polygonize(shapely.linestrings(coords)))
+    if not faces:
+        raise ValueError("boundary edges don't make a polygon")
+
+    # islands are faces too: leave out the faces that fill the holes of others
+    holes = shapely.union_all(
+        [shapely.Polygon(ring) for face in faces for ring in face.interiors]
+    )
+    domain = shapely.union_all(
+        [face for face in faces if not holes.contains(face.representative_point())]
+    )
+
+    # about half a boundary edge
+    lengths = np.hypot(*np.diff(coords, axis=1)[:, 0, :].T)
+    return domain.simplify(float(np.median(lengths)) / 2)
+
+
+def _boundary_path(key):
+    return os.path.join(mc.CATALOG_PATH, "boundaries", f"{key}.json")
+
+
+def grid_boundary(lon, lat, mask=None, nv=None):
+    """Find the bounding box and boundary of a model domain, from its grid.
+
+    The result is cached by a hash of the grid, in memory and in the
+    "boundaries" directory of `mc.CATALOG_PATH`.
+
+    Parameters
+    ----------
+    lon, lat: arrays
+        Grid point or node locations.
+    mask: 2D array, optional
+        Wet/dry mask, for structured grids.
+    nv: 2D array, optional
+        Nodes of each element, for unstructured grids.
+
+    Returns
+    -------
+    List of the bounding box, [min_lon, min_lat, max_lon, max_lat], and wkt of
+    the boundary.
+
+    Raises
+    ------
+    ValueError if the boundary can't be found this way.
+    """
+
+    key = grid_hash(np.asarray(lon), np.asarray(lat), mask, nv)
+    with _boundaries_lock:
+        if key in _boundaries:
+            return _boundaries[key]
+    path = _boundary_path(key)
+    try:
+        with open(path) as f:
+            result = json.load(f)
+        result = (result["bounds"], result["wkt"])
+    except (OSError, ValueError, KeyError):
+        if nv is not None:
+            outline = unstructured_boundary(lon, lat, nv)
+        elif mask is not None:
+            outline = structured_boundary(lon, lat, mask)
+        else:
+            raise ValueError("need a mask or the element nodes (nv)")
+        result = (list(outline.bounds), outline.wkt)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"bounds": result[0], "wkt": result[1]}, f)
+        os.replace(tmp, path)
+
+    with _boundaries_lock:
+        _boundaries[key] = result
+    return result
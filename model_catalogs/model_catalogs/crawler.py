@@ -0,0 +1,417 @@
+"""
+Crawling of thredds catalogs.
+
+A `CatalogCrawler` fetches each catalog node at most once, and follows
+catalog references concurrently with a bounded pool of threads that share
+one pool of HTTP connections. The catalogs are also kept in an on-disk
+cache (see thredds_cache.py), so other crawlers and processes can reuse them.
+"""
+
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from siphon.catalog import TDSCatalog
+from siphon.http_util import session_manager
+
+import model_catalogs as mc
+
+from .thredds_cache import CachingSession, CatalogCache
+
+
+DEFAULT_MAX_WORKERS = 8
+
+
+def _labels(cat):
+    """Numerical catalog references of a catalog, in date order."""
+    return sorted((label for label in cat.catalog_refs if label.isnumeric()), key=int)
+
+
+def _catref_key(catref):
+    return tuple(int(label) for label in catref)
+
+
+def _not_before(catref, after):
+    """Whether catref, or a part of the tree under it, is not before `after`."""
+    return _catref_key(catref) >= _catref_key(after[: len(catref)])
+
+
+class _SharedSessionCatalog(TDSCatalog):
+    """TDSCatalog that makes its requests with a given session.
+
+    siphon creates a new `requests.Session` for every catalog, so no
+    connection is ever reused. The `session` property makes the catalog use
+    the crawler's session instead of the one siphon creates. The catalog
+    doesn't own that session, so unlike a TDSCatalog it doesn't close it when
+    it is deleted.
+    """
+
+    def __init__(self, catalog_url, session):
+        self._shared_session = session
+        super().__init__(catalog_url)
+
+    @property
+    def session(self):
+        """Session shared by the catalogs of a crawler."""
+        return self._shared_session
+
+    @session.setter
+    def session(self, value):
+        # the session siphon made for this catalog is not needed
+        value.close()
+
+    def __del__(self):
+        """Leave the shared session open."""
+
+
+class CatalogCrawler:
+    """Fetch and follow thredds catalogs, fetching each one at most once.
+
+    Parameters
+    ----------
+    max_workers: int, optional
+        Number of catalogs fetched at the same time.
+    session: requests.Session, optional
+        Session to make the requests with. By default, a session with a
+        connection pool big enough for `max_workers` is made.
+    cache: CatalogCache or False, optional
+        On-disk cache of the catalogs, shared between crawlers and processes.
+        By default, the cache in the "thredds" directory of `mc.CATALOG_PATH` is
+        used. If False, every catalog is fetched from the server.
+
+    Examples
+    --------
+
+    Use one crawler for all of the lookups in one catalog:
+
+    >>> with mc.CatalogCrawler() as crawler:
+    ...     catrefs = crawler.find_catrefs(catloc)
+    ...     filelocs = crawler.find_filelocs(catrefs[0], catloc)
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, session=None, cache=None):
+        self.max_workers = max_workers
+        self._own_session = session is None
+        if session is None:
+            session = session_manager.create_session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=max_workers, pool_maxsize=max_workers
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self.session = session
+        if cache is None:
+            cache = CatalogCache(mc.CATALOG_PATH / "thredds")
+        self.cache = cache or None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        # Future for each catalog url, so concurrent requests for a url share one fetch
+        self._nodes = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        """Use the crawler in a with block, which closes it at the end."""
+        return self
+
+    def __exit__(self, *args):
+        """Close the crawler."""
+        self.close()
+
+    def close(self):
+        """Stop the threads, and close the session if the crawler made it."""
+        self._executor.shutdown(wait=True)
+        if self._own_session:
+            self.session.close()
+
+    def _fetch(self, url):
+        session = self.session
+        if self.cache is not None:
+            session = CachingSession(session, self.cache)
+        return _SharedSessionCatalog(url, session)
+
+    def _future(self, url):
+        with self._lock:
+            future = self._nodes.get(url)
+            if future is not None and not (future.done() and future.exception()):
+                return future
+            future = self._executor.submit(self._fetch, url)
+            self._nodes[url] = future
+        # outside the lock: the callback runs right away if the fetch is done
+        future.add_done_callback(lambda f: self._forget_failed(url, f))
+        return future
+
+    def _forget_failed(self, url, future):
+        # so a failed fetch can be tried again
+        if future.exception() is not None:
+            with self._lock:
+                if self._nodes.get(url) is future:
+                    del self._nodes[url]
+
+    def catalog(self, url):
+        """Return the catalog at url, fetching it if it hasn't been already.
+
+        Parameters
+        ----------
+        url: str
+            Location of thredds catalog.
+
+        Returns
+        -------
+        siphon TDSCatalog.
+        """
+        return self._future(url).result()
+
+    def catalogs(self, urls):
+        """Return the catalogs at urls, fetching those that haven't been concurrently.
+
+        Parameters
+        ----------
+        urls: list
+            Locations of thredds catalogs.
+
+        Returns
+        -------
+        List of siphon TDSCatalogs, in the order of urls.
+        """
+        futures = [self._future(url) for url in urls]
+        return [future.result() for future in futures]
+
+    def follow(self, catloc, catref):
+        """Follow a hierarchy of catalog references down from catloc.
+
+        Parameters
+        ----------
+        catloc: str
+            Base thredds catalog location.
+        catref: tuple
+            Labels of the catalog references to follow from catloc.
+
+        Returns
+        -------
+        siphon TDSCatalog at the end of catref.
+        """
+        cat = self.catalog(catloc)
+        for label in catref:
+            cat = self.catalog(cat.catalog_refs[label].href)
+        return cat
+
+    def find_catrefs(self, catloc):
+        """Find hierarchy of catalog references for thredds catalog.
+
+        Parameters
+        ----------
+        catloc: str
+            Search in thredds catalog structure from base catalog, catloc.
+
+        Returns
+        -------
+        list of tuples containing the hierarchy of directories in the thredds catalog
+        structure to get to where the datafiles start.
+        """
+
+        # 0th level catalog
+        cat = self.catalog(catloc)
+        # only keep numerical directories
+        catrefs0 = [catref for catref in cat.catalog_refs if catref.isnumeric()]
+
+        # 1st level catalogs, fetched together
+        cats1 = self.catalogs([cat.catalog_refs[catref].href for catref in catrefs0])
+        catrefs = [
+            (catref0, catref1)
+            for catref0, cat1 in zip(catrefs0, cats1)
+            for catref1 in cat1.catalog_refs
+        ]
+        # Check first one to see if there are more catalog references or not
+        if len(self.follow(catloc, catrefs[0]).catalog_refs) > 1:
+            cats1 = {catref0: cat1 for catref0, cat1 in zip(catrefs0, cats1)}
+            cats2 = self.catalogs(
+                [
+                    cats1[catref0].catalog_refs[catref1].href
+                    for catref0, catref1 in catrefs
+                ]
+            )
+            catrefs = [
+                (catref0, catref1, catref2)
+                for (catref0, catref1), cat2 in zip(catrefs, cats2)
+                for catref2 in cat2.catalog_refs
+            ]
+
+        return catrefs
+
+    def depth(self, catloc):
+        """Number of levels of catalog references from catloc to the data files.
+
+        Found by following the newest references down, e.g. 2 for year/month
+        directories and 3 for year/month/day directories.
+        """
+        catref = ()
+        while True:
+            labels = _labels(self.follow(catloc, catref))
+            if not labels:
+                return len(catref)
+            catref += (labels[-1],)
+
+    def leaf_catrefs(self, catloc, after=None):
+        """Find the catalog references of the directories with the data files.
+
+        Unlike `find_catrefs`, the directories with the data files themselves
+        are not fetched, and with `after` only the part of the tree that is not
+        before it is crawled.
+
+        Parameters
+        ----------
+        catloc: str
+            Base thredds catalog location.
+        after: tuple, optional
+            Catalog reference, e.g. ("2022", "02"). Only it and the ones after it
+            are returned.
+
+        Returns
+        -------
+        List of tuples of the catalog references, oldest first.
+        """
+
+        depth = self.depth(catloc)
+        if depth == 0:
+            return []
+
+        level = {(): self.catalog(catloc)}
+        for _ in range(depth - 1):
+            catrefs = [
+                catref + (label,)
+                for catref, cat in level.items()
+                for label in _labels(cat)
+                if after is None or _not_before(catref + (label,), after)
+            ]
+            cats = self.catalogs(
+                [level[catref[:-1]].catalog_refs[catref[-1]].href for catref in catrefs]
+            )
+            level = dict(zip(catrefs, cats))
+
+        catrefs = [
+            catref + (label,)
+            for catref, cat in level.items()
+            for label in _labels(cat)
+            if after is None or _not_before(catref + (label,), after)
+        ]
+        return sorted(catrefs, key=_catref_key)
+
+    def find_boundaries(self, catloc, has_files, previous=None):
+        """Find the oldest and newest directories with data files.
+
+        The newest is found by checking directories from the newest back, and
+        the oldest by binary search, assuming the directories between the two
+        all have files. With the boundaries from a previous run, only the
+        directories from the previous newest one on are crawled.
+
+        Parameters
+        ----------
+        catloc: str
+            Base thredds catalog location.
+        has_files: function
+            Called with a catalog reference, returns whether the directory has
+            the data files being looked for.
+        previous: tuple, optional
+            The (oldest, newest) catalog references found by a previous run.
+
+        Returns
+        -------
+        (oldest, newest) catalog references, or (None, None) if there are no
+        data files.
+        """
+
+        def exists_with_files(catref):
+            """Whether catref is still there, and has data files."""
+            try:
+                return has_files(catref)
+            except KeyError:
+                # the directory is gone
+                return False
+
+        if previous is not None and all(previous):
+            start, end = (tuple(catref) for catref in previous)
+            catrefs = self.leaf_catrefs(catloc, after=end)
+            newest = next(
+                (catref for catref in catrefs[::-1] if exists_with_files(catref)), None
+            )
+            if newest is None:
+                # the previous newest directory has gone, start over
+                return self.find_boundaries(catloc, has_files)
+            # the oldest is unchanged unless its files have been removed
+            if exists_with_files(start):
+                return start, newest
+            catrefs = self.leaf_catrefs(catloc, after=start)
+        else:
+            catrefs = self.leaf_catrefs(catloc)
+            newest = next(
+                (catref for catref in catrefs[::-1] if has_files(catref)), None
+            )
+            if newest is None:
+                return None, None
+
+        catrefs = catrefs[: catrefs.index(newest) + 1]
+        lo, hi = 0, len(catrefs) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if has_files(catrefs[mid]):
+                hi = mid
+            else:
+                lo = mid + 1
+        return catrefs[lo], newest
+
+    def prefetch(self, catloc, catrefs):
+        """Fetch the catalogs of many catalog references concurrently.
+
+        Later lookups of them, e.g. with `find_filelocs`, are then answered
+        without waiting.
+
+        Parameters
+        ----------
+        catloc: str
+            Base thredds catalog location.
+        catrefs: list
+            Tuples of catalog references from catloc.
+        """
+
+        catrefs = [tuple(catref) for catref in catrefs]
+        known = {(): self.catalog(catloc)}
+        for level in range(1, max(map(len, catrefs), default=0) + 1):
+            refs = sorted(
+                {catref[:level] for catref in catrefs if len(catref) >= level}
+            )
+            refs = [ref for ref in refs if ref not in known]
+            cats = self.catalogs(
+                [known[ref[:-1]].catalog_refs[ref[-1]].href for ref in refs]
+            )
+            known.update(zip(refs, cats))
+
+    def find_filelocs(self, catref, catloc, filetype="fields"):
+        """Find thredds file locations.
+
+        Parameters
+        ----------
+        catref: tuple
+            2 or 3 labels describing the directories from catlog to get the data
+            locations.
+        catloc: str
+            Base thredds catalog location.
+        filetype: str
+            Which filetype to use. Every NOAA OFS model has "fields" available, but
+            some have "regulargrid"or "2ds" also (listed in separate catalogs in the
+            model name).
+
+        Returns
+        -------
+        Locations of files found from catloc to hierarchical location described by
+        catref.
+        """
+
+        last_cat = self.follow(catloc, catref)
+        return [
+            last_cat.datasets[dataset].access_urls["OPENDAP"]
+            for dataset in last_cat.datasets
+            if "stations" not in dataset
+            and "vibrioprob" not in dataset
+            and filetype in dataset
+        ]
@@ -0,0 +1,240 @@
+"""
+Probing of OPeNDAP datasets for their dimensions and time range.
+
+Opening a remote dataset with xarray reads the metadata of every variable and
+the whole of every coordinate. To find the first and last times of a model's
+output only the DDS (the structure of the dataset), the DAS (its attributes)
+and two values of the time coordinate are needed, which a `DAPProbe` gets
+with small requests:
+
+* the DDS, for the current length of the time dimension,
+* the first and last time values, in one request with a stride,
+* the DAS, for the units of time, only the first time a dataset is probed.
+
+The probes are cached for a short time, so repeated availability checks
+don't repeat the requests.
+"""
+
+import re
+import threading
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+import requests
+import xarray as xr
+
+
+# seconds a probed time range is used before the dataset is probed again
+DEFAULT_TTL = 60
+
+# declaration of a variable in a DDS, e.g. "Float64 time[time = 169];"
+_DDS_VARIABLE = re.compile(
+    r"^\s*\w+\s+(\w+)((?:\s*\[\s*\w+\s*=\s*\d+\s*\])+)\s*;", re.M
+)
+_DDS_DIMENSION = re.compile(r"\[\s*(\w+)\s*=\s*(\d+)\s*\]")
+_NUMBER = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+
+
+def parse_dds(text):
+    """Find the dimensions of the variables in a DDS.
+
+    Parameters
+    ----------
+    text: str
+        DDS response of an OPeNDAP server.
+
+    Returns
+    -------
+    Dict of the (dimension name, size) pairs of each variable, by variable name.
+    The first declaration of a variable is used, e.g. the time coordinate and
+    not the map of a grid.
+    """
+    variables = {}
+    for match in _DDS_VARIABLE.finditer(text):
+        dims = [(name, int(size)) for name, size in _DDS_DIMENSION.findall(match[2])]
+        variables.setdefault(match[1], dims)
+    return variables
+
+
+def parse_das(text, variable):
+    """Find the string attributes of a variable in a DAS.
+
+    Parameters
+    ----------
+    text: str
+        DAS response of an OPeNDAP server.
+    variable: str
+        Name of variable.
+
+    Returns
+    -------
+    Dict of the string attributes of the variable, e.g. "units".
+    """
+    block = re.search(
+        rf"^\s*{re.escape(variable)}\s*\{{(.*?)^\s*\}}", text, flags=re.M | re.S
+    )
+    if block is None:
+        return {}
+    return dict(re.findall(r'String\s+(\w+)\s+"((?:[^"\\]|\\.)*)"\s*;', block[1]))
+
+
+def parse_ascii(text, variable):
+    """Find the values of a variable in an ASCII response.
+
+    Both the THREDDS ("time[2]" then the values) and GrADS Data Server
+    ("time, [2]" then the values) layouts are read.
+
+    Returns
+    -------
+    Array of floats.
+    """
+    # the data come after the structure, following a line of dashes
+    text = re.split(r"^-{5,}\s*$", text, maxsplit=1, flags=re.M)[-1]
+    lines = text.strip().splitlines()
+    for i, line in enumerate(lines, start=1):
+        if line.strip().startswith(variable):
+            values = " ".join(lines[i:])
+            return np.array([float(value) for value in _NUMBER.findall(values)])
+    raise ValueError(f"No values of {variable} in response.")
+
+
+class DAPProbe:
+    """Probe OPeNDAP datasets for their dimensions and first and last times.
+
+    Parameters
+    ----------
+    session: requests.Session, optional
+        Session to make requests with.
+    ttl: float, optional
+        Seconds a probed time range is used before the dataset is probed again.
+
+    Examples
+    --------
+    >>> probe = DAPProbe()
+    >>> start, end = probe.time_range(url)
+    """
+
+    def __init__(self, session=None, ttl=DEFAULT_TTL):
+        self.session = requests.Session() if session is None else session
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # units and calendar of the time variable, by (url, variable)
+        self._time_attrs = {}
+        # (time checked, (start, end)), by (url, variable)
+        self._time_ranges = {}
+
+    def _get(self, url):
+        resp = self.session.get(url)
+        resp.raise_for_status()
+        return resp.text
+
+    def dimensions(self, url):
+        """Return the dimensions of the variables of the dataset at url.
+
+        Returns
+        -------
+        Dict of the (dimension name, size) pairs of each variable, by variable
+        name -- see `parse_dds`.
+        """
+        return parse_dds(self._get(f"{url}.dds"))
+
+    def _time_variable(self, variables, time_name):
+        if time_name is not None:
+            return time_name
+        # a coordinate variable: one dimension, of the same name
+        coords = [
+            name for name, dims in variables.items() if [name] == [d for d, _ in dims]
+        ]
+        if "time" in coords:
+            return "time"
+        if coords:
+            return coords[0]
+        raise ValueError("No time coordinate found.")
+
+    def time_range(self, url, time_name=None):
+        """Return the first and last times of the dataset at url.
+
+        Parameters
+        ----------
+        url: str
+            OPeNDAP location of the dataset.
+        time_name: str, optional
+            Name of the time coordinate. Defaults to "time", or else the first
+            coordinate variable.
+
+        Returns
+        -------
+        Tuple of pd.Timestamps.
+        """
+
+        key = (url, time_name)
+        with self._lock:
+            cached = self._time_ranges.get(key)
+        if cached is not None and time.time() - cached[0] < self.ttl:
+            return cached[1]
+
+        variables = self.dimensions(url)
+        name = self._time_variable(variables, time_name)
+        if name not in variables or len(variables[name]) != 1:
+            raise ValueError(f"{name} is not a one-dimensional variable of {url}.")
+        size = variables[name][0][1]
+        if size == 0:
+            raise ValueError(f"{name} of {url} is empty.")
+
+        if (url, name) not in self._time_attrs:
+            attrs = parse_das(self._get(f"{url}.das"), name)
+            if "since" not in attrs.get("units", ""):
+                raise ValueError(f"{name} of {url} doesn't have units of time.")
+            self._time_attrs[(url, name)] = (attrs["units"], attrs.get("calendar"))
+        units, calendar = self._time_attrs[(url, name)]
+
+        # the first and last values, with a stride between them
+        hyperslab = f"[0:{size - 1}:{size - 1}]" if size > 1 else "[0]"
+        values = parse_ascii(self._get(f"{url}.ascii?{name}{hyperslab}"), name)
+        with warnings.catch_warnings():
+            # e.g. about the reference dates of GrADS Data Server datasets
+            warnings.simplefilter("ignore", xr.SerializationWarning)
+            times = xr.coding.times.decode_cf_datetime(values, units, calendar)
+        result = (pd.Timestamp(str(times[0])), pd.Timestamp(str(times[-1])))
+
+        with self._lock:
+            self._time_ranges[key] = (time.time(), result)
+        return result
+
+    def clear(self):
+        """Forget the probed datasets."""
+        with self._lock:
+            self._time_attrs.clear()
+            self._time_ranges.clear()
+
+
+# shared by the probes of a process
+_probe = None
+_probe_lock = threading.Lock()
+
+
+def probe_time_range(urlpath, time_name=None):
+    """Return the first and last times of model output, from the OPeNDAP headers.
+
+    Parameters
+    ----------
+    urlpath: str or list
+        OPeNDAP location(s) of the model output. With many, the earliest first
+        time and latest last time are returned.
+    time_name: str, optional
+        Name of the time coordinate -- see `DAPProbe.time_range`.
+
+    Returns
+    -------
+    Tuple of pd.Timestamps.
+    """
+
+    global _probe
+    with _probe_lock:
+        if _probe is None:
+            _probe = DAPProbe()
+    urls = urlpath if isinstance(urlpath, (list, tuple)) else [urlpath]
+    ranges = [_probe.time_range(url, time_name) for url in urls]
+    return min(start for start, _ in ranges), max(end for _, end in ranges)
@@ -2,14 +2,25 @@
 Everything dealing with the catalogs.
 """
 
+import hashlib
+import json
 import os
+import threading
+import uuid
+import warnings
+import weakref
 
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from copy import deepcopy
+from pathlib import Path
+from urllib.parse import urlparse
 
 import cf_xarray  # noqa
 import intake
 import intake.source.derived
 import pandas as pd
+import requests
 
 from intake.catalog import Catalog
 from intake.catalog.local import LocalCatalogEntry
@@ -17,6 +28,10 @@ from intake.catalog.local import LocalCatalogEntry
 import model_catalogs as mc
 
 
+# catalogs made in memory, by id, while they are in use
+_catalogs = weakref.WeakValueDictionary()
+
+
 def make_catalog(
     cats,
     full_cat_name,
@@ -24,6 +39,8 @@ def make_catalog(
     full_cat_metadata,
     cat_driver,
     cat_path=None,
+    save=True,
+    unique=False,
 ):
     """Construct single catalog from multiple catalogs or sources.
 
@@ -46,6 +63,14 @@ def make_catalog(
     cat_path: Path object, optional
        Path with catalog name to use for saving catalog. With or without yaml suffix. If not provided,
        will use `full_cat_name`.
+    save: bool, optional
+       If False, the catalog is only made in memory, and kept in a registry
+       under the "catalog_id" in its metadata while it is in use -- see
+       `get_catalog`.
+    unique: bool, optional
+       If True, a unique suffix is added to the file name, so catalogs saved
+       at the same time don't overwrite each other. The path is saved in the
+       catalog metadata as "catalog_file".
 
     Returns
     -------
@@ -61,12 +86,16 @@ def make_catalog(
     """
 
     if cat_path is None:
-        cat_path = full_cat_name
+        cat_path = Path(full_cat_name)
     else:
         cat_path = cat_path / full_cat_name.lower()
         # cat_path = f"{cat_path}/{full_cat_name.lower()}"
     if ("yaml" not in str(cat_path)) and ("yml" not in str(cat_path)):
         cat_path = cat_path.with_suffix(".yaml")
+    if unique:
+        cat_path = cat_path.with_name(
+            f"{cat_path.stem}-{uuid.uuid4().hex}{cat_path.suffix}"
+        )
     # import pdb; pdb.set_trace()
     if not isinstance(cats, list):
         cats = [cats]
@@ -89,6 +118,11 @@ def make_catalog(
         for cat, catd in zip(cats, cat_driver)
     }
 
+    if not save:
+        full_cat_metadata = dict(full_cat_metadata, catalog_id=uuid.uuid4().hex)
+    elif unique:
+        full_cat_metadata = dict(full_cat_metadata, catalog_file=str(cat_path))
+
     # create catalog
     cat = Catalog.from_dict(
         entries,
@@ -97,15 +131,118 @@ def make_catalog(
         metadata=full_cat_metadata,
     )
 
+    if not save:
+        _catalogs[full_cat_metadata["catalog_id"]] = cat
+        return cat
+
     # save catalog
-    cat.save(cat_path)
+    _save_catalog(cat, cat_path)
 
     return cat
 
 
+def _save_catalog(cat, cat_path):
+    """Save cat to a temporary file, then rename it so it's never read partly written."""
+    tmp = f".{cat_path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+    tmp = cat_path.with_name(tmp)
+    cat.save(tmp)
+    os.replace(tmp, cat_path)
+
+
+def get_catalog(catalog_id):
+    """Return a catalog made in memory by `make_catalog`.
+
+    Parameters
+    ----------
+    catalog_id: str
+        "catalog_id" in the metadata of the catalog.
+
+    Returns
+    -------
+    Intake catalog.
+
+    Raises
+    ------
+    KeyError if there is no such catalog, or it is no longer in use.
+    """
+    return _catalogs[catalog_id]
+
+
+# compiled source catalog of each catalog directory: the state of its files
+# when compiled, the hash of the files, and the entries as JSON
+_source_entries = {}
+# catalog directory and hash of the source catalog last saved by this process
+_saved_source_catalog = None
+
+
+def _source_index_path():
+    return mc.CATALOG_PATH / "source_catalog_index.json"
+
+
+def _catalog_dir_state(cat_dir):
+    """Return the names, modification times and sizes of the catalog files in cat_dir."""
+    with os.scandir(cat_dir) as files:
+        stats = [(f.name, f.stat()) for f in files if f.name.endswith(".yaml")]
+    return tuple(sorted((name, stat.st_mtime_ns, stat.st_size) for name, stat in stats))
+
+
+def _compile_source_entries(cat_dir):
+    """Return the entries of the source catalog for the model catalogs in cat_dir.
+
+    The entries are compiled into an index file the first time, then read from
+    it until the contents of the catalog files change.
+
+    Returns
+    -------
+    Hash of the catalog files, and dict of the name, description, args and
+    metadata of the catalog of each model.
+    """
+
+    paths = sorted(cat_dir.glob("*.yaml"))
+    sha = hashlib.sha256()
+    for path in paths:
+        sha.update(path.name.encode())
+        sha.update(mc._file_hash(path).encode())
+    digest = sha.hexdigest()
+
+    try:
+        with open(_source_index_path()) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+    compiled = index.get(str(cat_dir), {})
+    if compiled.get("hash") == digest:
+        return digest, compiled["entries"]
+
+    entries = {}
+    for path in paths:
+        cat = intake.open_catalog(path)
+        entries[cat.name] = {
+            "name": cat.name.upper(),
+            "description": cat.description,
+            "args": cat._yaml()["sources"][cat.name]["args"],
+            "metadata": cat.metadata,
+        }
+    # round trip, so the entries are the same whether compiled or read
+    entries = json.loads(json.dumps(entries, default=str))
+
+    index[str(cat_dir)] = {"hash": digest, "entries": entries}
+    path = _source_index_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp, path)
+    return digest, entries
+
+
 def setup_source_catalog(override=False):
     """Setup source catalog for models.
 
+    The model catalog files are compiled into an index file, which is used
+    until they change, and the compiled entries are kept in memory, so only
+    the first call in a process reads the catalog files.
+
     Parameters
     ----------
     override: bool
@@ -118,6 +255,10 @@ def setup_source_catalog(override=False):
     Intake catalog `source_cat`.
     """
 
+    global _saved_source_catalog
+
+    mc.sync_catalogs()
+
     cat_source_description = "Source catalog for models."
 
     # find most recent set of source_catalogs
@@ -131,33 +272,207 @@ def setup_source_catalog(override=False):
     else:
         cat_dir = mc.CATALOG_PATH_DIR
 
-    # open catalogs
-    cats = [intake.open_catalog(cat_loc) for cat_loc in cat_dir.glob("*.yaml")]
+    # the catalog files are only read again if they have been changed
+    state = _catalog_dir_state(cat_dir)
+    cached = _source_entries.get(str(cat_dir))
+    if cached is None or cached[0] != state:
+        digest, compiled = _compile_source_entries(cat_dir)
+        cached = _source_entries[str(cat_dir)] = (state, digest, json.dumps(compiled))
+    _, digest, compiled = cached
+    # decoded each time, so the entries of each catalog are its own
+    compiled = json.loads(compiled)
 
     metadata = {"source_catalog_dir": str(cat_dir)}
 
-    return make_catalog(
-        cats,
-        mc.SOURCE_CATALOG_NAME,
-        cat_source_description,
-        metadata,
-        intake.catalog.local.YAMLFileCatalog,
-        mc.CATALOG_PATH,
+    # a new catalog each time, since the sources of catalogs get changed
+    entries = {
+        key: LocalCatalogEntry(
+            entry["name"],
+            description=entry["description"],
+            driver=intake.catalog.local.YAMLFileCatalog,
+            args=entry["args"],
+            metadata=entry["metadata"],
+        )
+        for key, entry in compiled.items()
+    }
+    cat = Catalog.from_dict(
+        entries,
+        name=mc.SOURCE_CATALOG_NAME,
+        description=cat_source_description,
+        metadata=metadata,
+    )
+
+    cat_path = mc.CATALOG_PATH / mc.SOURCE_CATALOG_NAME
+    if _saved_source_catalog != (str(cat_path), digest) or not cat_path.exists():
+        _save_catalog(cat, cat_path)
+        _saved_source_catalog = (str(cat_path), digest)
+
+    return cat
+
+
+# models whose forecast output is read from one host at the same time
+DEFAULT_MAX_PER_HOST = 2
+
+
+def _source_host(source):
+    """Host a source reads its model output from."""
+    urlpath = source.describe().get("args", {}).get("urlpath")
+    if not urlpath:
+        urlpath = source.metadata.get("catloc", "")
+    if isinstance(urlpath, (list, tuple)):
+        urlpath = urlpath[0] if urlpath else ""
+    return urlparse(str(urlpath)).netloc
+
+
+def _run_by_host(executor, fn, jobs, max_per_host):
+    """Run jobs in executor, with at most max_per_host running for each host.
+
+    Parameters
+    ----------
+    executor: concurrent.futures.Executor
+    fn: function
+        Called for each job with its arguments.
+    jobs: dict
+        (host, arguments) for each job, by key.
+    max_per_host: int
+        Maximum number of jobs running for one host.
+
+    Returns
+    -------
+    Iterator of (key, future) of the jobs, as they finish.
+    """
+
+    pending = list(jobs.items())
+    running = {}
+    nrunning = Counter()
+    while pending or running:
+        waiting = []
+        for key, (host, args) in pending:
+            if nrunning[host] < max_per_host:
+                running[executor.submit(fn, *args)] = (key, host)
+                nrunning[host] += 1
+            else:
+                waiting.append((key, (host, args)))
+        pending = waiting
+
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            key, host = running.pop(future)
+            nrunning[host] -= 1
+            yield key, future
+
+
+def _checkpoint_path():
+    return mc.CATALOG_PATH / "complete_checkpoint.json"
+
+
+def _load_checkpoint():
+    """Hash of the "orig" catalog file of each model completed by an unfinished run."""
+    try:
+        with open(_checkpoint_path()) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_checkpoint(checkpoint):
+    path = _checkpoint_path()
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp, path)
+
+
+def _complete_model(catalog_path, model, path):
+    """Add domain boundary to the catalog of model, and save it in "complete".
+
+    Run in a worker process by `complete_source_catalog`, with the "orig"
+    catalog file of the model at path.
+    """
+
+    mc.set_catalog_path(catalog_path)
+    source_cat = {model: intake.open_catalog(path)}
+    timing = "forecast"
+
+    # save original metadata so as to not include Dataset attributes
+    metadata = deepcopy(source_cat[model][timing].metadata)
+
+    # read in model output
+    ds = source_cat[model][timing].to_dask()
+
+    # find metadata
+    # select lon/lat for use. There may be more than one and we also want the name.
+    if "alpha_shape" in source_cat[model].metadata:
+        dd, alpha = source_cat[model].metadata["alpha_shape"]
+    else:
+        dd, alpha = None, None
+    lonkey, latkey, bbox, wkt = mc.find_bbox(ds, dd=dd, alpha=alpha)
+    # lonkey, latkey, bbox, wkt_low, wkt_high = find_bbox(ds, dd=dd, alpha=alpha)
+
+    # metadata for overall source_id0
+    metadata0 = {
+        "geospatial_bounds": wkt,
+        "bounding_box": bbox,
+    }
+    ds.close()
+
+    # # add Dataset metadata to specific source metadata
+    # # change metadata attributes to strings so catalog doesn't barf on them
+    # for attr in ds.attrs:
+    #     source_cat[model][timing].metadata[attr] = str(ds.attrs[attr])
+    # replace model, timing metadata to exclude Dataset attributes
+    source_cat[model][timing].metadata = metadata
+
+    # add 0th level metadata to 0th level model entry
+    source_cat[model].metadata.update(metadata0)
+
+    timings = list(source_cat[model])
+    sources = [source_cat[model][timing] for timing in timings]
+
+    make_catalog(
+        sources,
+        model,
+        source_cat[model].description,
+        source_cat[model].metadata,
+        "opendap",
+        mc.CATALOG_PATH_DIR,
     )
+    return model
 
 
-def complete_source_catalog():
+def complete_source_catalog(
+    max_workers=None, max_per_host=DEFAULT_MAX_PER_HOST, resume=True
+):
     """Update model source files in 'source_catalogs/orig'.
 
     This will add outer boundary files for the model domains and create
     "complete" directory of model files that mirror those in "orig". If this is
     run and "complete" directory already exists, it will be overwritten.
 
+    The models are run in a pool of processes, with at most `max_per_host`
+    reading from the same server at once. A model that fails doesn't stop the
+    others. Each model that is done is recorded in a checkpoint file, so a run
+    that is interrupted or has failures picks up where it left off when run
+    again; the checkpoint is removed once all of the models are done.
+
+    Parameters
+    ----------
+    max_workers: int, optional
+        Number of processes. Defaults to the number of CPUs.
+    max_per_host: int, optional
+        Number of models reading model output from one host at the same time.
+    resume: bool, optional
+        If False, models done by a previous, unfinished run are done again.
+
     Returns
     -------
     Intake catalog, and also resaves all model source catalogs into
     f"{self.cat_source_base}/complete" with domain boundaries added.
 
+    Raises
+    ------
+    RuntimeError if any of the models failed, after the others are done.
+
     Examples
     --------
 
@@ -170,55 +485,87 @@ def complete_source_catalog():
     models = list(source_cat)
     timing = "forecast"
 
-    for model in models:
-        # save original metadata so as to not include Dataset attributes
-        metadata = deepcopy(source_cat[model][timing].metadata)
-
-        # read in model output
-        ds = source_cat[model][timing].to_dask()
+    # a model is done again if its "orig" file changed since it was checkpointed
+    checkpoint = _load_checkpoint() if resume else {}
+    hashes = {model: mc._file_hash(source_cat[model].path) for model in models}
+    jobs = {
+        model: (
+            _source_host(source_cat[model][timing]),
+            (str(mc.CATALOG_PATH), model, source_cat[model].path),
+        )
+        for model in models
+        if checkpoint.get(model) != hashes[model]
+        or not (mc.CATALOG_PATH_DIR / f"{model.lower()}.yaml").exists()
+    }
 
-        # find metadata
-        # select lon/lat for use. There may be more than one and we also want the name.
-        if "alpha_shape" in source_cat[model].metadata:
-            dd, alpha = source_cat[model].metadata["alpha_shape"]
-        else:
-            dd, alpha = None, None
-        lonkey, latkey, bbox, wkt = mc.find_bbox(ds, dd=dd, alpha=alpha)
-        # lonkey, latkey, bbox, wkt_low, wkt_high = find_bbox(ds, dd=dd, alpha=alpha)
-
-        # metadata for overall source_id0
-        metadata0 = {
-            "geospatial_bounds": wkt,
-            "bounding_box": bbox,
-        }
-        ds.close()
-
-        # # add Dataset metadata to specific source metadata
-        # # change metadata attributes to strings so catalog doesn't barf on them
-        # for attr in ds.attrs:
-        #     source_cat[model][timing].metadata[attr] = str(ds.attrs[attr])
-        # replace model, timing metadata to exclude Dataset attributes
-        source_cat[model][timing].metadata = metadata
-
-        # add 0th level metadata to 0th level model entry
-        source_cat[model].metadata.update(metadata0)
-
-        timings = list(source_cat[model])
-        sources = [source_cat[model][timing] for timing in timings]
-
-        make_catalog(
-            sources,
-            model,
-            source_cat[model].description,
-            source_cat[model].metadata,
-            "opendap",
-            mc.CATALOG_PATH_DIR,
+    failed = {}
+    if jobs:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for model, future in _run_by_host(
+                executor, _complete_model, jobs, max_per_host
+            ):
+                try:
+                    future.result()
+                except Exception as e:
+                    failed[model] = e
+                    continue
+                checkpoint[model] = hashes[model]
+                _save_checkpoint(checkpoint)
+
+    if failed:
+        errors = "\n".join(f"{model}: {error!r}" for model, error in failed.items())
+        raise RuntimeError(
+            f"Could not complete the catalogs of {len(failed)} models; run again to "
+            f"retry them:\n{errors}"
         )
+    if _checkpoint_path().exists():
+        os.remove(_checkpoint_path())
 
     return setup_source_catalog()
 
 
-def find_availability(model, override=False, override_updated=False):
+def _find_boundaries(crawler, catloc, filetype, previous=None):
+    """Find the oldest and newest catalog directories with files of filetype.
+
+    See `CatalogCrawler.find_boundaries`.
+    """
+
+    def has_files(catref):
+        """Whether the directory of catref has files of filetype."""
+        return (
+            len(mc.find_filelocs(catref, catloc, filetype=filetype, crawler=crawler))
+            > 0
+        )
+
+    start_ref, end_ref = crawler.find_boundaries(catloc, has_files, previous)
+    if start_ref is None:
+        raise ValueError(f"No {filetype} files found in {catloc}")
+    return start_ref, end_ref
+
+
+def _forecast_time_range(source):
+    """Find the first and last times of the output of an OPeNDAP source.
+
+    The OPeNDAP headers are probed for the time range (see `mc.probe_time_range`),
+    falling back, with a warning, to opening the dataset if the server or its
+    responses don't allow it.
+    """
+
+    try:
+        start, end = mc.probe_time_range(source.urlpath, time_name="time")
+    except (requests.RequestException, ValueError) as e:
+        warnings.warn(
+            f"Could not probe {source.urlpath} for its time range ({e!r}), "
+            "opening the dataset instead.",
+            RuntimeWarning,
+        )
+        ds = source.to_dask()
+        return str(ds.time.values[0]), str(ds.time.values[-1])
+    # as numpy datetimes, as the times of the dataset would be
+    return tuple(str(t.to_datetime64().astype("datetime64[ns]")) for t in (start, end))
+
+
+def find_availability(model, override=False, override_updated=False, store=None):
     """Find availability for model for 'forecast' and 'hindcast'.
 
     Parameters
@@ -232,7 +579,13 @@ def find_availability(model, override=False, override_updated=False):
     override_updated: bool
         Will use model "updated" catalog file if available in "updated"
         directory if it is not stale, or if `override==True` will remake updated
-        catalog file regardless.
+        catalog file regardless. The catalog directories found to have the oldest
+        and newest files are saved in the updated catalog, so that later runs only
+        crawl newer directories; `override_updated==True` also crawls them all again.
+    store: AvailabilityStore, optional
+        Store the availability found is saved in, whose time to live for each
+        timing says when the "updated" catalog file is stale. Defaults to the
+        store in `mc.CATALOG_PATH`. See also `refresh_all`.
 
     Returns
     -------
@@ -243,7 +596,11 @@ def find_availability(model, override=False, override_updated=False):
     >> cat = mc.find_availability(model='DBOFS')
     """
 
+    mc.sync_catalogs()
+
     model = model.upper()
+    if store is None:
+        store = mc.AvailabilityStore()
 
     ran_forecast, ran_hindcast = False, False
 
@@ -257,9 +614,7 @@ def find_availability(model, override=False, override_updated=False):
 
     # deal with RTOFS completely separately
     if "RTOFS" in model:
-        ds = cat["forecast"].to_dask()
-        start_datetime = str(ds.time.values[0])
-        end_datetime = str(ds.time.values[-1])
+        start_datetime, end_datetime = _forecast_time_range(cat["forecast"])
         cat["forecast"].metadata["start_datetime"] = start_datetime
         cat["forecast"].metadata["end_datetime"] = end_datetime
         cat_metadata = cat.metadata
@@ -277,6 +632,7 @@ def find_availability(model, override=False, override_updated=False):
             cat["forecast"]._entry._driver,
             cat_path=mc.CATALOG_PATH_UPDATED,
         )
+        store.put_catalog(model, new_user_cat)
         return new_user_cat
 
     # determine filetype to send to `agg_for_date`
@@ -293,127 +649,126 @@ def find_availability(model, override=False, override_updated=False):
     timings = list(set(list(cat)).intersection(timings))
 
     new_sources = []
-    for timing in timings:
-
-        metadata = deepcopy(cat[timing].metadata)  # save metadata
-
-        # forecast: don't need to check for consecutive dates bc files are by day
-        # just find first file from earliest catref and last file from last catref
-        if "stale" in cat[timing].metadata:
-            stale = pd.Timedelta(cat[timing].metadata["stale"])
-        else:
-            stale = pd.Timedelta("1 minute")
-        if "time_last_checked" in cat[timing].metadata:
-            time_last_checked = pd.Timestamp(cat[timing].metadata["time_last_checked"])
-        else:
-            time_last_checked = pd.Timestamp.today() - pd.Timedelta(
-                "30 days"
-            )  # just a big number
-        dt = pd.Timestamp.now() - time_last_checked
-
-        if timing == "forecast" and (dt > stale or override_updated):
-
-            if "catloc" in cat[timing].metadata:
-                catloc = cat[timing].metadata["catloc"]
-                catrefs = mc.find_catrefs(catloc)
-
-                # find start_datetime. Have to loop bc there are fewer files for
-                # e.g. filetype=='regulargrid'
-                for catref in catrefs[::-1]:
-                    filelocs = mc.find_filelocs(catref, catloc, filetype=filetype)
-                    if len(filelocs) == 0:
-                        continue
-                start_datetime = mc.get_dates_from_ofs(filelocs, filetype, "n", "first")
-
-                # find end_datetime
-                filelocs = mc.find_filelocs(catrefs[0], catloc, filetype=filetype)
-                end_datetime = mc.get_dates_from_ofs(filelocs, filetype, "f", "last")
-
+    # share fetched catalogs between the timings
+    with mc.CatalogCrawler() as crawler:
+        for timing in timings:
+
+            metadata = deepcopy(cat[timing].metadata)  # save metadata
+
+            # forecast: don't need to check for consecutive dates bc files are by day
+            # just find first file from earliest catref and last file from last catref
+            stale = store.ttl(timing)
+            if "time_last_checked" in cat[timing].metadata:
+                time_last_checked = pd.Timestamp(
+                    cat[timing].metadata["time_last_checked"]
+                )
             else:
-                ds = cat["forecast"].to_dask()
-                start_datetime = str(ds.time.values[0])
-                end_datetime = str(ds.time.values[-1])
-
-            ran_forecast = True
-            # time_last_checked = pd.Timestamp.now()
-
-        elif timing == "hindcast" and (dt > stale or override_updated):
-
-            catloc = cat[timing].metadata["catloc"]
-            catrefs = mc.find_catrefs(catloc)
+                time_last_checked = pd.Timestamp.today() - pd.Timedelta(
+                    "30 days"
+                )  # just a big number
+            dt = pd.Timestamp.now() - time_last_checked
+
+            # previously found oldest and newest catalog directories with files
+            if override_updated:
+                previous = None
+            else:
+                previous = (metadata.get("start_catref"), metadata.get("end_catref"))
+            catref_bounds = None
 
-            # Find start_datetime by checking catrefs from the old end [-1]
-            for catref in catrefs[::-1]:
-                filelocs = mc.find_filelocs(catref, catloc, filetype=filetype)
-                if len(filelocs) == 0:
-                    continue
+            if timing == "forecast" and (dt > stale or override_updated):
 
-                # determine unique dates
-                dates = sorted(
-                    list(
-                        set(
-                            [
-                                pd.Timestamp(fileloc.split("/")[-1].split(".")[4])
-                                for fileloc in filelocs
-                            ]
-                        )
+                if "catloc" in cat[timing].metadata:
+                    catloc = cat[timing].metadata["catloc"]
+                    # Have to check for files bc there are fewer files for
+                    # e.g. filetype=='regulargrid'
+                    catref_bounds = _find_boundaries(
+                        crawler, catloc, filetype, previous
                     )
-                )
+                    start_ref, end_ref = catref_bounds
 
-                # determine consecutive dates
-                dates = [
-                    dates[i]
-                    for i in range(len(dates) - 2)
-                    if (dates[i] + pd.Timedelta("1 day") in dates)
-                    and (dates[i] + pd.Timedelta("2 days") in dates)
-                ]
-                if len(dates) > 0:
-                    # keep filelocs if their date matches one in dates
-                    # filelocs that don't exceed date range found
-                    filelocs = [
-                        fileloc
-                        for fileloc in filelocs
-                        if dates[0]
-                        <= pd.Timestamp(fileloc.split("/")[-1].split(".")[4])
-                        <= dates[-1]
-                    ]
+                    # find start_datetime
+                    filelocs = mc.find_filelocs(
+                        start_ref, catloc, filetype=filetype, crawler=crawler
+                    )
                     start_datetime = mc.get_dates_from_ofs(
                         filelocs, filetype, "n", "first"
                     )
-                    break
 
-            # find end_datetime, no need to search through files on this end of time
-            filelocs = mc.find_filelocs(catrefs[0], catloc, filetype=filetype)
-            end_datetime = mc.get_dates_from_ofs(filelocs, filetype, "n", "last")
+                    # find end_datetime
+                    filelocs = mc.find_filelocs(
+                        end_ref, catloc, filetype=filetype, crawler=crawler
+                    )
+                    end_datetime = mc.get_dates_from_ofs(
+                        filelocs, filetype, "f", "last"
+                    )
 
-            ran_hindcast = True
-            # time_last_checked = pd.Timestamp.now()
-        else:
-            start_datetime = cat[timing].metadata["start_datetime"]
-            end_datetime = cat[timing].metadata["end_datetime"]
+                else:
+                    start_datetime, end_datetime = _forecast_time_range(cat["forecast"])
 
-        # stale parameter: 4 hours for forecast, 1 day for hindcast
-        if timing == "forecast":
-            stale = "4 hours"
-        elif timing == "hindcast":
-            stale = "1 day"
+                ran_forecast = True
+                # time_last_checked = pd.Timestamp.now()
 
-        # replace model, timing metadata to exclude Dataset attributes
-        cat[timing].metadata = metadata
+            elif timing == "hindcast" and (dt > stale or override_updated):
 
-        metadata = {
-            "model": model,
-            "timing": timing,
-            "filetype": filetype,
-            "time_last_checked": str(pd.Timestamp.now()),
-            "stale": stale,
-            "start_datetime": str(start_datetime),
-            "end_datetime": str(end_datetime),
-        }
-        cat[timing].metadata.update(metadata)
-        new_sources.append(cat[timing])
+                catloc = cat[timing].metadata["catloc"]
+                start_ref, end_ref = _find_boundaries(
+                    crawler, catloc, filetype, previous
+                )
+
+                # Find start_datetime by checking catrefs from the oldest with files
+                for catref in crawler.leaf_catrefs(catloc, after=start_ref):
+                    filelocs = mc.find_filelocs(
+                        catref, catloc, filetype=filetype, crawler=crawler
+                    )
+                    if len(filelocs) == 0:
+                        continue
+
+                    # start from the first day of the first run of 3 consecutive days
+                    index = mc.OFSFileIndex(filelocs)
+                    runs = mc.find_runs(index.date, min_length=3)
+                    if len(runs) > 0:
+                        mask = index.select(filetype=filetype, norf="n")
+                        mask &= index.date >= runs[0][0].to_datetime64()
+                        start_datetime = pd.Timestamp(index.time[mask].min())
+                        start_ref = catref
+                        break
+                catref_bounds = (start_ref, end_ref)
+
+                # find end_datetime, no need to search through files on this end of time
+                filelocs = mc.find_filelocs(
+                    end_ref, catloc, filetype=filetype, crawler=crawler
+                )
+                end_datetime = mc.get_dates_from_ofs(filelocs, filetype, "n", "last")
+
+                ran_hindcast = True
+                # time_last_checked = pd.Timestamp.now()
+            else:
+                start_datetime = cat[timing].metadata["start_datetime"]
+                end_datetime = cat[timing].metadata["end_datetime"]
+
+            # stale parameter: 4 hours for forecast, 1 day for hindcast by default
+            stale = str(stale)
+
+            # replace model, timing metadata to exclude Dataset attributes
+            cat[timing].metadata = metadata
+
+            metadata = {
+                "model": model,
+                "timing": timing,
+                "filetype": filetype,
+                "time_last_checked": str(pd.Timestamp.now()),
+                "stale": stale,
+                "start_datetime": str(start_datetime),
+                "end_datetime": str(end_datetime),
+            }
+            if catref_bounds is not None:
+                metadata["start_catref"] = list(catref_bounds[0])
+                metadata["end_catref"] = list(catref_bounds[1])
+            cat[timing].metadata.update(metadata)
+            new_sources.append(cat[timing])
 
     if not (ran_forecast or ran_hindcast):
+        store.put_catalog(model, cat)
         return cat
     else:
 
@@ -433,10 +788,11 @@ def find_availability(model, override=False, override_updated=False):
             [source._entry._driver for source in new_sources],
             cat_path=mc.CATALOG_PATH_UPDATED,
         )
+        store.put_catalog(model, new_user_cat)
         return new_user_cat
 
 
-def add_url_path(cat, timing=None, start_date=None, end_date=None):
+def add_url_path(cat, timing=None, start_date=None, end_date=None, save=False):
     """Add urlpath locations to existing catalog/source.
 
     Parameters
@@ -454,6 +810,10 @@ def add_url_path(cat, timing=None, start_date=None, end_date=None):
         If model has an aggregated link for timing, start_date and end_date
         are not used. Otherwise they should be input. Only year-month-day
         will be used in date. end_date is inclusive.
+    save: bool, optional
+        By default the user catalog is only made in memory (see
+        `make_catalog`), so calls at the same time don't interfere. If True, it
+        is also saved to a file of its own in the "tmp" catalog directory.
 
     Returns
     -------
@@ -478,6 +838,8 @@ def add_url_path(cat, timing=None, start_date=None, end_date=None):
 
     """
 
+    mc.sync_catalogs()
+
     # either `find_availability` needs to have been run and therefore certain
     # metadata present in cat (start_datetime, end_datetime), or don't need to
     #  have run `find_availability` but need to input which "timing" to use.
@@ -527,51 +889,18 @@ def add_url_path(cat, timing=None, start_date=None, end_date=None):
     if (
         source.urlpath is None or isinstance(source.urlpath, list)
     ) and "catloc" in source.metadata:
-        if "pattern" in source.metadata:
-            pattern = source.metadata["pattern"]
-        else:
-            pattern = None
-
         catloc = source.metadata["catloc"]
-        catrefs = mc.find_catrefs(catloc)
-
-        # loop over dates
-        filelocs_urlpath = []
-        for date in pd.date_range(start=start_date, end=end_date, freq="1D"):
-            if date == end_date and (
-                (
-                    "timing" in source.metadata
-                    and source.metadata["timing"] == "forecast"
-                )
-                or (timing == "forecast")
-            ):
-                is_forecast = True
-            else:
-                is_forecast = False
-
-            # translate date to catrefs to select which catref to use
-            if len(catrefs[0]) == 3:
-                cat_ref_to_match = (
-                    str(date.year),
-                    str(date.month).zfill(2),
-                    str(date.day).zfill(2),
-                )
-            elif len(catrefs[0]) == 2:
-                cat_ref_to_match = (str(date.year), str(date.month).zfill(2))
-
-            ind = catrefs.index(cat_ref_to_match)
-
-            filelocs = mc.find_filelocs(catrefs[ind], catloc, filetype=filetype)
-            filelocs_urlpath.extend(
-                mc.agg_for_date(
-                    date,
-                    filelocs,
-                    filetype,
-                    # source.metadata['filetype'],
-                    is_forecast=is_forecast,
-                    pattern=pattern,
-                )
-            )
+        dates = pd.date_range(start=start_date, end=end_date, freq="1D")
+        # the forecast files are brought in for the last day of a forecast
+        is_forecast = (
+            len(dates) > 0
+            and dates[-1] == end_date
+            and (source.metadata.get("timing") == "forecast" or timing == "forecast")
+        )
+        # each catalog directory is listed once, for all of its dates
+        filelocs_urlpath = mc.agg_for_dates(
+            catloc, dates, filetype, is_forecast=is_forecast
+        )
 
         source_orig = source(urlpath=filelocs_urlpath)  # [:2])
 
@@ -667,6 +996,8 @@ def add_url_path(cat, timing=None, start_date=None, end_date=None):
         metadata,
         [source._entry._driver for source in sources],
         cat_path=mc.CATALOG_PATH_TMP,
+        save=save,
+        unique=True,
     )
 
     return new_user_cat
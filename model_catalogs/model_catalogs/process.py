@@ -2,6 +2,13 @@
 This file contains all information for transforming the Datasets.
 """
 
+import json
+import threading
+import weakref
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 import cf_xarray  # noqa
 import numpy as np
 import xarray as xr
@@ -9,27 +16,258 @@ import xarray as xr
 from intake.source.derived import GenericTransform
 
 
+# number of transformed datasets kept open after no source uses them
+DEFAULT_MAX_IDLE = 8
+# `xr.open_mfdataset` arguments that are for combining the files, not opening them
+COMBINE_KWARGS = (
+    "combine",
+    "compat",
+    "concat_dim",
+    "coords",
+    "data_vars",
+    "join",
+    "combine_attrs",
+    "parallel",
+)
+
+
+def _freeze(obj):
+    """Hashable representation of arguments."""
+    return json.dumps(obj, sort_keys=True, default=repr)
+
+
+class DatasetCache:
+    """Opened, transformed datasets, shared by the DatasetTransform sources.
+
+    A transformed dataset is kept by the url(s) of its files and its open and
+    transform arguments, with a count of the sources using it. Once no source
+    uses it, it is kept for reuse until more than `max_idle` datasets are
+    unused, then the least recently used are dropped.
+
+    The files of a multi-file dataset are opened and kept one by one, so
+    datasets that share files -- e.g. user catalogs for overlapping date
+    ranges -- only open the files they don't share. A file is closed when no
+    dataset that is kept uses it.
+
+    Parameters
+    ----------
+    max_idle: int, optional
+        Number of unused transformed datasets kept open.
+    """
+
+    def __init__(self, max_idle=DEFAULT_MAX_IDLE):
+        self.max_idle = max_idle
+        self._lock = threading.RLock()
+        # key: [dataset, number of sources using it, keys of its files], least
+        # recently used first
+        self._datasets = OrderedDict()
+        # key: [dataset, number of datasets using it]
+        self._files = {}
+
+    def __len__(self):
+        """Number of combined datasets in the cache."""
+        return len(self._datasets)
+
+    def _open_file(self, url, kwargs):
+        key = (url, _freeze(kwargs))
+        with self._lock:
+            entry = self._files.get(key)
+            if entry is not None:
+                entry[1] += 1
+                return key, entry[0]
+        ds = xr.open_dataset(url, **kwargs)
+        with self._lock:
+            entry = self._files.setdefault(key, [ds, 0])
+            if entry[0] is not ds:
+                # opened by another thread at the same time
+                ds.close()
+            entry[1] += 1
+            return key, entry[0]
+
+    def _release_files(self, file_keys):
+        with self._lock:
+            for key in file_keys:
+                entry = self._files[key]
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._files[key]
+                    entry[0].close()
+
+    def _open(self, urls, multi, open_kwargs, combine_kwargs):
+        """Open the files of a dataset, and combine them as `xr.open_mfdataset` does."""
+
+        if multi:
+            open_kwargs = dict(open_kwargs, chunks=open_kwargs.get("chunks") or {})
+        opened = []
+        try:
+            if multi and combine_kwargs.get("parallel") and len(urls) > 1:
+                with ThreadPoolExecutor() as executor:
+                    futures = [
+                        executor.submit(self._open_file, url, open_kwargs)
+                        for url in urls
+                    ]
+                # keep what was opened, so it is released if another file failed
+                error = None
+                for future in futures:
+                    try:
+                        opened.append(future.result())
+                    except Exception as e:
+                        error = error or e
+                if error is not None:
+                    raise error
+            else:
+                opened = [self._open_file(url, open_kwargs) for url in urls]
+            file_keys = [key for key, _ in opened]
+            # shallow copies, so the transform can't change the kept datasets
+            datasets = [ds.copy() for _, ds in opened]
+
+            if not multi:
+                return file_keys, datasets[0]
+            kwargs = {
+                key: value for key, value in combine_kwargs.items() if key != "parallel"
+            }
+            combine = kwargs.pop("combine", "by_coords")
+            if combine == "nested":
+                ds = xr.combine_nested(datasets, **kwargs)
+            else:
+                kwargs.pop("concat_dim", None)
+                ds = xr.combine_by_coords(datasets, **kwargs)
+            return file_keys, ds
+        except Exception:
+            self._release_files([key for key, _ in opened])
+            raise
+
+    def acquire(self, source, transform, transform_kwargs):
+        """Return the transformed dataset of source, opening it if it isn't kept.
+
+        Parameters
+        ----------
+        source: intake_xarray.OpenDapSource
+            Source of the files, with `urlpath`, `chunks`, `engine` and
+            xarray keyword arguments.
+        transform: function
+            Called with the opened dataset and transform_kwargs.
+        transform_kwargs: dict
+
+        Returns
+        -------
+        Key of the dataset, for `release`, and a shallow copy of the dataset, so
+        changes to its attributes or variables don't show in the other sources.
+        """
+
+        urlpath = source.urlpath
+        multi = isinstance(urlpath, (list, tuple))
+        urls = tuple(urlpath) if multi else (urlpath,)
+        kwargs = dict(source._kwargs, engine=source.engine, chunks=source.chunks)
+        combine_kwargs = {k: kwargs.pop(k) for k in COMBINE_KWARGS if k in kwargs}
+        key = (
+            urls,
+            multi,
+            _freeze(kwargs),
+            _freeze(combine_kwargs),
+            f"{transform.__module__}.{transform.__qualname__}",
+            _freeze(transform_kwargs),
+        )
+
+        with self._lock:
+            entry = self._datasets.get(key)
+            if entry is not None:
+                entry[1] += 1
+                self._datasets.move_to_end(key)
+                return key, entry[0].copy()
+
+        file_keys, ds = self._open(urls, multi, kwargs, combine_kwargs)
+        try:
+            ds = transform(ds, **transform_kwargs)
+        except Exception:
+            self._release_files(file_keys)
+            raise
+
+        with self._lock:
+            entry = self._datasets.get(key)
+            if entry is not None:
+                # opened by another thread at the same time
+                self._release_files(file_keys)
+                entry[1] += 1
+            else:
+                entry = self._datasets[key] = [ds, 1, file_keys]
+            self._datasets.move_to_end(key)
+            self._evict()
+            return key, entry[0].copy()
+
+    def release(self, key):
+        """A source no longer uses the dataset of key."""
+        with self._lock:
+            entry = self._datasets.get(key)
+            if entry is None:
+                return
+            entry[1] -= 1
+            self._datasets.move_to_end(key)
+            self._evict()
+
+    def _evict(self):
+        idle = [key for key, entry in self._datasets.items() if entry[1] <= 0]
+        for key in idle[: max(len(idle) - self.max_idle, 0)]:
+            _, _, file_keys = self._datasets.pop(key)
+            self._release_files(file_keys)
+
+    def clear(self):
+        """Drop all of the datasets no source is using."""
+        with self._lock:
+            max_idle, self.max_idle = self.max_idle, 0
+            try:
+                self._evict()
+            finally:
+                self.max_idle = max_idle
+
+
+# shared by all of the DatasetTransform sources in this process
+DATASETS = DatasetCache()
+
+
 class DatasetTransform(GenericTransform):
     """Transform where the input and output are both Dask-compatible Datasets
 
     This derives from GenericTransform, and you must supply ``transform`` and
     any ``transform_kwargs``.
+
+    The transformed dataset is shared, through `DATASETS`, with the other
+    sources in the process that are for the same files and transform: each
+    source has a shallow copy of it.
     """
 
     input_container = "xarray"
     container = "xarray"
     optional_params = {}
     _ds = None
+    _release = None
 
     def to_dask(self):
         """Makes it so can read in model output."""
         if self._ds is None:
             self._pick()
-            self._ds = self._transform(
-                self._source.to_dask(), **self._params["transform_kwargs"]
-            )
+            urlpath = getattr(self._source, "urlpath", None)
+            if isinstance(urlpath, (str, list, tuple)) and (
+                getattr(self._source, "auth", None) is None
+            ):
+                key, self._ds = DATASETS.acquire(
+                    self._source, self._transform, self._params["transform_kwargs"]
+                )
+                # release the dataset when this source is closed or garbage collected
+                self._release = weakref.finalize(self, DATASETS.release, key)
+            else:
+                self._ds = self._transform(
+                    self._source.to_dask(), **self._params["transform_kwargs"]
+                )
         return self._ds
 
+    def close(self):
+        """Stop using the dataset."""
+        if self._release is not None:
+            self._release()
+            self._release = None
+        self._ds = None
+
     def read(self):
         """Same here."""
         return self.to_dask()
@@ -0,0 +1,57 @@
+"""
+Test the availability store, without a connection.
+"""
+
+import threading
+
+import pandas as pd
+import pytest
+
+import model_catalogs as mc
+
+
+def test_store(tmp_path):
+    """Availability is saved, and fresh until its time to live has passed."""
+
+    store = mc.AvailabilityStore(tmp_path / "availability.sqlite")
+    store.put(
+        "cbofs", "forecast", "2022-02-01", "2022-02-03", start_catref=["2022", "02"]
+    )
+    old = pd.Timestamp.now() - pd.Timedelta("2 days")
+    store.put("CBOFS", "hindcast", "2021-01-01", "2022-01-31", time_last_checked=old)
+
+    # another store, e.g. in another process
+    availability = mc.AvailabilityStore(store.path).get()
+    assert list(availability) == ["CBOFS"]
+    forecast = availability["CBOFS"]["forecast"]
+    assert forecast["start_datetime"] == "2022-02-01"
+    assert forecast["start_catref"] == ["2022", "02"]
+    assert forecast["fresh"]
+    assert not availability["CBOFS"]["hindcast"]["fresh"]
+    assert store.get(["DBOFS"]) == {}
+
+
+def test_refresh_all(tmp_path, monkeypatch):
+    """Only models that aren't fresh are checked, concurrently, failures apart."""
+
+    store = mc.AvailabilityStore(tmp_path / "availability.sqlite")
+    store.put("CBOFS", "forecast", "2022-02-01", "2022-02-03")
+    checked = []
+    running = threading.Barrier(2, timeout=5)
+
+    def find_availability(model, override_updated=False, store=None):
+        """Store a forecast for model, failing for TBOFS."""
+        checked.append(model)
+        # both models are checked at the same time
+        running.wait()
+        if model == "TBOFS":
+            raise ConnectionError(model)
+        store.put(model, "forecast", "2022-02-02", "2022-02-04")
+
+    monkeypatch.setattr(mc, "find_availability", find_availability)
+    with pytest.warns(RuntimeWarning, match="TBOFS"):
+        availability = mc.refresh_all(["CBOFS", "DBOFS", "TBOFS"], store=store)
+
+    assert sorted(checked) == ["DBOFS", "TBOFS"]
+    assert sorted(availability) == ["CBOFS", "DBOFS"]
+    assert availability["DBOFS"]["forecast"]["end_datetime"] == "2022-02-04"
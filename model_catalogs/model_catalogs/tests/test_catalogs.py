@@ -7,31 +7,34 @@ of this script, commented out, and I will run abbreviated sample versions of
 them instead.
 """
 
+import json
 import os
+import shutil
+import subprocess
+import sys
 import tempfile
+import threading
+import time
 
-from pathlib import Path
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
+import intake
 import numpy as np
 import pandas as pd
 import pytest
 
 import model_catalogs as mc
 
+from model_catalogs import model_catalogs
+from model_catalogs.model_catalogs import _run_by_host
+
 
 # make temp dir
 temp_dir = tempfile.TemporaryDirectory()
 
 # overwrite built in catalog locations
-mc.CATALOG_PATH = Path(temp_dir.name)
-# no need to replace orig path, just use from where they are
-# mc.CATALOG_PATH_DIR_ORIG = mc.CATALOG_PATH / "orig"
-mc.CATALOG_PATH_DIR = mc.CATALOG_PATH / "complete"
-mc.CATALOG_PATH_UPDATED = mc.CATALOG_PATH / "updated"
-
-# set up catalog directories for this testing file
-mc.CATALOG_PATH_UPDATED.mkdir(parents=True, exist_ok=True)
-mc.CATALOG_PATH_TMP.mkdir(parents=True, exist_ok=True)
+mc.set_catalog_path(temp_dir.name)
 
 
 def test_setup_source_catalog():
@@ -52,6 +55,145 @@ def test_setup_source_catalog():
     assert sorted(list(source_cat["CBOFS"])) == ["forecast", "hindcast", "nowcast"]
 
 
+def test_setup_source_catalog_is_compiled(tmp_path):
+    """The catalog files are compiled once, and again when they change."""
+
+    old_path = mc.CATALOG_PATH
+    mc.set_catalog_path(tmp_path)
+    try:
+        source_cat = mc.setup_source_catalog(override=True)
+        assert (tmp_path / "source_catalog_index.json").exists()
+        assert (tmp_path / "source_catalog.yaml").exists()
+
+        # a new catalog each time, from the compiled entries
+        source_cat2 = mc.setup_source_catalog(override=True)
+        assert source_cat2 is not source_cat
+        assert list(source_cat2) == list(source_cat)
+        assert source_cat2["CBOFS"].metadata == source_cat["CBOFS"].metadata
+        assert list(source_cat2["CBOFS"]) == list(source_cat["CBOFS"])
+
+        # changed catalog file: compiled again, replacing the entries kept
+        ncompiled = len(model_catalogs._source_entries)
+        path = mc.CATALOG_PATH_DIR_ORIG / "cbofs.yaml"
+        text = path.read_text().replace("Chesapeake Bay model", "Changed model")
+        path.write_text(text)
+        source_cat = mc.setup_source_catalog(override=True)
+        entry = source_cat._entries["CBOFS"]
+        assert entry.describe()["description"].startswith("Changed model")
+        assert len(model_catalogs._source_entries) == ncompiled
+    finally:
+        mc.set_catalog_path(old_path)
+
+
+def test_make_catalog_in_memory(tmp_path):
+    """Catalogs made in memory are registered, and saved ones don't collide."""
+
+    source = mc.setup_source_catalog(override=True)["CBOFS"]["forecast"]
+
+    args = (source, "User-catalog.", "", {}, "opendap", tmp_path)
+    cat = mc.make_catalog(*args, save=False)
+    assert list(tmp_path.iterdir()) == []
+    assert mc.get_catalog(cat.metadata["catalog_id"]) is cat
+    assert list(cat) == ["forecast"]
+
+    cats = [mc.make_catalog(*args, unique=True) for _ in range(2)]
+    paths = sorted(str(path) for path in tmp_path.iterdir())
+    assert sorted(cat.metadata["catalog_file"] for cat in cats) == paths
+    assert list(intake.open_catalog(paths[0])) == ["forecast"]
+
+
+def test_import_is_lazy(tmp_path):
+    """Importing the package shouldn't touch the filesystem or import intake."""
+
+    code = (
+        "import sys, model_catalogs as mc; "
+        "assert 'intake' not in sys.modules; "
+        "assert mc.CATALOG_PATH.name == 'cats'; "
+        "mc.find_bbox; "
+        "assert 'shapely' in sys.modules"
+    )
+    env = dict(
+        os.environ, HOME=str(tmp_path), MODEL_CATALOGS_DIR=str(tmp_path / "cats")
+    )
+    subprocess.run([sys.executable, "-c", code], env=env, check=True)
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_sync_catalogs(tmp_path):
+    """Catalog files are only copied if missing or changed."""
+
+    old_path = mc.CATALOG_PATH
+    mc.set_catalog_path(tmp_path)
+    try:
+        copied = mc.sync_catalogs()
+        assert mc.SOURCE_TRANSFORM in copied
+        assert (mc.CATALOG_PATH_DIR_ORIG / "cbofs.yaml").exists()
+        assert mc.CATALOG_PATH_UPDATED.is_dir() and mc.CATALOG_PATH_TMP.is_dir()
+
+        # already synced in this process
+        (mc.CATALOG_PATH_DIR_ORIG / "cbofs.yaml").write_text("changed")
+        assert mc.sync_catalogs() == []
+
+        assert mc.sync_catalogs(force=True) == [mc.CATALOG_PATH_DIR_ORIG / "cbofs.yaml"]
+        assert mc.sync_catalogs(force=True) == []
+    finally:
+        mc.set_catalog_path(old_path)
+
+
+def test_run_by_host():
+    """Jobs are limited per host, and a failing job doesn't stop the others."""
+
+    lock = threading.Lock()
+    nrunning = Counter()
+    most = Counter()
+
+    def job(host, fail):
+        """Count the jobs running for host, failing if fail."""
+        with lock:
+            nrunning[host] += 1
+            most[host] = max(most[host], nrunning[host])
+        time.sleep(0.01)
+        with lock:
+            nrunning[host] -= 1
+        if fail:
+            raise ValueError(host)
+        return host
+
+    jobs = {i: (host, (host, i == 0)) for i, host in enumerate(["a"] * 6 + ["b"] * 3)}
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = dict(_run_by_host(executor, job, jobs, max_per_host=2))
+
+    assert sorted(results) == list(range(9))
+    assert isinstance(results[0].exception(), ValueError)
+    assert [results[i].result() for i in range(1, 9)] == ["a"] * 5 + ["b"] * 3
+    assert most == {"a": 2, "b": 2}
+
+
+def test_complete_source_catalog_resumes(tmp_path):
+    """Models done by an unfinished run aren't done again."""
+
+    old_path = mc.CATALOG_PATH
+    mc.set_catalog_path(tmp_path)
+    try:
+        source_cat = mc.setup_source_catalog(override=True)
+        mc.CATALOG_PATH_DIR.mkdir()
+        checkpoint = {}
+        for model in source_cat:
+            path = source_cat[model].path
+            shutil.copyfile(path, mc.CATALOG_PATH_DIR / os.path.basename(path))
+            checkpoint[model] = mc._file_hash(path)
+        with open(mc.CATALOG_PATH / "complete_checkpoint.json", "w") as f:
+            json.dump(checkpoint, f)
+
+        # nothing left to do, so nothing is read from a server
+        source_cat = mc.complete_source_catalog()
+        assert source_cat.metadata["source_catalog_dir"] == str(mc.CATALOG_PATH_DIR)
+        assert not (mc.CATALOG_PATH / "complete_checkpoint.json").exists()
+    finally:
+        mc.set_catalog_path(old_path)
+
+
 def test_find_availability():
     """Make sure one test case works for this."""
 
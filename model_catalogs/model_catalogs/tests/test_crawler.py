@@ -0,0 +1,288 @@
+"""
+Test crawling thredds catalogs, with a fake server.
+"""
+
+import gc
+import threading
+import time
+
+from collections import Counter
+from datetime import datetime, timezone
+
+import pandas as pd
+import pytest
+
+import model_catalogs as mc
+
+from model_catalogs.thredds_cache import period_end
+
+
+BASE = "https://server.test/thredds/catalog/MODEL"
+
+CATALOG = """<?xml version="1.0" encoding="UTF-8"?>
+<catalog xmlns="http://www.unidata.ucar.edu/namespaces/thredds/InvCatalog/v1.0"
+         xmlns:xlink="http://www.w3.org/1999/xlink" name="test">
+  <service name="all" serviceType="Compound" base="">
+    <service name="odap" serviceType="OpenDAP" base="/thredds/dodsC/" />
+  </service>
+  {datasets}
+  {refs}
+</catalog>
+"""
+REF = '<catalogRef xlink:href="{name}/catalog.xml" xlink:title="{name}" name="" />'
+DATASET = (
+    '<dataset name="{name}" ID="{name}" urlPath="MODEL/{path}/{name}">'
+    "<metadata><serviceName>all</serviceName></metadata></dataset>"
+)
+
+# the directories under BASE, and their files
+TREE = {
+    "": ["2022", "2021", "latest"],
+    "2022": ["02", "01"],
+    "2021": ["12"],
+    "2022/02": [
+        "nos.tbofs.fields.n001.20220202.t00z.nc",
+        "nos.tbofs.stations.n001.20220202.t00z.nc",
+    ],
+    "2022/01": ["nos.tbofs.fields.n001.20220131.t00z.nc"],
+    "2021/12": ["nos.tbofs.fields.n001.20211231.t00z.nc"],
+    "latest": [],
+}
+
+
+class FakeResponse:
+    """Response of FakeSession, with the attributes siphon reads."""
+
+    def __init__(self, url, content, status_code=200, etag=None):
+        self.url = url
+        self.content = content.encode()
+        self.status_code = status_code
+        self.headers = {"content-type": "application/xml"}
+        if etag is not None:
+            self.headers["ETag"] = etag
+
+    def raise_for_status(self):
+        """Every request succeeds."""
+
+
+class FakeSession:
+    """Serves TREE, counting the requests for each url, and the 304 responses."""
+
+    def __init__(self, tree=None):
+        self.tree = TREE if tree is None else tree
+        self.requests = Counter()
+        self.not_modified = Counter()
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def get(self, url, headers=None):
+        """Catalog of the directory at url, or 304 if its ETag matches."""
+        etag = f'"{len(str(self.tree))}"'
+        with self.lock:
+            self.requests[url] += 1
+            if headers and headers.get("If-None-Match") == etag:
+                self.not_modified[url] += 1
+                return FakeResponse(url, "", status_code=304)
+        path = url.replace(BASE, "", 1).strip("/")
+        path = path[: -len("catalog.xml")].strip("/")
+        children = self.tree[path]
+        refs = [name for name in children if not name.endswith(".nc")]
+        files = [name for name in children if name.endswith(".nc")]
+        content = CATALOG.format(
+            refs="\n".join(REF.format(name=name) for name in refs),
+            datasets="\n".join(DATASET.format(name=name, path=path) for name in files),
+        )
+        return FakeResponse(url, content, etag=etag)
+
+    def close(self):
+        """Remember that the session was closed."""
+        self.closed = True
+
+
+@pytest.fixture
+def session():
+    """Fake server of TREE."""
+    return FakeSession()
+
+
+def test_find_catrefs(session):
+    """Catalog references are found, fetching each catalog once."""
+
+    with mc.CatalogCrawler(max_workers=3, session=session, cache=False) as crawler:
+        catrefs = crawler.find_catrefs(f"{BASE}/catalog.xml")
+        assert catrefs == [("2022", "02"), ("2022", "01"), ("2021", "12")]
+
+        filelocs = [
+            crawler.find_filelocs(catref, f"{BASE}/catalog.xml") for catref in catrefs
+        ]
+
+    assert filelocs[0] == [
+        "https://server.test/thredds/dodsC/MODEL/2022/02/nos.tbofs.fields.n001.20220202.t00z.nc"
+    ]
+    assert len(session.requests) == 6
+    assert set(session.requests.values()) == {1}
+
+
+def test_functions_use_crawler(session):
+    """The functions in utils can share a crawler."""
+
+    with mc.CatalogCrawler(session=session, cache=False) as crawler:
+        catrefs = mc.find_catrefs(f"{BASE}/catalog.xml", crawler=crawler)
+        for catref in catrefs:
+            mc.find_filelocs(catref, f"{BASE}/catalog.xml", crawler=crawler)
+
+    assert set(session.requests.values()) == {1}
+
+
+def test_failed_fetch_is_retried(session):
+    """A catalog that could not be fetched is not remembered."""
+
+    def get(url, headers=None):
+        """Fail once, then serve as usual."""
+        session.get = FakeSession.get.__get__(session)
+        raise ConnectionError(url)
+
+    session.get = get
+    with mc.CatalogCrawler(session=session, cache=False) as crawler:
+        with pytest.raises(ConnectionError):
+            crawler.catalog(f"{BASE}/catalog.xml")
+        assert list(crawler.catalog(f"{BASE}/catalog.xml").catalog_refs) == TREE[""]
+
+
+def test_catalogs_leave_session_open(session):
+    """Deleting a catalog, even one that failed to fetch, doesn't close the session."""
+
+    def get(url, headers=None):
+        """Fail every request."""
+        raise ConnectionError(url)
+
+    session.get = get
+    crawler = mc.CatalogCrawler(session=session, cache=False)
+    with pytest.raises(ConnectionError):
+        crawler.catalog(f"{BASE}/catalog.xml")
+    del session.get
+    crawler.catalog(f"{BASE}/2022/catalog.xml")
+    crawler._nodes.clear()
+    gc.collect()
+    assert not session.closed
+
+    crawler.close()
+    assert not session.closed
+
+
+def test_find_boundaries():
+    """The oldest and newest directories with files are found, then updated incrementally."""
+
+    tree = {
+        "": ["2021", "2022"],
+        "2021": ["10", "11", "12"],
+        "2022": ["01", "02", "03"],
+        "2021/10": [],
+        "2021/11": [],
+        "2021/12": ["nos.tbofs.fields.n001.20211231.t00z.nc"],
+        "2022/01": ["nos.tbofs.fields.n001.20220131.t00z.nc"],
+        "2022/02": ["nos.tbofs.fields.n001.20220228.t00z.nc"],
+        "2022/03": [],
+    }
+    catloc = f"{BASE}/catalog.xml"
+
+    def find(session, previous=None):
+        """Boundaries found by a new crawler, starting from previous."""
+        with mc.CatalogCrawler(session=session, cache=False) as crawler:
+
+            def has_files(catref):
+                """Whether the directory of catref has files."""
+                return len(crawler.find_filelocs(catref, catloc)) > 0
+
+            return crawler.find_boundaries(catloc, has_files, previous)
+
+    session = FakeSession(tree)
+    bounds = find(session)
+    assert bounds == (("2021", "12"), ("2022", "02"))
+
+    # new files, and the oldest removed
+    tree["2022/03"] = ["nos.tbofs.fields.n001.20220301.t00z.nc"]
+    tree["2021/12"] = []
+    session = FakeSession(tree)
+    assert find(session, bounds) == (("2022", "01"), ("2022", "03"))
+    assert f"{BASE}/2021/11/catalog.xml" not in session.requests
+
+    # nothing changed: the older directories aren't crawled
+    session = FakeSession(tree)
+    assert find(session, (("2022", "01"), ("2022", "03"))) == (
+        ("2022", "01"),
+        ("2022", "03"),
+    )
+    assert not any("/2021/" in url for url in session.requests)
+
+
+def test_agg_for_dates(session):
+    """The files for a range of dates, listing each directory once."""
+
+    catloc = f"{BASE}/catalog.xml"
+    with mc.CatalogCrawler(session=session, cache=False) as crawler:
+        dates = pd.date_range("2021-12-31", "2022-02-02")
+        filelocs = mc.agg_for_dates(catloc, dates, "fields", crawler=crawler)
+        assert [fileloc.split("/")[-1] for fileloc in filelocs] == [
+            "nos.tbofs.fields.n001.20211231.t00z.nc",
+            "nos.tbofs.fields.n001.20220131.t00z.nc",
+            "nos.tbofs.fields.n001.20220202.t00z.nc",
+        ]
+        assert set(session.requests.values()) == {1}
+
+        with pytest.raises(ValueError):
+            mc.agg_for_dates(catloc, ["2021-11-30"], "fields", crawler=crawler)
+
+
+def test_find_archive_gaps(session):
+    """Days missing across the directories of an archive."""
+
+    with mc.CatalogCrawler(session=session, cache=False) as crawler:
+        gaps = mc.find_archive_gaps(f"{BASE}/catalog.xml", crawler=crawler)
+
+    assert gaps == [
+        (pd.Timestamp("2022-01-01"), pd.Timestamp("2022-01-30")),
+        (pd.Timestamp("2022-02-01"), pd.Timestamp("2022-02-01")),
+    ]
+    assert set(session.requests.values()) == {1}
+
+
+@pytest.mark.parametrize(
+    "path, end",
+    [
+        ("2021/catalog.xml", datetime(2022, 1, 1, tzinfo=timezone.utc)),
+        ("2022/02/catalog.xml", datetime(2022, 3, 1, tzinfo=timezone.utc)),
+        ("2021/12/31/catalog.xml", datetime(2022, 1, 1, tzinfo=timezone.utc)),
+        ("catalog.xml", None),
+        ("latest/catalog.xml", None),
+        ("2022/13/catalog.xml", None),
+    ],
+)
+def test_period_end(path, end):
+    """The period a catalog is for is found from its url."""
+    assert period_end(f"{BASE}/{path}") == end
+
+
+def test_cache_shared_between_crawlers(session, tmp_path):
+    """A second crawler uses the cached catalogs, revalidating only the newest."""
+
+    cache = mc.CatalogCache(tmp_path, ttl=60)
+    with mc.CatalogCrawler(session=session, cache=cache) as crawler:
+        catrefs = crawler.find_catrefs(f"{BASE}/catalog.xml")
+    assert len(session.requests) == 4
+
+    # still fresh
+    session.requests.clear()
+    with mc.CatalogCrawler(session=session, cache=cache) as crawler:
+        assert crawler.find_catrefs(f"{BASE}/catalog.xml") == catrefs
+    assert len(session.requests) == 0
+
+    # after the ttl, the catalogs of past periods aren't checked again
+    cache.ttl = 0
+    time.sleep(0.01)
+    with mc.CatalogCrawler(session=session, cache=cache) as crawler:
+        assert crawler.find_catrefs(f"{BASE}/catalog.xml") == catrefs
+        filelocs = crawler.find_filelocs(("2022", "02"), f"{BASE}/catalog.xml")
+    assert set(session.requests) == {f"{BASE}/catalog.xml"}
+    assert session.not_modified == session.requests
+    assert len(filelocs) == 1
@@ -0,0 +1,178 @@
+"""
+Test probing OPeNDAP headers, with a fake server.
+"""
+
+from collections import Counter
+
+import pandas as pd
+import pytest
+import xarray as xr
+
+import model_catalogs as mc
+
+from model_catalogs.dap import parse_ascii, parse_das, parse_dds
+from model_catalogs.model_catalogs import _forecast_time_range
+
+
+URL = "https://server.test/thredds/dodsC/MODEL/model.nc"
+
+DDS = """Dataset {{
+    Float64 time[time = {ntimes}];
+    Float32 lat[lat = 2];
+    Grid {{
+     ARRAY:
+        Float32 temp[time = {ntimes}][lat = 2];
+     MAPS:
+        Float64 time[time = {ntimes}];
+        Float32 lat[lat = 2];
+    }} temp;
+}} MODEL/model.nc;
+"""
+
+DAS = """Attributes {
+    time {
+        String long_name "time";
+        String units "hours since 2022-01-01 00:00:00";
+        String calendar "gregorian";
+    }
+    lat {
+        String units "degrees_north";
+    }
+}
+"""
+
+ASCII = """Dataset {{
+    Float64 time[time = {n}];
+}} MODEL/model.nc;
+---------------------------------------------
+time[{n}]
+{values}
+"""
+
+
+class FakeResponse:
+    """Response of FakeSession."""
+
+    def __init__(self, text):
+        self.text = text
+
+    def raise_for_status(self):
+        """Every request succeeds."""
+
+
+class FakeSession:
+    """Serves a dataset with ntimes hourly times, counting the requests."""
+
+    def __init__(self, ntimes=48):
+        self.ntimes = ntimes
+        self.requests = Counter()
+
+    def get(self, url):
+        """DDS, DAS or time values of the dataset."""
+        self.requests[url] += 1
+        if url == f"{URL}.dds":
+            return FakeResponse(DDS.format(ntimes=self.ntimes))
+        if url == f"{URL}.das":
+            return FakeResponse(DAS)
+        assert url.startswith(f"{URL}.ascii?time[")
+        values = [0.0, self.ntimes - 1.0] if self.ntimes > 1 else [0.0]
+        return FakeResponse(
+            ASCII.format(n=len(values), values=", ".join(map(str, values)))
+        )
+
+
+def test_parse():
+    """Dimensions, attributes and values are read from the responses."""
+
+    variables = parse_dds(DDS.format(ntimes=3))
+    assert variables == {
+        "time": [("time", 3)],
+        "lat": [("lat", 2)],
+        "temp": [("time", 3), ("lat", 2)],
+    }
+    assert parse_das(DAS, "time")["units"] == "hours since 2022-01-01 00:00:00"
+    assert parse_das(DAS, "lat") == {"units": "degrees_north"}
+    assert parse_das(DAS, "temp") == {}
+
+    # GrADS Data Server layout
+    values = parse_ascii("time, [2]\n738521.0, 738526.75\n", "time")
+    assert values.tolist() == [738521.0, 738526.75]
+    with pytest.raises(ValueError):
+        parse_ascii("lat, [2]\n1.0, 2.0\n", "time")
+
+
+def test_time_range():
+    """The first and last times are found with small requests, then cached."""
+
+    session = FakeSession()
+    probe = mc.DAPProbe(session=session)
+    start, end = probe.time_range(URL)
+    assert (start, end) == (
+        pd.Timestamp("2022-01-01"),
+        pd.Timestamp("2022-01-02 23:00"),
+    )
+    assert session.requests == {
+        f"{URL}.dds": 1,
+        f"{URL}.das": 1,
+        f"{URL}.ascii?time[0:47:47]": 1,
+    }
+
+    # within the ttl nothing is requested again
+    assert probe.time_range(URL) == (start, end)
+    assert sum(session.requests.values()) == 3
+
+    # afterwards the dataset is probed again, but the units are remembered
+    probe.ttl = 0
+    session.ntimes = 1
+    assert probe.time_range(URL) == (start, start)
+    assert session.requests[f"{URL}.das"] == 1
+    assert session.requests[f"{URL}.ascii?time[0]"] == 1
+
+
+def test_time_range_errors():
+    """Datasets without a time coordinate can't be probed."""
+
+    probe = mc.DAPProbe(session=FakeSession(ntimes=0))
+    with pytest.raises(ValueError):
+        probe.time_range(URL)
+    with pytest.raises(ValueError):
+        probe.time_range(URL, time_name="temp")
+    with pytest.raises(ValueError):
+        probe.time_range(URL, time_name="lat")
+
+
+class FakeSource:
+    """Source of the dataset at URL."""
+
+    urlpath = URL
+
+    def to_dask(self):
+        """Dataset with three hourly times."""
+        times = pd.date_range("2022-01-01", periods=3, freq="h")
+        return xr.Dataset(coords={"time": times})
+
+
+def test_forecast_time_range(monkeypatch):
+    """The time range is probed, or with a warning found by opening the dataset."""
+
+    def probe(urlpath, time_name=None):
+        """Time range found from the headers."""
+        return pd.Timestamp("2022-01-01"), pd.Timestamp("2022-01-02 23:00")
+
+    monkeypatch.setattr(mc, "probe_time_range", probe)
+    assert _forecast_time_range(FakeSource()) == (
+        "2022-01-01T00:00:00.000000000",
+        "2022-01-02T23:00:00.000000000",
+    )
+
+    def fail(urlpath, time_name=None):
+        """Probe of a dataset without a time coordinate."""
+        raise ValueError("No time coordinate found.")
+
+    monkeypatch.setattr(mc, "probe_time_range", fail)
+    with pytest.warns(RuntimeWarning, match="opening the dataset"):
+        start, end = _forecast_time_range(FakeSource())
+    assert (pd.Timestamp(start), pd.Timestamp(end)) == (
+        pd.Timestamp("2022-01-01 00:00"),
+        pd.Timestamp("2022-01-01 02:00"),
+    )
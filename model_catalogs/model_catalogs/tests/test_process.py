@@ -0,0 +1,121 @@
+"""
+Test sharing of transformed datasets, with local files.
+"""
+
+import gc
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from intake.catalog import Catalog
+from intake.catalog.local import LocalCatalogEntry
+from intake_xarray.opendap import OpenDapSource
+
+from model_catalogs import process
+
+
+@pytest.fixture
+def files(tmp_path):
+    """A day of hourly output in each file."""
+    paths = []
+    for day in range(4):
+        times = pd.date_range("2022-02-01", periods=24, freq="1h") + pd.Timedelta(
+            days=day
+        )
+        ds = xr.Dataset(
+            {"zeta": (("time", "node"), np.zeros((24, 3)))},
+            coords={"time": times, "lon": ("node", [0.0, 1, 2])},
+        )
+        path = tmp_path / f"file{day}.nc"
+        ds.to_netcdf(path)
+        paths.append(str(path))
+    return paths
+
+
+ARGS = {
+    "chunks": {"time": 24},
+    "engine": "netcdf4",
+    "combine": "by_coords",
+    "compat": "override",
+    "data_vars": "minimal",
+    "coords": "minimal",
+    "parallel": True,
+}
+
+
+def source(urlpath):
+    """OpenDapSource of the file at urlpath."""
+    return OpenDapSource(urlpath, **ARGS)
+
+
+KWARGS = {"axis": {"T": "time"}, "standard_names": {"sea_surface_height": "zeta"}}
+
+
+def test_dataset_cache(files):
+    """Datasets and their files are shared, and closed when no longer used."""
+
+    cache = process.DatasetCache(max_idle=1)
+
+    key1, ds1 = cache.acquire(source(files[:3]), process.add_attributes, KWARGS)
+    assert ds1.sizes["time"] == 72
+    assert ds1["zeta"].attrs["standard_name"] == "sea_surface_height"
+
+    # same files and transform: the same dataset, but changing one copy
+    # doesn't change the other
+    key, ds = cache.acquire(source(files[:3]), process.add_attributes, KWARGS)
+    assert key == key1 and ds.identical(ds1)
+    ds.attrs["title"] = "changed"
+    ds["zeta"].attrs["units"] = "changed"
+    assert ds1.attrs.get("title") != "changed"
+    assert ds1["zeta"].attrs.get("units") != "changed"
+
+    # overlapping files: only the new one is opened
+    key2, ds2 = cache.acquire(source(files[1:]), process.add_attributes, KWARGS)
+    assert ds2.sizes["time"] == 72
+    assert len(cache._files) == 4
+    nused = {url: entry[1] for (url, _), entry in cache._files.items()}
+    assert nused == {files[0]: 1, files[1]: 2, files[2]: 2, files[3]: 1}
+
+    # kept while unused, up to max_idle
+    cache.release(key1)
+    cache.release(key1)
+    assert len(cache) == 2
+    cache.release(key2)
+    assert len(cache) == 1
+    assert len(cache._files) == 3
+    cache.clear()
+    assert len(cache) == 0 and cache._files == {}
+
+
+def test_transform_releases_dataset(files, monkeypatch):
+    """A DatasetTransform source uses the shared datasets."""
+
+    cache = process.DatasetCache(max_idle=0)
+    monkeypatch.setattr(process, "DATASETS", cache)
+
+    def transform(urlpath):
+        """DatasetTransform source of the file at urlpath."""
+        entry = LocalCatalogEntry(
+            "temp", "", "opendap", args=dict(ARGS, urlpath=urlpath)
+        )
+        transform = process.DatasetTransform(
+            ["temp"],
+            transform="model_catalogs.process.add_attributes",
+            transform_kwargs=KWARGS,
+        )
+        transform.cat = Catalog.from_dict({"temp": entry})
+        return transform
+
+    source1 = transform(files[:2])
+    source2 = transform(files[:2])
+    assert source2.to_dask().identical(source1.to_dask())
+    assert len(cache) == 1
+
+    # the first source is garbage collected
+    del source1
+    gc.collect()
+    assert cache._datasets[next(iter(cache._datasets))][1] == 1
+    source2.close()
+    assert len(cache) == 0
@@ -0,0 +1,201 @@
+"""
+Test the utilities that don't need a connection.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+import shapely.wkt
+import xarray as xr
+
+import model_catalogs as mc
+
+from model_catalogs import boundary
+
+
+BASE = "https://server.test/thredds/dodsC/NOAA/TBOFS/MODELS/2022/02"
+
+
+def fileloc(name):
+    """Location of the file name in the test directory."""
+    return f"{BASE}/{name}"
+
+
+FILELOCS = [
+    fileloc(f"nos.tbofs.{filetype}.{norf}{hour:03}.202202{day:02}.t{cycle:02}z.nc")
+    for filetype in ("fields", "regulargrid")
+    for day in (1, 2)
+    for cycle in (0, 6)
+    for norf, hour in [("n", 1), ("n", 2), ("f", 1), ("f", 48)]
+] + [
+    fileloc("nos.tbofs.stations.n001.20220201.t00z.nc"),
+    fileloc("catalog.xml"),
+]
+
+
+def test_index():
+    """File names are parsed, and other locations left out."""
+
+    index = mc.OFSFileIndex(FILELOCS)
+
+    assert len(index) == 33
+    assert index.model[0] == "tbofs"
+    assert index.filetype[0] == "fields"
+    assert index.norf[2] == "f"
+    assert index.hour[3] == 48
+    assert index.time[3] == pd.Timestamp("2022-02-03T00:00").to_datetime64()
+
+
+def test_agg_for_date():
+    """Nowcast files for a day, or the latest cycle with its forecast."""
+
+    filelocs = mc.agg_for_date("2022-02-02 12:00", FILELOCS, "fields")
+    assert filelocs == [
+        fileloc(f"nos.tbofs.fields.n00{hour}.20220202.t{cycle:02}z.nc")
+        for cycle in (0, 6)
+        for hour in (1, 2)
+    ]
+
+    index = mc.OFSFileIndex(FILELOCS)
+    filelocs = mc.agg_for_date(
+        pd.Timestamp("2022-02-01"), index, "regulargrid", is_forecast=True
+    )
+    assert filelocs == [
+        fileloc(f"nos.tbofs.regulargrid.{suffix}.20220201.t06z.nc")
+        for suffix in ("n001", "n002", "f001", "f048")
+    ]
+
+    assert mc.agg_for_date("2022-02-03", index, "fields") == []
+
+    dates = ["2022-02-02", "2022-02-01", "2022-02-03"]
+    assert index.for_dates(dates, "fields") == [
+        fileloc
+        for date in sorted(dates)
+        for fileloc in mc.agg_for_date(date, index, "fields")
+    ]
+
+
+def test_nyofs_names():
+    """NYOFS files say nowcast/forecast instead of giving the hour."""
+
+    filelocs = [
+        fileloc(f"nos.nyofs.fields.{kind}.20220201.t05z.nc")
+        for kind in ("nowcast", "forecast")
+    ]
+    assert mc.agg_for_date("2022-02-01", filelocs, "fields") == filelocs[:1]
+    assert mc.get_dates_from_ofs(filelocs, "fields", "f", "last") == pd.Timestamp(
+        "2022-02-01T05:00"
+    )
+
+
+def test_get_dates_from_ofs():
+    """First and last times of the model output."""
+
+    index = mc.OFSFileIndex(FILELOCS)
+    assert mc.get_dates_from_ofs(index, "fields", "n", "first") == pd.Timestamp(
+        "2022-02-01T01:00"
+    )
+    assert mc.get_dates_from_ofs(FILELOCS, "fields", "f", "last") == pd.Timestamp(
+        "2022-02-04T06:00"
+    )
+
+    with pytest.raises(ValueError):
+        mc.get_dates_from_ofs(FILELOCS, "2ds", "n", "first")
+
+
+def test_find_runs_and_gaps():
+    """Runs of consecutive days, and the gaps between them."""
+
+    dates = pd.to_datetime(
+        [
+            "2022-01-05",
+            "2022-01-01",
+            "2022-01-02",
+            "2022-01-02",
+            "2022-01-03",
+            "2022-01-08",
+        ]
+    ).to_numpy()
+
+    assert mc.find_runs(dates) == [
+        (pd.Timestamp("2022-01-01"), pd.Timestamp("2022-01-03")),
+        (pd.Timestamp("2022-01-05"), pd.Timestamp("2022-01-05")),
+        (pd.Timestamp("2022-01-08"), pd.Timestamp("2022-01-08")),
+    ]
+    assert mc.find_runs(dates, min_length=2) == mc.find_runs(dates)[:1]
+    assert mc.find_gaps(dates) == [
+        (pd.Timestamp("2022-01-04"), pd.Timestamp("2022-01-04")),
+        (pd.Timestamp("2022-01-06"), pd.Timestamp("2022-01-07")),
+    ]
+    assert mc.find_runs([]) == []
+    assert mc.find_gaps(dates[:1]) == []
+
+
+@pytest.fixture
+def catalog_path(tmp_path):
+    """Use a temporary catalog path, and forget the boundaries found."""
+    path = mc.CATALOG_PATH
+    mc.set_catalog_path(tmp_path)
+    boundary._boundaries.clear()
+    yield tmp_path
+    mc.set_catalog_path(path)
+    boundary._boundaries.clear()
+
+
+def test_find_bbox_masked(catalog_path):
+    """Boundary of the wet part of a curvilinear grid, with an island."""
+
+    eta, xi = np.mgrid[0:40, 0:50]
+    mask = np.ones(eta.shape)
+    mask[:, 40:] = 0
+    mask[15:25, 15:25] = 0
+    ds = xr.Dataset(
+        {"mask_rho": (("eta_rho", "xi_rho"), mask)},
+        coords={
+            "lon_rho": (("eta_rho", "xi_rho"), -90 + 0.1 * xi + 0.01 * eta),
+            "lat_rho": (("eta_rho", "xi_rho"), 27 + 0.1 * eta),
+        },
+    )
+
+    lonkey, latkey, bbox, wkt = mc.find_bbox(ds)
+    assert (lonkey, latkey) == ("lon_rho", "lat_rho")
+    np.testing.assert_allclose(bbox, [-90, 27, -85.66, 30.9])
+    poly = shapely.wkt.loads(wkt)
+    assert len(poly.interiors) == 1
+    assert not poly.contains(shapely.geometry.Point(-87.8, 29))
+
+    # cached, in memory and on disk
+    assert len(list((catalog_path / "boundaries").iterdir())) == 1
+    boundary._boundaries.clear()
+    assert mc.find_bbox(ds)[3] == wkt
+    ds["mask_rho"][:, 30:] = 0
+    assert mc.find_bbox(ds)[3] != wkt
+    assert len(list((catalog_path / "boundaries").iterdir())) == 2
+
+
+def test_find_bbox_mesh(catalog_path):
+    """Boundary of an unstructured mesh, with an island."""
+
+    # square of 10x10 cells split into triangles, without the middle 2x2 cells
+    nodes = np.arange(11 * 11).reshape(11, 11)
+    nv = []
+    for j in range(10):
+        for i in range(10):
+            if 4 <= i < 6 and 4 <= j < 6:
+                continue
+            (a, b), (c, d) = nodes[np.ix_([j, j + 1], [i, i + 1])]
+            nv += [(a, b, d), (a, d, c)]
+    y, x = np.divmod(np.arange(11 * 11), 11)
+    ds = xr.Dataset(
+        {"nv": (("three", "nele"), np.array(nv).T + 1)},
+        coords={
+            "lon": ("node", -70 + 0.1 * x, {"standard_name": "longitude"}),
+            "lat": ("node", 42 + 0.1 * y, {"standard_name": "latitude"}),
+        },
+    )
+
+    lonkey, latkey, bbox, wkt = mc.find_bbox(ds)
+    np.testing.assert_allclose(bbox, [-70, 42, -69, 43])
+    poly = shapely.wkt.loads(wkt)
+    assert len(poly.interiors) == 1
+    assert poly.area == pytest.approx(1 - 0.04)
@@ -0,0 +1,229 @@
+"""
+On-disk cache of thredds catalogs.
+
+Each catalog is saved with the time it was last checked and its ETag and
+Last-Modified headers. A catalog is used without checking the server again
+until its time to live has passed; after that it is revalidated with a
+conditional request, which costs a "304 Not Modified" if it hasn't changed.
+
+The catalogs of past years, months and days -- e.g.
+".../model-tbofs-files/2021/12/catalog.xml" -- don't change once the files
+for the period are all in, so once a period has been over for a while its
+catalog is treated as immutable and never checked again. Only the newest
+directories, and the catalogs above them, are refreshed.
+
+The files are written atomically, so the cache can be shared by processes.
+"""
+
+import calendar
+import hashlib
+import json
+import os
+import threading
+import time
+
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse
+
+import requests
+
+
+# how long a catalog is used before it is checked again, in seconds
+DEFAULT_TTL = 15 * 60
+# how long after the end of a period its catalog is treated as immutable
+DEFAULT_IMMUTABLE_AFTER = timedelta(days=7)
+
+
+def period_end(url):
+    """Return the end of the year, month or day a catalog url is for.
+
+    Parameters
+    ----------
+    url: str
+        Location of thredds catalog, with the period as the last directories of
+        the path, e.g. ".../2022/02/catalog.xml" or ".../2022/02/01/catalog.xml".
+
+    Returns
+    -------
+    datetime in UTC, or None if the url isn't for a period.
+    """
+
+    parts = urlparse(url).path.split("/")
+    if parts and parts[-1].endswith((".xml", ".html")):
+        parts = parts[:-1]
+    parts = [part for part in parts if part]
+
+    # trailing numeric directories: year, optionally month, optionally day
+    for nlabels in (3, 2, 1):
+        labels = parts[-nlabels:]
+        if len(labels) != nlabels or not all(label.isdigit() for label in labels):
+            continue
+        if len(labels[0]) != 4 or any(len(label) != 2 for label in labels[1:]):
+            continue
+        year, month, day = (list(map(int, labels)) + [None, None])[:3]
+        try:
+            if month is None:
+                return datetime(year + 1, 1, 1, tzinfo=timezone.utc)
+            if day is None:
+                ndays = calendar.monthrange(year, month)[1]
+                start = datetime(year, month, 1, tzinfo=timezone.utc)
+                return start + timedelta(days=ndays)
+            return datetime(year, month, day, tzinfo=timezone.utc) + timedelta(days=1)
+        except ValueError:
+            # not a date after all
+            return None
+    return None
+
+
+class CatalogCache:
+    """Cache of thredds catalogs in a directory.
+
+    Parameters
+    ----------
+    directory: str or Path
+        Where the catalogs are saved. Created when first needed.
+    ttl: float, optional
+        Seconds a catalog is used before it is revalidated with the server.
+    immutable_after: timedelta, optional
+        How long after the end of the period (year, month or day) a catalog is
+        for that it is treated as immutable.
+    """
+
+    def __init__(
+        self, directory, ttl=DEFAULT_TTL, immutable_after=DEFAULT_IMMUTABLE_AFTER
+    ):
+        self.directory = directory
+        self.ttl = ttl
+        self.immutable_after = immutable_after
+
+    def node_ttl(self, url):
+        """Return the time to live of the catalog at url.
+
+        Returns
+        -------
+        Seconds, or None if the catalog is immutable.
+        """
+        end = period_end(url)
+        if end is not None and datetime.now(timezone.utc) > end + self.immutable_after:
+            return None
+        return self.ttl
+
+    def _paths(self, url):
+        name = hashlib.sha256(url.encode()).hexdigest()
+        return (
+            os.path.join(self.directory, f"{name}.xml"),
+            os.path.join(self.directory, f"{name}.json"),
+        )
+
+    def _load(self, url):
+        content_path, info_path = self._paths(url)
+        try:
+            with open(info_path) as f:
+                info = json.load(f)
+            with open(content_path, "rb") as f:
+                content = f.read()
+        except (OSError, ValueError):
+            return None, None
+        if info.get("url") != url or info.get("size") != len(content):
+            # mismatched pair left by processes writing at once
+            return None, None
+        return info, content
+
+    def _write(self, path, data):
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _save(self, url, info, content=None):
+        os.makedirs(self.directory, exist_ok=True)
+        content_path, info_path = self._paths(url)
+        if content is not None:
+            self._write(content_path, content)
+        self._write(info_path, json.dumps(info).encode())
+
+    def get(self, session, url):
+        """Return the catalog at url, from the cache if it is still good.
+
+        Parameters
+        ----------
+        session: requests.Session
+            Session to make requests with.
+        url: str
+            Location of thredds catalog.
+
+        Returns
+        -------
+        requests.Response
+        """
+
+        info, content = self._load(url)
+        ttl = self.node_ttl(url)
+        if info is not None and (ttl is None or time.time() - info["checked"] < ttl):
+            return self._response(url, info, content)
+
+        headers = {}
+        if info is not None:
+            if info.get("etag"):
+                headers["If-None-Match"] = info["etag"]
+            if info.get("last_modified"):
+                headers["If-Modified-Since"] = info["last_modified"]
+        resp = session.get(url, headers=headers)
+
+        if resp.status_code == 304 and info is not None:
+            info["checked"] = time.time()
+            self._save(url, info)
+            return self._response(url, info, content)
+
+        resp.raise_for_status()
+        info = {
+            "url": url,
+            "final_url": resp.url,
+            "content_type": resp.headers.get("content-type", "application/xml"),
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+            "checked": time.time(),
+            "size": len(resp.content),
+        }
+        self._save(url, info, resp.content)
+        return resp
+
+    @staticmethod
+    def _response(url, info, content):
+        resp = requests.Response()
+        resp.status_code = 200
+        resp.url = info.get("final_url", url)
+        resp.headers["content-type"] = info["content_type"]
+        resp._content = content
+        return resp
+
+    def clear(self):
+        """Remove all of the saved catalogs."""
+        if not os.path.isdir(self.directory):
+            return
+        for fname in os.listdir(self.directory):
+            if fname.endswith((".xml", ".json", ".tmp")):
+                os.remove(os.path.join(self.directory, fname))
+
+
+class CachingSession:
+    """Session whose `get` goes through a CatalogCache.
+
+    Parameters
+    ----------
+    session: requests.Session
+        Session for the requests that reach the server.
+    cache: CatalogCache
+    """
+
+    def __init__(self, session, cache):
+        self.session = session
+        self.cache = cache
+
+    def get(self, url):
+        """Return the catalog at url -- see `CatalogCache.get`."""
+        return self.cache.get(self.session, url)
+
+    def close(self):
+        """Close the session."""
+        self.session.close()
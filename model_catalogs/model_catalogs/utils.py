@@ -2,15 +2,13 @@
 Utilities to help with catalogs.
 """
 
-import fnmatch
-import re
-
 import cf_xarray  # noqa
 import numpy as np
 import pandas as pd
 import shapely.geometry
 
-from siphon.catalog import TDSCatalog
+from .boundary import grid_boundary
+from .crawler import CatalogCrawler
 
 
 def find_bbox(ds, dd=None, alpha=None):
@@ -26,6 +24,12 @@ def find_bbox(ds, dd=None, alpha=None):
         Number for alphashape to determine what counts as the convex hull.
         Larger number is more detailed, 1 is a good starting point.
 
+    Notes
+    -----
+    Grids with a mask, and FVCOM meshes, have their boundary found from the
+    mask or the mesh (see boundary.py) and cached by grid. dd and alpha are
+    only used if that fails, for an alpha shape of the grid points.
+
     Returns
     -------
     List containing the name of the longitude and latitude variables for ds,
@@ -33,7 +37,7 @@ def find_bbox(ds, dd=None, alpha=None):
     max_lat], low res and high res wkt representation of model boundary.
     """
 
-    hasmask = False
+    maskkey = None
 
     try:
         lon = ds.cf["longitude"].values
@@ -60,14 +64,9 @@ def find_bbox(ds, dd=None, alpha=None):
             maskkey = lonkey.replace("lon", "mask")
         elif "mask" in ds:
             maskkey = "mask"
-        else:
+        if maskkey not in ds:
             maskkey = None
-        if maskkey in ds:
-            lon = ds[lonkey].where(ds[maskkey] == 1).values
-            lon = lon[~np.isnan(lon)].flatten()
-            lat = ds[latkey].where(ds[maskkey] == 1).values
-            lat = lat[~np.isnan(lat)].flatten()
-            hasmask = True
+    hasmask = maskkey is not None
 
     # This is structured, rectilinear
     # GFS
@@ -83,11 +82,28 @@ def find_bbox(ds, dd=None, alpha=None):
 
     elif hasmask or ("nele" in ds.dims):  # unstructured
 
+        # boundary from the mask or the mesh connectivity, cached by grid
+        try:
+            if hasmask:
+                bounds, wkt = grid_boundary(lon, lat, mask=ds[maskkey].values)
+            else:
+                lonn, latn = _node_lonlat(ds, lonkey, latkey)
+                bounds, wkt = grid_boundary(lonn, latn, nv=ds["nv"].values)
+            return lonkey, latkey, bounds, wkt
+        except (KeyError, ValueError):
+            pass
+
         assertion = (
             "dd and alpha need to be defined in the source_catalog for this model."
         )
         assert dd is not None and alpha is not None, assertion
 
+        if hasmask:
+            lon = ds[lonkey].where(ds[maskkey] == 1).values
+            lon = lon[~np.isnan(lon)].flatten()
+            lat = ds[latkey].where(ds[maskkey] == 1).values
+            lat = lat[~np.isnan(lat)].flatten()
+
         # need to calculate concave hull or alphashape of grid
         import alphashape
 
@@ -102,6 +118,183 @@ def find_bbox(ds, dd=None, alpha=None):
     # return lonkey, latkey, list(p0.bounds), p0.wkt, p1.wkt
 
 
+def _node_lonlat(ds, lonkey, latkey):
+    """lon/lat of the nodes of an unstructured mesh, which `nv` refers to."""
+    for lonname, latname in [(lonkey, latkey), ("lon", "lat")]:
+        if lonname in ds and ds[lonname].dims == ("node",):
+            return ds[lonname].values, ds[latname].values
+    raise KeyError("no lon/lat on the nodes of the mesh")
+
+
+# OFS file names, e.g. "nos.tbofs.fields.n001.20220202.t00z.nc" or, for NYOFS,
+# "nos.nyofs.fields.nowcast.20220202.t05z.nc"
+OFS_FILENAME = (
+    r"(?:^|/)(?:[^/]*\.)?(?P<model>[^./]+)\.(?P<filetype>[^./]+)\."
+    r"(?P<norf>[nf])(?P<hour>\d{3}|owcast|orecast)\."
+    r"(?P<date>\d{8})\.t(?P<cycle>\d{2})z\.[^/]*$"
+)
+
+
+class OFSFileIndex:
+    """Index of NOAA OFS-style model output file locations.
+
+    Each file location is parsed once into arrays of its model, filetype,
+    nowcast/forecast, date, cycle and forecast hour, so the files for dates and
+    cycles can be selected with array operations. Locations that are not OFS
+    file names are left out.
+
+    Parameters
+    ----------
+    filelocs: list
+        File locations, e.g. from `find_filelocs`.
+
+    Attributes
+    ----------
+    urls: array of the file locations.
+    model, filetype, norf: arrays of str. norf is "n" for nowcast and "f" for forecast.
+    date: datetime64[D] array.
+    cycle, hour: int arrays, of the hour of the timing cycle and the forecast hour.
+    time: datetime64[h] array, of the time of the model output in the file (in UTC).
+    """
+
+    def __init__(self, filelocs):
+        filelocs = pd.Series(list(filelocs), dtype=object)
+        parsed = filelocs.str.extract(OFS_FILENAME)
+        keep = parsed["date"].notna().to_numpy()
+        parsed = parsed[keep]
+
+        self.urls = filelocs[keep].to_numpy()
+        self.model = parsed["model"].to_numpy(dtype=str)
+        self.filetype = parsed["filetype"].to_numpy(dtype=str)
+        self.norf = parsed["norf"].to_numpy(dtype=str)
+        dates = pd.to_datetime(parsed["date"], format="%Y%m%d")
+        self.date = dates.to_numpy().astype("datetime64[D]")
+        self.cycle = parsed["cycle"].astype(int).to_numpy()
+        # NYOFS files have no forecast hour
+        hours = pd.to_numeric(parsed["hour"], errors="coerce")
+        self.hour = hours.fillna(0).astype(int).to_numpy()
+        self.time = (
+            self.date.astype("datetime64[h]")
+            + self.cycle.astype("timedelta64[h]")
+            + self.hour.astype("timedelta64[h]")
+        )
+
+    def __len__(self):
+        """Number of files in the index."""
+        return len(self.urls)
+
+    def select(self, filetype=None, norf=None, date=None, cycle=None):
+        """Return a mask of the files that match all of the arguments that are given.
+
+        Parameters
+        ----------
+        filetype: str, optional
+            Files with filetype in their filetype, as in `find_filelocs`.
+        norf: str, optional
+            "n" or "f" for "nowcast" or "forecast".
+        date: str of datetime, pd.Timestamp, optional
+            Day of the files. Hours/minutes/seconds are ignored.
+        cycle: int, optional
+            Hour of the timing cycle of the files.
+
+        Returns
+        -------
+        Boolean array.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if filetype is not None:
+            mask &= np.char.find(self.filetype, filetype) >= 0
+        if norf is not None:
+            mask &= self.norf == norf
+        if date is not None:
+            mask &= self.date == np.datetime64(pd.Timestamp(date).date(), "D")
+        if cycle is not None:
+            mask &= self.cycle == cycle
+        return mask
+
+    def for_date(self, date, filetype, is_forecast=False):
+        """Select the files for a date -- see `agg_for_date`."""
+        mask = self.select(filetype=filetype, date=date)
+        if not is_forecast:
+            return list(self.urls[mask & (self.norf == "n")])
+        if not mask.any():
+            return []
+        # nowcast and forecast files of the latest cycle of the day
+        return list(self.urls[mask & (self.cycle == self.cycle[mask].max())])
+
+    def for_dates(self, dates, filetype):
+        """Select the nowcast files for many dates at once, in date order.
+
+        Same as `for_date` for each date in turn, without forecast.
+        """
+        days = pd.DatetimeIndex(dates).normalize().to_numpy().astype("datetime64[D]")
+        mask = self.select(filetype=filetype, norf="n") & np.isin(self.date, days)
+        inds = np.flatnonzero(mask)
+        inds = inds[np.argsort(self.date[inds], kind="stable")]
+        return list(self.urls[inds])
+
+    def time_range(self, filetype, norf):
+        """Return the first and last times of the files of filetype and norf.
+
+        Returns
+        -------
+        Tuple of pd.Timestamps, in UTC.
+        """
+        times = self.time[self.select(filetype=filetype, norf=norf)]
+        if len(times) == 0:
+            raise ValueError(f"No {filetype} files of type {norf!r} found.")
+        return pd.Timestamp(times.min()), pd.Timestamp(times.max())
+
+
+def find_runs(dates, min_length=1):
+    """Find the runs of consecutive days in dates.
+
+    Parameters
+    ----------
+    dates: array-like
+        Dates, in any order and with repeats, e.g. `OFSFileIndex.date`.
+    min_length: int, optional
+        Leave out runs of fewer days than this.
+
+    Returns
+    -------
+    List of (first day, last day) of each run, as pd.Timestamps, in order.
+    """
+
+    dates = np.unique(np.asarray(dates, dtype="datetime64[D]"))
+    if len(dates) == 0:
+        return []
+    # a new run starts wherever the step from the previous date isn't one day
+    starts = np.flatnonzero(np.r_[True, np.diff(dates) != np.timedelta64(1, "D")])
+    ends = np.r_[starts[1:], len(dates)] - 1
+    keep = ends - starts + 1 >= min_length
+    return [
+        (pd.Timestamp(dates[start]), pd.Timestamp(dates[end]))
+        for start, end in zip(starts[keep], ends[keep])
+    ]
+
+
+def find_gaps(dates):
+    """Find the days missing between the first and last of dates.
+
+    Parameters
+    ----------
+    dates: array-like
+        Dates, in any order and with repeats, e.g. `OFSFileIndex.date`.
+
+    Returns
+    -------
+    List of (first missing day, last missing day) of each gap, as
+    pd.Timestamps, in order.
+    """
+
+    runs = find_runs(dates)
+    day = pd.Timedelta("1 day")
+    return [
+        (end + day, start - day) for (_, end), (start, _) in zip(runs[:-1], runs[1:])
+    ]
+
+
 def agg_for_date(date, strings, filetype, is_forecast=False, pattern=None):
     """Aggregate NOAA OFS-style nowcast/forecast files.
 
@@ -109,9 +302,10 @@ def agg_for_date(date, strings, filetype, is_forecast=False, pattern=None):
     ----------
     date: str of datetime, pd.Timestamp
         Date of day to find model output files for. Doesn't pay attention to hours/minutes/seconds.
-    strings: list
+    strings: list or OFSFileIndex
         List of strings to be filtered. Expected to be file locations from a
-        thredds catalog.
+        thredds catalog. If the files are used for more than one date, pass an
+        `OFSFileIndex` of them so they are only parsed once.
     filetype: str
         Which filetype to use. Every NOAA OFS model has "fields" available, but some have "regulargrid"
         or "2ds" also. This availability information is in the source catalog for the model under
@@ -122,65 +316,86 @@ def agg_for_date(date, strings, filetype, is_forecast=False, pattern=None):
         forecast out in time. The forecast files brought in will have the latest timing cycle of the
         day that is available. If False, all nowcast files (for all timing cycles) are brought in.
     pattern: str, optional
-        If a model file pattern doesn't match that assumed in this code, input one that will work.
-        Currently only NYOFS doesn't match but the pattern is built into the catalog file.
+        No longer used: the file names are parsed, which covers the names the
+        patterns in the catalog files (currently only NYOFS's) were for.
 
     Returns
     -------
     List of URLs for where to find all of the model output files that match the keyword arguments.
     """
 
-    if not isinstance(date, pd.Timestamp):
-        date = pd.Timestamp(date)
-
-    # # brings in nowcast and forecast for any date in the catalog
-    # pattern0 = f'*{filetype}*.t??z.*'
-    # # brings in nowcast and forecast for only the day specified
-    # pattern0 = date.strftime(f'*{filetype}*.%Y%m%d.t??z.*')
+    if not isinstance(strings, OFSFileIndex):
+        strings = OFSFileIndex(strings)
+    return strings.for_date(date, filetype, is_forecast=is_forecast)
 
-    if pattern is None:
-        pattern = date.strftime(f"*{filetype}*.n*.%Y%m%d.t??z.*")
-        # pattern = date.strftime(f'*{filetype}*.n???.%Y%m%d.t??z.*')
-    else:
-        pattern = eval(f"f'{pattern}'")
-    # pattern = date.strftime(f'*{filetype}*.n*.%Y%m%d.t??z.*')
 
-    # '*{filetype}.n???.{date.year}{str(date.month).zfill(2)}{str(date.day).zfill(2)}.t??z.*'
+def agg_for_dates(catloc, dates, filetype, is_forecast=False, crawler=None):
+    """Find NOAA OFS-style nowcast/forecast files for many dates at once.
 
-    # pattern = eval(f"f'{pattern}'")
-    # import pdb; pdb.set_trace()
-    fnames = fnmatch.filter(strings, pattern)
+    The dates are grouped by the catalog directory their files are in, each
+    directory is fetched (concurrently) and parsed once, and the files for
+    all of its dates are selected together.
 
-    if is_forecast:
+    Parameters
+    ----------
+    catloc: str
+        Base thredds catalog location.
+    dates: list of str of datetime or pd.Timestamp, or pd.DatetimeIndex
+        Days to find model output files for.
+    filetype: str
+        Which filetype to use, as in `agg_for_date`.
+    is_forecast: bool, optional
+        If True, the last of dates gets the forecast files too, as in
+        `agg_for_date`.
+    crawler: CatalogCrawler, optional
+        Crawler to fetch the catalogs with.
 
-        import re
+    Returns
+    -------
+    List of URLs of the model output files, for one date after another.
+    """
 
-        regex = re.compile(".t[0-9]{2}z.")
-        # substrings
-        subs = [substr[2:4] for substr in regex.findall("".join(strings))]
-        cycle = sorted(list(set(subs)))[-1]  # noqa: F841
+    if crawler is None:
+        with CatalogCrawler() as crawler:
+            return agg_for_dates(catloc, dates, filetype, is_forecast, crawler)
 
-        # cycle = sorted(list(set([fname[ fname.find(start:='.t') + len(start):fname.find('z.')] for fname in fnames])))[-1]  # noqa: E501
-        # import pdb; pdb.set_trace()
-        # pattern1 = f'*{filetype}*.t{cycle}z.*'
+    dates = pd.DatetimeIndex(dates).normalize().unique().sort_values()
+    if len(dates) == 0:
+        return []
 
-        # replace '.t??z.' in pattern with '.t{cycle}z.' and replace '.n*.' with '.*.'
-        pattern1 = pattern.replace(".t??z.", ".t{cycle}z.").replace(".n*.", ".*.")
-        pattern1 = eval(f"f'{pattern1}'")
-        fnames = fnmatch.filter(strings, pattern1)
+    # the directory of each date, e.g. ("2022", "02") or ("2022", "02", "01")
+    depth = crawler.depth(catloc)
+    labels = [dates.strftime("%Y"), dates.strftime("%m"), dates.strftime("%d")]
+    groups = {}
+    for catref, date in zip(zip(*labels[:depth]), dates):
+        groups.setdefault(catref, []).append(date)
 
-    # filelocs = [cat.datasets.get(fname).access_urls["OPENDAP"] for fname in fnames]
+    try:
+        crawler.prefetch(catloc, groups)
+    except KeyError as e:
+        raise ValueError(f"No catalog directory {e} in {catloc}.") from e
 
-    return fnames
+    filelocs = []
+    for catref, group in groups.items():
+        index = OFSFileIndex(crawler.find_filelocs(catref, catloc, filetype=filetype))
+        if is_forecast and group[-1] == dates[-1]:
+            filelocs.extend(index.for_dates(group[:-1], filetype))
+            filelocs.extend(index.for_date(dates[-1], filetype, is_forecast=True))
+        else:
+            filelocs.extend(index.for_dates(group, filetype))
+    return filelocs
 
 
-def find_catrefs(catloc):
+def find_catrefs(catloc, crawler=None):
     """Find hierarchy of catalog references for thredds catalog.
 
     Parameters
     ----------
     catloc: str
         Search in thredds catalog structure from base catalog, catloc.
+    crawler: CatalogCrawler, optional
+        Crawler to fetch the catalogs with. Pass the same crawler to repeated
+        calls so that each catalog is only fetched once.
 
     Returns
     -------
@@ -188,53 +403,13 @@ def find_catrefs(catloc):
     structure to get to where the datafiles start.
     """
 
-    # 0th level catalog
-    cat = TDSCatalog(catloc)
-    catrefs_to_check = list(cat.catalog_refs)
-    # only keep numerical directories
-    catrefs_to_check = [catref for catref in catrefs_to_check if catref.isnumeric()]
+    if crawler is None:
+        with CatalogCrawler() as crawler:
+            return crawler.find_catrefs(catloc)
+    return crawler.find_catrefs(catloc)
 
-    # 1st level catalog
-    catrefs_to_check1 = [
-        cat.catalog_refs[catref].follow().catalog_refs for catref in catrefs_to_check
-    ]
-
-    # Combine the catalog references together
-    catrefs = [
-        (catref0, catref1)
-        for catref0, catrefs1 in zip(catrefs_to_check, catrefs_to_check1)
-        for catref1 in catrefs1
-    ]
 
-    # Check first one to see if there are more catalog references or not
-    cat_ref_test = (
-        cat.catalog_refs[catrefs[0][0]]
-        .follow()
-        .catalog_refs[catrefs[0][1]]
-        .follow()
-        .catalog_refs
-    )
-    # If there are more catalog references, run another level of catalog and combine, ## 2
-    if len(cat_ref_test) > 1:
-        catrefs2 = [
-            cat.catalog_refs[catref[0]]
-            .follow()
-            .catalog_refs[catref[1]]
-            .follow()
-            .catalog_refs
-            for catref in catrefs
-        ]
-        catrefs = [
-            (catref[0], catref[1], catref22)
-            for catref, catref2 in zip(catrefs, catrefs2)
-            for catref22 in catref2
-        ]
-
-    # OUTPUT
-    return catrefs
-
-
-def find_filelocs(catref, catloc, filetype="fields"):
+def find_filelocs(catref, catloc, filetype="fields", crawler=None):
     """Find thredds file locations.
 
     Parameters
@@ -248,6 +423,9 @@ def find_filelocs(catref, catloc, filetype="fields"):
         Which filetype to use. Every NOAA OFS model has "fields" available, but
         some have "regulargrid"or "2ds" also (listed in separate catalogs in the
         model name).
+    crawler: CatalogCrawler, optional
+        Crawler to fetch the catalogs with. Pass the same crawler to repeated
+        calls so that each catalog is only fetched once.
 
     Returns
     -------
@@ -255,32 +433,45 @@ def find_filelocs(catref, catloc, filetype="fields"):
     catref.
     """
 
-    filelocs = []
-    cat = TDSCatalog(catloc)
-    if len(catref) == 2:
-        catref1, catref2 = catref
-        cat1 = cat.catalog_refs[catref1].follow()
-        cat2 = cat1.catalog_refs[catref2].follow()
-        last_cat = cat2
-        datasets = cat2.datasets
-    elif len(catref) == 3:
-        catref1, catref2, catref3 = catref
-        cat1 = cat.catalog_refs[catref1].follow()
-        cat2 = cat1.catalog_refs[catref2].follow()
-        cat3 = cat2.catalog_refs[catref3].follow()
-        last_cat = cat3
-        datasets = cat3.datasets
-
-    for dataset in datasets:
-        if (
-            "stations" not in dataset
-            and "vibrioprob" not in dataset
-            and filetype in dataset
-        ):
-
-            url = last_cat.datasets[dataset].access_urls["OPENDAP"]
-            filelocs.append(url)
-    return filelocs
+    if crawler is None:
+        with CatalogCrawler() as crawler:
+            return crawler.find_filelocs(catref, catloc, filetype=filetype)
+    return crawler.find_filelocs(catref, catloc, filetype=filetype)
+
+
+def find_archive_gaps(catloc, filetype="fields", crawler=None):
+    """Find the days missing from an archive of model output files.
+
+    All of the archive's directories are listed, concurrently.
+
+    Parameters
+    ----------
+    catloc: str
+        Base thredds catalog location.
+    filetype: str
+        Which filetype to use.
+    crawler: CatalogCrawler, optional
+        Crawler to fetch the catalogs with.
+
+    Returns
+    -------
+    List of (first missing day, last missing day) of each gap, as pd.Timestamps,
+    in order.
+    """
+
+    if crawler is None:
+        with CatalogCrawler() as crawler:
+            return find_archive_gaps(catloc, filetype=filetype, crawler=crawler)
+
+    catrefs = crawler.leaf_catrefs(catloc)
+    crawler.prefetch(catloc, catrefs)
+    filelocs = [
+        fileloc
+        for catref in catrefs
+        for fileloc in crawler.find_filelocs(catref, catloc, filetype=filetype)
+    ]
+    index = OFSFileIndex(filelocs)
+    return find_gaps(index.date[index.select(filetype=filetype)])
 
 
 def get_dates_from_ofs(filelocs, filetype, norf, firstorlast):
@@ -288,7 +479,7 @@ def get_dates_from_ofs(filelocs, filetype, norf, firstorlast):
 
     Parameters
     ----------
-    filelocs: list
+    filelocs: list or OFSFileIndex
         Locations of files found from catloc to hierarchical location described by
         catref.
     filetype: str
@@ -298,27 +489,16 @@ def get_dates_from_ofs(filelocs, filetype, norf, firstorlast):
     norf: str
         "n" or "f" for "nowcast" or "forecast", for OFS files.
     firstorlast: str
-        Whether to get the "first" or "last" entry of the filelocs, which will
-        translate to the index to use.
-    """
+        Whether to get the "first" or "last" time of the model output in the files.
 
-    pattern = f"*{filetype}*.{norf}*.????????.t??z.*"
-    # pattern = date.strftime(f"*{filetype}*.n*.%Y%m%d.t??z.*")
-    if firstorlast == "first":
-        ind = 0
-    elif firstorlast == "last":
-        ind = -1
-    fileloc = sorted(fnmatch.filter(filelocs, pattern))[ind]
-    filename = fileloc.split("/")[-1]
-    date = pd.Timestamp(filename.split(".")[4])
-    regex = re.compile(".t[0-9]{2}z.")
-    cycle = [substr[2:4] for substr in regex.findall("".join(filename))][0]
-    regex = re.compile(f".{norf}" + "[0-9]{3}.")
-    try:
-        filetime = [substr[2:5] for substr in regex.findall("".join(filename))][0]
-    except IndexError:  # NYOFS uses this
-        filetime = 0
-    # in UTC
-    datetime = date + pd.Timedelta(f"{cycle} hours") + pd.Timedelta(f"{filetime} hours")
+    Returns
+    -------
+    pd.Timestamp, in UTC.
+    """
 
-    return datetime
+    if firstorlast not in ("first", "last"):
+        raise ValueError(f'firstorlast must be "first" or "last", not {firstorlast!r}')
+    if not isinstance(filelocs, OFSFileIndex):
+        filelocs = OFSFileIndex(filelocs)
+    first, last = filelocs.time_range(filetype, norf)
+    return first if firstorlast == "first" else last